@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+# Custom Python Files
+from dataprep.dataPrep import (columnlist_dict, dataPath, filterAndRename, firstdeal_dates, missingData_imputation,
+                               variable_transformation)
+from dataprep.instrumentation import stage
+from dataprep.scenarios import _linearPredictor, _modelPlan, _transform
+from dataprep.scoring import ChurnModel
+
+# Cleaned columns that depend on the as-of date (see dataPrep.time_features)
+TIME_COLS = ["daysAsCustomer", "callsPerQuarter", "sessionsPerDay"]
+
+def backtest(model, filepath, as_of, spec=None, boxcox=None, data=None):
+    """ Churn probability of every account at many as-of dates, in one pass over the parsed data
+
+        Same values as cleanData(filepath, as_of=d) + the model for each date d, without
+        running the pipeline once per date:
+            1. the export is read and cleaned once (snapshotData)
+            2. daysAsCustomer, callsPerQuarter & sessionsPerDay are computed for all the
+               dates at once, as (accounts, dates) arrays (snapshotFeatures)
+            3. the linear predictor is built from the feature plan of the model by
+               broadcasting, the other columns as (accounts, 1) arrays (as scenarioGrid)
+        Accounts whose first deal is not before an as-of date were not customers yet and
+        get NaN. The activity counts (timescontacted, sessions) and the churn label are
+        the ones of the export: only the time in the denominators moves with the date.
+
+        Example (52 weekly snapshots):
+            df, lr, _, _, X, y = finalmodel.finalmodel()
+            bt = backtest(lr, "PSCCustomerData.csv", pd.date_range(end="2019-06-30", periods=52, freq="W"),
+                          spec=finalmodel.spec)
+            bt.table()
+
+    Arguments:
+        model {LogisticRegression, ChurnModel or numpy array} -- fitted model or its [intercept, coef...]
+        filepath {string} -- raw export
+        as_of {list} -- as-of dates
+
+    Keyword Arguments:
+        spec {FeatureSpec or FeaturePlan} -- features of the model, the plan of a ChurnModel by default (default: {None})
+        boxcox {bool} -- the model was trained on Box-Cox transformed data (default: {ChurnModel setting, else True})
+        data {tuple} -- snapshotData output, to reuse one parse for several models (default: {None})
+
+    Returns:
+        results [BacktestResults]
+    """
+    as_of = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(as_of))).sort_values()
+
+    with stage("backtest", pipeline="backtest", dates=len(as_of)) as total:
+        if data is None:
+            imputation = model.preprocessor.imputation_ if isinstance(model, ChurnModel) else None
+            data = snapshotData(filepath, as_of=as_of[-1], imputation=imputation)
+        df, firstdeal = data
+
+        plan, beta, boxcox = _modelPlan(model, df, spec, boxcox)
+
+        with stage("snapshotFeatures", pipeline="backtest", data=df) as st:
+            features = snapshotFeatures(df, firstdeal, as_of)
+            st.output(features["daysAsCustomer"])
+
+        with stage("predict", pipeline="backtest", data=df) as st:
+            columns = set(plan.sources) | {col for col, _, _ in plan.dummies}
+
+            # Not yet customers give negative or infinite rates, masked below
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                values = {}
+                for col in columns:
+                    v = features[col] if col in features else df[col].values[:, None]
+                    values[col] = _transform(v, col, boxcox, plan)
+
+                proba = expit(_linearPredictor(plan, beta, values, (len(df), len(as_of))))
+            proba[features["daysAsCustomer"] <= 0] = np.NaN
+            st.output(proba)
+
+        total.output(proba)
+
+    return BacktestResults(as_of, proba, df["churn"].values, df["companyID"].values)
+
+def snapshotData(filepath, as_of=None, imputation=None):
+    """ cleanData steps run once, with the first deal date kept for the as-of dependent columns
+
+    Arguments:
+        filepath {string} -- raw export
+
+    Keyword Arguments:
+        as_of {timestamp} -- date of the TIME_COLS of df (default: {today, see asOfDate})
+        imputation {dictionary} -- emp_avg & mrr_median, computed from the export if None (default: {None})
+
+    Returns:
+        df [pandas dataframe] -- cleaned data set, no Box-Cox
+        firstdeal [pandas series] -- first deal date of each account (see firstdeal_dates)
+    """
+    with stage("snapshotData", pipeline="backtest") as st:
+        df = pd.read_csv(dataPath(filepath), usecols=list(columnlist_dict.keys()))
+        df = filterAndRename(df)
+        df = missingData_imputation(df, **(imputation or {}))
+        firstdeal = firstdeal_dates(df)
+        df = variable_transformation(df, boxcox=False, as_of=as_of)
+        st.output(df)
+
+    return df, firstdeal
+
+def snapshotFeatures(df, firstdeal, as_of):
+    """ time_features of every account at every as-of date
+
+    Arguments:
+        df {pandas dataframe} -- cleaned data with the timescontacted & sessions columns
+        firstdeal {pandas series} -- output of firstdeal_dates
+        as_of {list} -- as-of dates
+
+    Returns:
+        features [dictionary] -- TIME_COLS column -> (accounts, dates) array
+    """
+    as_of = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(as_of)))
+
+    # Whole days, rounded down like Timedelta.days
+    delta = as_of.values[None, :] - firstdeal.values.astype("datetime64[ns]")[:, None]
+    days = delta // np.timedelta64(1, "D")
+
+    # Same operations as time_features, so the values match cleanData exactly
+    with np.errstate(divide="ignore", invalid="ignore"):
+        calls = (df["timescontacted"].values[:, None] / days)*(365/4)
+        sessions = df["sessions"].values[:, None] / days
+
+    return {"daysAsCustomer": days, "callsPerQuarter": calls, "sessionsPerDay": sessions}
+
+class BacktestResults:
+    """ Churn probabilities of a backtest
+
+    Arguments:
+        as_of {DatetimeIndex} -- as-of dates
+        proba {numpy array} -- (accounts, dates) churn probability, NaN before the first deal
+        churn {numpy array} -- churn label of each account
+        companyID {numpy array} -- account ids
+    """
+
+    def __init__(self, as_of, proba, churn, companyID):
+        self.as_of = as_of
+        self.proba = proba
+        self.churn = churn
+        self.companyID = companyID
+
+    def snapshot(self, as_of):
+        """ companyID & churn_probability of the customers at one as-of date """
+        k = self.as_of.get_loc(pd.Timestamp(as_of))
+        active = ~np.isnan(self.proba[:, k])
+
+        return pd.DataFrame({"companyID": self.companyID[active], "churn_probability": self.proba[active, k]})
+
+    def long(self):
+        """ Tidy table: one row per (account, as-of date) of a customer """
+        i, k = np.nonzero(~np.isnan(self.proba))
+
+        return pd.DataFrame({"companyID": self.companyID[i], "as_of": self.as_of[k], "churn_probability": self.proba[i, k]})
+
+    def table(self):
+        """ One row per as-of date: customers, churned (label), mean & summed probability and AUC """
+        from sklearn import metrics
+
+        rows = []
+        for k, date in enumerate(self.as_of):
+            active = ~np.isnan(self.proba[:, k])
+            y, p = self.churn[active], self.proba[active, k]
+            rows.append({"as_of": date, "accounts": int(active.sum()), "churned": int(y.sum()),
+                         "churn_rate": y.mean() if len(y) else np.NaN,
+                         "mean_probability": p.mean() if len(p) else np.NaN,
+                         "expected_churn": p.sum(),
+                         "auc": metrics.roc_auc_score(y, p) if len(np.unique(y)) == 2 else np.NaN})
+
+        return pd.DataFrame(rows).set_index("as_of")
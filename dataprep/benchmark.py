@@ -0,0 +1,324 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+# Custom Python Files
+from dataprep.instrumentation import maxRSS
+
+# The other dataprep modules are imported inside the stages: they are what is being measured
+# (instrumentation only uses the standard library).
+
+SIZES = [10000, 100000, 1000000, 10000000]
+STAGES = ["cleanData", "cleanData_chunked", "variable_transformation", "variable_transformation_rowwise",
+          "model_prep", "finalmodel", "plotROCCurve", "crossValidate"]
+
+# Cold start: modules imported in a fresh interpreter (pandas alone is the floor)
+STARTUP_MODULES = ["pandas", "dataprep.score", "dataprep.scoring", "dataprep.modelPrep", "finalmodel"]
+HEAVY_MODULES = ["sklearn", "scipy", "imblearn", "joblib", "pyarrow"]
+
+# Results file & synthetic exports, next to the other generated files (not in the working directory)
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "benchmarks.jsonl")
+WORKDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "benchmark_data")
+
+def runBenchmarks(sizes=SIZES, stages=STAGES, workdir=WORKDIR, out=RESULTS, seed=0,
+                  repeat=1, isolate=True, run_id=None):
+    """ Times and memory-profiles the pipeline stages on synthetic exports
+
+        For every size a synthetic export is written once to workdir (reused by later
+        runs). Each stage is then run repeat times for the wall time (best run kept)
+        and once more under tracemalloc for the peak allocation. With isolate=True
+        every (size, stage) runs in a fresh process so max_rss_mb is that stage's own
+        peak resident memory. One JSON line per (size, stage) is appended to out.
+
+    Keyword Arguments:
+        sizes {list} -- number of rows of each export (default: {10k, 100k, 1M, 10M})
+        stages {list} -- stages to run, see STAGES
+        workdir {string} -- folder for the synthetic exports (default: {dataprep/.cache/benchmark_data})
+        out {string} -- JSON lines results file (default: {dataprep/.cache/benchmarks.jsonl})
+        seed {int} -- synthetic data seed (default: {0})
+        repeat {int} -- timed runs per stage (default: {1})
+        isolate {bool} -- run each stage in its own process (default: {True})
+        run_id {string} -- label of this run, defaults to the start time
+
+    Returns:
+        records [list] -- the result dictionaries written to out
+    """
+    workdir, out = os.path.abspath(workdir), os.path.abspath(out)
+    os.makedirs(workdir, exist_ok=True)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    run_id = run_id or datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    info = _environment()
+
+    records = []
+    for n in sizes:
+        path = syntheticPath(workdir, n, seed)
+        if not os.path.exists(path):
+            _isolated(isolate, _writeData, path, n, seed)
+
+        for stage in stages:
+            result = _isolated(isolate, _runStage, stage, path, repeat)
+            record = dict(info, run_id=run_id, stage=stage, n_rows=n, seed=seed, repeat=repeat, **result)
+            records.append(record)
+
+            with open(out, "a") as fp:
+                fp.write(json.dumps(record) + "\n")
+            print("%-18s %10d rows  %9.3fs  peak %9.1f MB  rss %s MB"
+                  % (stage, n, record["seconds"], record["peak_alloc_mb"], _mb(record["max_rss_mb"], 9)))
+
+    return records
+
+def runStartup(modules=STARTUP_MODULES, repeat=5, out=RESULTS, run_id=None):
+    """ Cold start of the entry points: import time of each module in a fresh interpreter
+
+        Each module is imported repeat times, each time in a new python process started
+        from the repository root (best run kept). The record also lists the heavy
+        libraries the import pulled in and whether it changed the working directory.
+        One JSON line per module is appended to out, with stage "startup:<module>".
+
+    Keyword Arguments:
+        modules {list} -- modules to import (default: {STARTUP_MODULES})
+        repeat {int} -- fresh interpreters per module (default: {5})
+        out {string} -- JSON lines results file (default: {dataprep/.cache/benchmarks.jsonl})
+        run_id {string} -- label of this run, defaults to the start time
+
+    Returns:
+        records [list] -- the result dictionaries written to out
+    """
+    out = os.path.abspath(out)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    run_id = run_id or datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    info = _environment()
+
+    records = []
+    for module in modules:
+        runs = [_importTime(module) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        record = dict(info, run_id=run_id, stage="startup:" + module, n_rows=0, repeat=repeat,
+                      seconds_all=[r["seconds"] for r in runs], peak_alloc_mb=None, **best)
+        records.append(record)
+
+        with open(out, "a") as fp:
+            fp.write(json.dumps(record) + "\n")
+        print("%-28s %9.3fs  rss %s MB  heavy %s%s"
+              % (record["stage"], record["seconds"], _mb(record["max_rss_mb"], 7), ", ".join(record["heavy_modules"]) or "-",
+                 "  (changes cwd)" if record["changes_cwd"] else ""))
+
+    return records
+
+def loadResults(path=RESULTS):
+    """ Reads a results file into a dataframe """
+    import pandas as pd
+
+    with open(path, "r") as fp:
+        return pd.DataFrame([json.loads(line) for line in fp if line.strip()])
+
+def compareRuns(path, base_run, new_run):
+    """ Compares two runs of the same results file
+
+    Arguments:
+        path {string} -- JSON lines results file
+        base_run {string} -- run_id of the reference run
+        new_run {string} -- run_id of the run to compare
+
+    Returns:
+        comparison [pandas dataframe] -- seconds and peak memory of both runs and their ratios (new/base), per stage and size
+    """
+    df = loadResults(path)
+    cols = ["stage", "n_rows", "seconds", "peak_alloc_mb", "max_rss_mb"]
+    base = df[df["run_id"] == base_run][cols]
+    new = df[df["run_id"] == new_run][cols]
+
+    comp = base.merge(new, on=["stage", "n_rows"], suffixes=("_base", "_new"))
+    for col in ["seconds", "peak_alloc_mb", "max_rss_mb"]:
+        # None (memory not measured) compares as NaN
+        comp[col + "_ratio"] = comp[col + "_new"].astype(float)/comp[col + "_base"].astype(float)
+
+    return comp.set_index(["stage", "n_rows"]).sort_index()
+
+def syntheticPath(workdir, n_rows, seed=0):
+    return os.path.join(workdir, "synthetic_%d_seed%d.csv" % (n_rows, seed))
+
+def _writeData(path, n_rows, seed):
+    from dataprep.syntheticData import writeSyntheticExport
+
+    tmp = path + ".tmp"
+    writeSyntheticExport(tmp, n_rows, seed=seed)
+    os.replace(tmp, path)
+
+def _runStage(stage, path, repeat):
+    """ Sets up and measures one stage, setup is not included in the measurement """
+    run = _setupStage(stage, path)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    shape = getattr(result, "shape", None)
+    return {
+        "seconds": min(times),
+        "seconds_all": times,
+        "peak_alloc_mb": peak/1024**2,
+        "max_rss_mb": maxRSS(),
+        "out_rows": int(shape[0]) if shape else None,
+        "out_cols": int(shape[1]) if shape and len(shape) > 1 else None,
+    }
+
+def _setupStage(stage, path):
+    """ Returns the callable measured for a stage, its result's shape is recorded """
+    import numpy as np
+    from sklearn import linear_model
+    import finalmodel as fm
+    from dataprep.dataPrep import cleanData, cleanData_chunked
+    from dataprep.modelPrep import model_prep, plotROCCurve
+    from dataprep.crossValidation import crossValidate
+
+    lr_params = dict(class_weight='balanced', penalty='none', max_iter=10000)
+
+    if stage == "cleanData":
+        return lambda: cleanData(path, boxcox=True)
+
+    if stage == "cleanData_chunked":
+        def run():
+            rows = 0
+            for chunk in cleanData_chunked(path, boxcox=True):
+                rows += len(chunk)
+            return np.empty((rows, 0))
+        return run
+
+    if stage == "finalmodel":
+        return lambda: fm.finalmodel(filepath=path)[4]
+
+    if stage in ("variable_transformation", "variable_transformation_rowwise"):
+        # Old (row-wise reference, dataprep.reference) against the vectorized version,
+        # on the same imputed data and as-of date
+        import pandas as pd
+        from dataprep.dataPrep import asOfDate, columnlist_dict, filterAndRename, missingData_imputation, variable_transformation
+
+        raw = pd.read_csv(path, usecols=list(columnlist_dict.keys()))
+        imputed = missingData_imputation(filterAndRename(raw))
+        as_of = asOfDate()
+        if stage == "variable_transformation":
+            return lambda: variable_transformation(imputed.copy(), True, as_of=as_of)
+
+        from dataprep.reference import rowwise_variable_transformation
+        return lambda: rowwise_variable_transformation(imputed.copy(), True, as_of)
+
+    df = cleanData(path, boxcox=True)
+
+    if stage == "model_prep":
+        return lambda: model_prep(df, fm.spec, fm.ycol, standardize=False)[0]
+
+    X, y, _ = model_prep(df, fm.spec, fm.ycol, standardize=False)
+
+    if stage == "plotROCCurve":
+        def run():
+            plotROCCurve(linear_model.LogisticRegression, X, y, _NullAxis(), 'b', fm.seed, **lr_params)
+            return X
+        return run
+
+    if stage == "crossValidate":
+        models = {"lr": linear_model.LogisticRegression(random_state=fm.seed, **lr_params)}
+        return lambda: crossValidate(models, X, y, n_splits=3, random_state=fm.seed, n_jobs=-1).summary()
+
+    raise ValueError("Unknown stage %s, expected one of %s" % (stage, STAGES))
+
+class _NullAxis:
+    """ Stand-in matplotlib axis, so plotting helpers can be timed without a figure """
+    def plot(self, *args, **kwargs):
+        pass
+
+def _importTime(module):
+    """ Imports module in a new interpreter and returns its import seconds, peak memory & side effects """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ("import json, os, sys, time\n"
+            "cwd = os.getcwd()\n"
+            "start = time.perf_counter()\n"
+            "import %s\n"
+            "seconds = time.perf_counter() - start\n"
+            "heavy = [m for m in %r if m in sys.modules]\n"
+            "from dataprep.instrumentation import maxRSS\n"
+            "print(json.dumps({'seconds': seconds, 'changes_cwd': os.getcwd() != cwd,"
+            " 'heavy_modules': heavy, 'max_rss_mb': maxRSS()}))"
+            % (module, HEAVY_MODULES))
+
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=root, stdout=subprocess.PIPE, check=True)
+    wall = time.perf_counter() - start
+
+    result = json.loads(proc.stdout.decode().strip().splitlines()[-1])
+    result["process_seconds"] = wall
+
+    return result
+
+def _isolated(isolate, func, *args):
+    """ Runs func in a fresh process when isolate, else in this one """
+    if not isolate:
+        return func(*args)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(func, *args).result()
+
+def _mb(value, width):
+    """ Memory column of the progress lines, n/a when not measured """
+    return "%*.1f" % (width, value) if value is not None else "n/a".rjust(width)
+
+def _environment():
+    """ What the results depend on besides the code being measured """
+    import numpy as np
+    import pandas as pd
+    import sklearn
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks on synthetic HubSpot exports")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--workdir", default=WORKDIR)
+    parser.add_argument("--out", default=RESULTS, help="JSON lines results file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--no-isolate", action="store_true", help="run every stage in this process")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE_RUN", "NEW_RUN"), help="compare two runs of --out and exit")
+    parser.add_argument("--startup", nargs="*", metavar="MODULE", help="cold start import times instead of the stages")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compareRuns(args.out, *args.compare).to_string())
+    elif args.startup is not None:
+        runStartup(args.startup or STARTUP_MODULES, max(args.repeat, 5), args.out, run_id=args.run_id)
+    else:
+        runBenchmarks(args.sizes, args.stages, args.workdir, args.out, args.seed, args.repeat,
+                      isolate=not args.no_isolate, run_id=args.run_id)
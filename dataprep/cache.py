@@ -0,0 +1,259 @@
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep import dataPrep
+from dataprep.dataPrep import asOfDate, cleanData, columnlist_dict, dataPath
+
+# Default location and size of the cache
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+MAX_BYTES = 2 * 1024**3
+
+def cachedCleanData(filepath, boxcox=False, compact=False, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, as_of=None):
+    """ cleanData with an on-disk columnar cache of the cleaned dataframe
+
+        The cache key is built from:
+            - sha256 of the raw file contents
+            - boxcox & compact flags
+            - columnnames_dict.json contents
+            - dataPrep.py source (code version)
+            - the as-of date (today's date at midnight by default, see dataPrep.asOfDate), since daysAsCustomer is measured from it
+        Any change to one of these gives a new key, so stale entries are never read.
+        Entries are stored as parquet (pickle if pyarrow is not installed or the columns
+        have no parquet type, e.g. mixed type object columns) and the least
+        recently used ones are evicted once the cache grows past max_bytes.
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        compact {bool} -- use memory-compact dtypes (default: {False})
+        cache_dir {string} -- cache folder (default: {dataprep/.cache})
+        max_bytes {int} -- size limit of the cache folder (default: {2GB})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+    Returns:
+        df [pandas dataframe] -- cleaned data set, same as cleanData(filepath, boxcox, compact, as_of)
+    """
+    filepath = dataPath(filepath)
+
+    # One as-of date for the key & the cleaning, so an entry holds exactly what cleanData would give
+    as_of = asOfDate(as_of)
+    key = cacheKey(filepath, boxcox=boxcox, compact=compact, as_of=as_of)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    df = _load(cache_dir, key)
+    if df is not None:
+        return df
+
+    df = cleanData(filepath, boxcox=boxcox, compact=compact, as_of=as_of)
+    _store(cache_dir, key, df, {"filepath": os.path.abspath(filepath), "boxcox": boxcox, "compact": compact,
+                                "as_of": as_of.isoformat()})
+    evict(cache_dir, max_bytes)
+
+    return df
+
+def cacheKey(filepath, boxcox=False, compact=False, as_of=None):
+    """ Content address of a cleaned data set
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        compact {bool} -- use memory-compact dtypes (default: {False})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+    Returns:
+        key [string] -- hex digest
+    """
+    h = hashlib.sha256()
+    h.update(fileHash(dataPath(filepath)).encode())
+    h.update(json.dumps({"boxcox": bool(boxcox), "compact": bool(compact), "columns": columnlist_dict}, sort_keys=True).encode())
+    h.update(codeVersion().encode())
+    h.update(asOfDate(as_of).isoformat().encode())
+
+    return h.hexdigest()
+
+def fileHash(filepath, blocksize=1024**2):
+    """ sha256 of a file, read in blocks """
+    h = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        for block in iter(lambda: fp.read(blocksize), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+def dataKey(data, y=None):
+    """ sha256 of a data set, shared by the caches keyed on training data (models, resampled folds, tuning, GAM bases)
+
+        - dataframe: the row hashes of pandas plus the column names & dtypes
+        - numpy array or scipy.sparse matrix: the values (data, indices & indptr of the CSR
+          form for a sparse one) and the shape
+
+    Arguments:
+        data {pandas dataframe, numpy array or sparse matrix} -- data set or feature matrix
+
+    Keyword Arguments:
+        y {numpy array} -- response variable, hashed with the data (default: {None})
+
+    Returns:
+        key [string] -- hex digest
+    """
+    h = hashlib.sha256()
+    if isinstance(data, pd.DataFrame):
+        h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        h.update(json.dumps([[str(c), str(t)] for c, t in data.dtypes.items()]).encode())
+    else:
+        if hasattr(data, "tocsr"):
+            data = data.tocsr()
+            for a in (data.data, data.indices, data.indptr):
+                h.update(np.ascontiguousarray(a).tobytes())
+        else:
+            h.update(np.ascontiguousarray(data).tobytes())
+        h.update(str(data.shape).encode())
+    if y is not None:
+        h.update(np.ascontiguousarray(y).tobytes())
+
+    return h.hexdigest()
+
+def codeVersion():
+    """ sha256 of the dataPrep.py source, so any change to the cleaning code invalidates the cache """
+    with open(dataPrep.__file__, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+def listCache(cache_dir=CACHE_DIR):
+    """ Lists the cache entries
+
+    Keyword Arguments:
+        cache_dir {string} -- cache folder (default: {dataprep/.cache})
+
+    Returns:
+        entries [pandas dataframe] -- key, filepath, boxcox, compact, as_of, bytes and last access of each entry
+    """
+    rows = []
+    for meta_path in _entries(cache_dir):
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        data_path = os.path.join(cache_dir, meta["file"])
+        rows.append({"key": meta["key"], "filepath": meta["filepath"], "boxcox": meta["boxcox"],
+                     "compact": meta.get("compact", False), "as_of": meta.get("as_of"), "bytes": _size(data_path), "last_used": datetime.datetime.fromtimestamp(os.path.getmtime(meta_path))})
+
+    return pd.DataFrame(rows, columns=["key", "filepath", "boxcox", "compact", "as_of", "bytes", "last_used"])
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """ Removes the least recently used entries until the cache is under max_bytes
+
+    Keyword Arguments:
+        cache_dir {string} -- cache folder (default: {dataprep/.cache})
+        max_bytes {int} -- size limit of the cache folder (default: {2GB})
+
+    Returns:
+        removed [list] -- keys of the removed entries
+    """
+    entries = []
+    for meta_path in _entries(cache_dir):
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        data_path = os.path.join(cache_dir, meta["file"])
+        entries.append((os.path.getmtime(meta_path), meta["key"], meta_path, data_path))
+
+    total = sum(_size(e[3]) for e in entries)
+    removed = []
+
+    # Oldest access first
+    for _, key, meta_path, data_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        total -= _size(data_path)
+        for path in (data_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(key)
+
+    return removed
+
+def clearCache(cache_dir=CACHE_DIR):
+    """ Removes every cache entry """
+    return evict(cache_dir, max_bytes=-1)
+
+def _load(cache_dir, key):
+    """ Reads a cache entry, returns None on a miss """
+    meta_path = os.path.join(cache_dir, key + ".json")
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, "r") as fp:
+        meta = json.load(fp)
+    data_path = os.path.join(cache_dir, meta["file"])
+    if not os.path.exists(data_path):
+        return None
+
+    if meta["file"].endswith(".parquet"):
+        df = pd.read_parquet(data_path)
+    else:
+        df = pd.read_pickle(data_path)
+
+    # Parquet turns object columns holding numbers into numeric ones, restore them
+    objcols = [c for c, t in meta["dtypes"].items() if t == "object" and df[c].dtype != object]
+    if objcols:
+        df[objcols] = df[objcols].astype(object)
+
+    # Mark as recently used for eviction
+    os.utime(meta_path, None)
+
+    return df
+
+def _store(cache_dir, key, df, info):
+    """ Writes a cache entry (data file first, then the metadata that makes it visible) """
+    try:
+        import pyarrow
+        filename = key + ".parquet"
+    except ImportError:
+        filename = key + ".pkl"
+
+    if filename.endswith(".parquet"):
+        try:
+            _writeData(df, os.path.join(cache_dir, filename))
+        except pyarrow.ArrowException:
+            # Mixed type object columns have no parquet type: pickle this entry instead
+            filename = key + ".pkl"
+            _writeData(df, os.path.join(cache_dir, filename))
+    else:
+        _writeData(df, os.path.join(cache_dir, filename))
+
+    meta = dict(info, key=key, file=filename, dtypes={c: str(t) for c, t in df.dtypes.items()})
+    meta_path = os.path.join(cache_dir, key + ".json")
+    with open(meta_path + ".tmp", "w") as fp:
+        json.dump(meta, fp)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def _writeData(df, data_path):
+    """ Writes df next to data_path (parquet or pickle from its extension), then swaps it in """
+    tmp_path = data_path + ".tmp"
+    try:
+        if data_path.endswith(".parquet"):
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, data_path)
+    finally:
+        # Nothing half written is left behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _entries(cache_dir):
+    """ Metadata files of the cache entries """
+    if not os.path.isdir(cache_dir):
+        return []
+
+    return [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".json")]
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn import metrics
+from sklearn.model_selection import StratifiedKFold
+
+# Custom Python Files
+from dataprep.metrics import bootstrapAUC
+
+def foldIndices(y, n_splits=3, random_state=None, shuffle=True):
+    """ Stratified fold indices, computed once and shared by every model
+
+    Arguments:
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        n_splits {int} -- number of folds (default: {3})
+        random_state {int} -- for reproducibility (default: {None})
+        shuffle {bool} -- shuffle before splitting (default: {True})
+
+    Returns:
+        folds [list] -- (train_index, test_index) for each fold
+    """
+    kf = StratifiedKFold(n_splits=n_splits, shuffle=shuffle, random_state=random_state if shuffle else None)
+
+    # Splits only depend on y, so a zero matrix stands in for X
+    return list(kf.split(np.zeros(len(y)), y))
+
+def crossValidate(models, X, y, n_splits=3, random_state=None, folds=None, n_jobs=1, resample=None, seed=33):
+    """ Fits every (model, fold) pair once, in parallel, and keeps the out-of-fold predictions
+
+        All the metrics and plots of CVResults are derived from this single run. With
+        resample, each training fold is resampled before the fit (imbalance.resampledFold),
+        the test folds are left untouched.
+
+    Arguments:
+        models {dictionary} -- name -> unfitted sklearn style estimator (cloned for each fold)
+        X {numpy array or dictionary} -- feature matrix, or name -> feature matrix when models use different features
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        n_splits {int} -- number of folds, ignored when folds is given (default: {3})
+        random_state {int} -- for reproducibility (default: {None})
+        folds {list} -- precomputed foldIndices (default: {None})
+        n_jobs {int} -- number of parallel jobs, -1 for all cores (default: {1})
+        resample {string} -- "smote" or "undersample" the training folds, None to fit them as is (default: {None})
+        seed {int} -- random state of the sampler (default: {33})
+
+    Returns:
+        results [CVResults]
+    """
+    y = np.asarray(y).ravel()
+    if folds is None:
+        folds = foldIndices(y, n_splits=n_splits, random_state=random_state)
+
+    tasks = [(name, k) for name in models for k in range(len(folds))]
+    preds = Parallel(n_jobs=n_jobs)(
+        delayed(_fitFold)(models[name], X[name] if isinstance(X, dict) else X, y, folds[k][0], folds[k][1],
+                          resample=resample, seed=seed)
+        for name, k in tasks
+    )
+
+    # Assemble the out-of-fold predictions
+    oof = {name: np.empty(len(y)) for name in models}
+    for (name, k), p in zip(tasks, preds):
+        oof[name][folds[k][1]] = p
+
+    return CVResults(y, folds, oof)
+
+def _fitFold(model, X, y, train_index, test_index, resample=None, seed=33):
+    """ Fits one fold and returns the predicted probability of the test rows """
+    if resample is None:
+        xtr, ytr = X[train_index], y[train_index]
+    else:
+        from dataprep.imbalance import resampledFold
+
+        fold = resampledFold(X, y, train_index, resample, seed=seed, cache_dir=None)
+        xtr, ytr = (fold["X"], fold["y"]) if resample == "smote" else (X[fold["index"]], y[fold["index"]])
+
+    clf = clone(model)
+    clf.fit(xtr, ytr)
+
+    return clf.predict_proba(X[test_index])[:,1]
+
+class CVResults:
+    """ Out-of-fold predictions of a crossValidate run, with the metrics derived from them
+
+    Arguments:
+        y {numpy array} -- response variable
+        folds {list} -- (train_index, test_index) for each fold
+        oof {dictionary} -- name -> out-of-fold predicted probability
+    """
+
+    def __init__(self, y, folds, oof):
+        self.y = y
+        self.folds = folds
+        self.oof = oof
+
+    @property
+    def names(self):
+        return list(self.oof.keys())
+
+    def predict(self, name, threshold=0.5):
+        """ Out-of-fold class predictions (same as clf.predict for a 0.5 threshold) """
+        return (self.oof[name] > threshold).astype(int)
+
+    def foldAUC(self, name):
+        """ AUC of each fold """
+        return np.array([metrics.roc_auc_score(self.y[test], self.oof[name][test]) for _, test in self.folds])
+
+    def meanROC(self, name, mean_fpr=None):
+        """ Fold ROC curves interpolated on mean_fpr and averaged (as plotROCCurve)
+
+        Returns:
+            mean_fpr, mean_tpr, mean_auc
+        """
+        if mean_fpr is None:
+            mean_fpr = np.linspace(0, 1, 100)
+
+        tprs = []
+        for _, test in self.folds:
+            fpr, tpr, _ = metrics.roc_curve(self.y[test], self.oof[name][test])
+            interp_tpr = np.interp(mean_fpr, fpr, tpr)
+            interp_tpr[0] = 0.0
+            tprs.append(interp_tpr)
+
+        mean_tpr = np.mean(tprs, axis=0)
+        mean_auc = metrics.auc(mean_fpr, mean_tpr)
+
+        return mean_fpr, mean_tpr, mean_auc
+
+    def accuracy(self, name, threshold=0.5):
+        return metrics.accuracy_score(self.y, self.predict(name, threshold))
+
+    def confusionMatrix(self, name, threshold=0.5):
+        return metrics.confusion_matrix(self.y, self.predict(name, threshold))
+
+    def classificationReport(self, name, threshold=0.5, **kwargs):
+        return metrics.classification_report(self.y, self.predict(name, threshold), **kwargs)
+
+    def bootstrap(self, names=None, **kwargs):
+        """ Bootstrap AUC intervals & ROC bands of the out-of-fold predictions, paired across models (see metrics.bootstrapAUC) """
+        names = self.names if names is None else names
+
+        return bootstrapAUC(self.y, {name: self.oof[name] for name in names}, **kwargs)
+
+    def summary(self, threshold=0.5):
+        """ One row of metrics per model
+
+        Returns:
+            summary [pandas dataframe] -- mean ROC AUC, fold AUC mean/std, accuracy, precision, recall, f1
+        """
+        rows = []
+        for name in self.oof:
+            pred = self.predict(name, threshold)
+            fold_auc = self.foldAUC(name)
+            rows.append({
+                "model": name,
+                "mean_roc_auc": self.meanROC(name)[2],
+                "fold_auc_mean": fold_auc.mean(),
+                "fold_auc_std": fold_auc.std(),
+                "accuracy": metrics.accuracy_score(self.y, pred),
+                "precision": metrics.precision_score(self.y, pred, zero_division=0),
+                "recall": metrics.recall_score(self.y, pred, zero_division=0),
+                "f1": metrics.f1_score(self.y, pred, zero_division=0),
+            })
+
+        return pd.DataFrame(rows).set_index("model")
+
+    def plotROC(self, name, axis, color, label=None, suffix=""):
+        """ Plots the mean ROC curve of a model on axis, labelled "<label> ROC (AUC = ...)<suffix>" """
+        mean_fpr, mean_tpr, mean_auc = self.meanROC(name)
+        label = label if label is not None else name
+        axis.plot(mean_fpr, mean_tpr, color=color,
+        label=r'%s ROC (AUC = %0.2f)%s' % (label, mean_auc, suffix),lw=2, alpha=.8)
@@ -1,19 +1,59 @@
 import numpy as np
 import pandas as pd
-import sklearn
 import json
 import os
 
-# Use the directory where this file is located
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
-os.chdir(dname)
+# Custom Python Files
+from dataprep.instrumentation import stage
+
+# Directory where this file is located: the column dictionary and the default data files
+# (e.g. "PSCCustomerData.csv") live here. Paths are resolved against it, the working
+# directory of the process is left alone.
+dname = os.path.dirname(os.path.abspath(__file__))
 
 # Opening columnname dictionary
-with open('columnnames_dict.json', 'r') as fp:
+with open(os.path.join(dname, 'columnnames_dict.json'), 'r') as fp:
     columnlist_dict = json.load(fp)
 
-def cleanData(filepath, boxcox=False):
+# Text columns (renamed), kept as object even when a chunk or record is all missing
+textcols = ['usecompetitors', 'callcycle', 'contracttype', 'origsource', 'firstdealDT', 'createDT',
+            'FF', 'renewalDT', 'associatedpredictionlead', 'industry', 'strategic']
+
+def dataPath(filepath):
+    """ Resolves a relative data path against the directory of this file
+
+        Relative paths that exist next to dataPrep.py (where the exports used to be
+        opened from) point there, anything else is returned as given: absolute paths,
+        files relative to the working directory, buffers.
+
+    Arguments:
+        filepath {string} -- file path of a data file
+
+    Returns:
+        filepath [string] -- path to open
+    """
+    if not isinstance(filepath, (str, os.PathLike)) or os.path.isabs(filepath):
+        return filepath
+
+    local = os.path.join(dname, filepath)
+
+    return local if os.path.exists(local) else filepath
+
+def asOfDate(as_of=None):
+    """ Snapshot date of the time features (daysAsCustomer, callsPerQuarter, sessionsPerDay)
+
+        Every entry point resolves its as_of argument here, so runs without one agree on
+        the same day whichever path they take (cleanData, the cache, scoring, ...).
+
+    Keyword Arguments:
+        as_of {timestamp} -- given snapshot date (default: {today's date, midnight})
+
+    Returns:
+        as_of [pandas timestamp]
+    """
+    return pd.Timestamp.today().normalize() if as_of is None else pd.Timestamp(as_of)
+
+def cleanData(filepath, boxcox=False, compact=False, as_of=None):
     """ Summary Actions: 
         1. filterAndRename method: 
             uses columnnames_dict.json dictionary to filter down and re-map column names
@@ -24,24 +64,159 @@ def cleanData(filepath, boxcox=False):
     
     Arguments:
         filepath {string} -- file path of the dataframe 
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        compact {bool} -- use memory-compact dtypes, see compact_dtypes (default: {False})
+        as_of {timestamp} -- snapshot date of daysAsCustomer, callsPerQuarter & sessionsPerDay (default: {today, see asOfDate})
     
     Returns:
         df [pandas dataframe] -- returns a cleaned data set
         
     """
-    # Load in raw dataset
-    df = pd.read_csv(filepath)
+    with stage("cleanData", pipeline="cleanData", boxcox=boxcox) as total:
+        # Load in raw dataset (only the columns we keep, text columns as object like _read_chunks)
+        with stage("read_csv", pipeline="cleanData") as st:
+            dtypes = {k: object for k, v in columnlist_dict.items() if v in textcols}
+            df = pd.read_csv(dataPath(filepath), usecols=list(columnlist_dict.keys()), dtype=dtypes)
+            st.output(df)
+
+        # 1. Grab columns to use and rename as necessary
+        with stage("filterAndRename", pipeline="cleanData", data=df) as st:
+            df = filterAndRename(df)
+            st.output(df)
+
+        # 2. Deal with missing values using the missingData_imputation method
+        with stage("missingData_imputation", pipeline="cleanData", data=df) as st:
+            df = missingData_imputation(df)
+            st.output(df)
+
+        # 3. Transform variables using the variable_transformation method
+        with stage("variable_transformation", pipeline="cleanData", data=df) as st:
+            df = variable_transformation(df, boxcox=boxcox, as_of=as_of)
+            st.output(df)
+
+        # 4. Shrink the dtypes if requested
+        if compact:
+            with stage("compact_dtypes", pipeline="cleanData", data=df) as st:
+                df = compact_dtypes(df)
+                st.output(df)
+
+        total.output(df)
 
-    # 1. Grab columns to use and rename as necessary
-    df = filterAndRename(df)
+    return df
 
-    # 2. Deal with missing values using the missingData_imputation method
-    df = missingData_imputation(df)
+def cleanData_chunked(filepath, boxcox=False, chunksize=100000, as_of=None):
+    """ Streaming version of cleanData for exports that do not fit in memory
 
-    # 3. Transform variables using the variable_transformation method
-    df = variable_transformation(df, boxcox=boxcox)
+        1. imputation_stats method:
+            first pass over the file to get the global imputation values
+        2. filterAndRename, missingData_imputation & variable_transformation:
+            second pass, cleaning one chunk at a time with the global values
 
-    return df
+    Arguments:
+        filepath {string} -- file path of the dataframe
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        chunksize {int} -- number of rows read per chunk (default: {100000})
+        as_of {timestamp} -- snapshot date of the time features, the same for every chunk (default: {today, see asOfDate})
+
+    Yields:
+        df [pandas dataframe] -- cleaned chunk, same values as the matching rows of cleanData
+    """
+    as_of = asOfDate(as_of)
+
+    # 1. Global imputation values (bounded memory)
+    with stage("imputation_stats", pipeline="cleanData_chunked"):
+        stats = imputation_stats(filepath, chunksize=chunksize)
+
+    # 2. Clean each chunk with the global values
+    for i, df in enumerate(_read_chunks(filepath, chunksize)):
+        with stage("clean_chunk", pipeline="cleanData_chunked", data=df, chunk=i) as st:
+            df = filterAndRename(df)
+            df = missingData_imputation(df, emp_avg=stats["emp_avg"], mrr_median=stats["mrr_median"])
+            df = variable_transformation(df, boxcox=boxcox, as_of=as_of)
+            st.output(df)
+
+        yield df
+
+def cleanData_toFile(filepath, outpath, boxcox=False, chunksize=100000, as_of=None):
+    """ Streams the cleaned data set to a csv file, one chunk at a time
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+        outpath {string} -- file path of the cleaned csv to write
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        chunksize {int} -- number of rows read per chunk (default: {100000})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+    Returns:
+        nrows [int] -- number of rows written
+    """
+    nrows = 0
+    for i, df in enumerate(cleanData_chunked(filepath, boxcox=boxcox, chunksize=chunksize, as_of=as_of)):
+        df.to_csv(outpath, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        nrows += len(df)
+
+    return nrows
+
+def imputation_stats(filepath, chunksize=100000, columnlist_dict=columnlist_dict):
+    """ Computes the global values used by missingData_imputation in one pass over the file
+
+        Only the employee and MRR columns are read. The mean is kept as a running
+        sum/count and the median from the counts of each distinct MRR value, so memory
+        is bounded by the number of distinct values instead of the number of rows.
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+
+    Keyword Arguments:
+        chunksize {int} -- number of rows read per chunk (default: {100000})
+        columnlist_dict {dictionary} -- raw to renamed column names
+
+    Returns:
+        stats [dictionary] -- emp_avg and mrr_median, rounded like missingData_imputation
+    """
+    rawnames = {v: k for k, v in columnlist_dict.items()}
+    emp_col, mrr_col = rawnames["employees"], rawnames["MRR"]
+
+    emp_sum, emp_count = 0.0, 0
+    mrr_counts = pd.Series(dtype=np.float64)
+
+    for chunk in pd.read_csv(dataPath(filepath), usecols=[emp_col, mrr_col], chunksize=chunksize):
+        emp = chunk[emp_col].dropna()
+        emp_sum += emp.sum()
+        emp_count += len(emp)
+
+        mrr_counts = mrr_counts.add(chunk[mrr_col].value_counts(), fill_value=0)
+
+    # Median from the sorted value counts
+    mrr_counts = mrr_counts.sort_index()
+    cum_counts = mrr_counts.cumsum().values
+    n = int(cum_counts[-1]) if len(cum_counts) else 0
+    if n == 0:
+        mrr_median = np.NaN
+    else:
+        lower = mrr_counts.index[np.searchsorted(cum_counts, (n - 1) // 2 + 1)]
+        upper = mrr_counts.index[np.searchsorted(cum_counts, n // 2 + 1)]
+        mrr_median = (lower + upper) / 2
+
+    emp_avg = emp_sum / emp_count if emp_count else np.NaN
+
+    return {"emp_avg": round(emp_avg, 0), "mrr_median": round(mrr_median, 0)}
+
+def _read_chunks(filepath, chunksize, columnlist_dict=columnlist_dict):
+    """ Reads the mapped columns of the raw file in chunks
+
+        Text columns are forced to object so a chunk that happens to be all missing
+        is cleaned the same way as the full file.
+    """
+    dtypes = {k: object for k, v in columnlist_dict.items() if v in textcols}
+
+    return pd.read_csv(dataPath(filepath), usecols=list(columnlist_dict.keys()), dtype=dtypes, chunksize=chunksize)
 
 def filterAndRename(df, columnlist_dict=columnlist_dict):
     """ Filter and rename dataframe
@@ -49,7 +224,7 @@ def filterAndRename(df, columnlist_dict=columnlist_dict):
         df {pandas dataframe} 
     
     Keyword Arguments:
-        columnlist_dict {dictionary} -- loaded in via json file. Needs to be in same working directory as this file
+        columnlist_dict {dictionary} -- loaded in via json file, from the directory of this file
     
     Returns:
         df -- returns a filtered and renamed dataframe
@@ -63,12 +238,16 @@ def filterAndRename(df, columnlist_dict=columnlist_dict):
 
     return df
 
-def missingData_imputation(df):
+def missingData_imputation(df, emp_avg=None, mrr_median=None):
     """ Manually create formulas to decide missing data imputation
 
     Arguments:
         df {pandas dataframe} -- cleaned dataframe
 
+    Keyword Arguments:
+        emp_avg {float} -- employee imputation value, computed from df if None (default: {None})
+        mrr_median {float} -- MRR imputation value, computed from df if None (default: {None})
+
     Returns:
         df
     """
@@ -97,10 +276,12 @@ def missingData_imputation(df):
     df[nonelist] = df[nonelist].replace(np.NaN, "Unknown")
 
     # Take average values for missing employees & revenue
-    emp_avg = round(df.query("employees.notnull()", engine="python")["employees"].mean(),0)
-    df["employees"] = df["employees"].replace(np.NaN, emp_avg)
+    if emp_avg is None or mrr_median is None:
+        values = imputation_values(df)
+        emp_avg = values["emp_avg"] if emp_avg is None else emp_avg
+        mrr_median = values["mrr_median"] if mrr_median is None else mrr_median
 
-    mrr_median = round(df.query("MRR.notnull()", engine="python")["MRR"].median(),0)
+    df["employees"] = df["employees"].replace(np.NaN, emp_avg)
     df["MRR"] = df["MRR"].replace(np.NaN, mrr_median).replace(0,100)
 
     # Make associated deals equal to zero
@@ -108,60 +289,184 @@ def missingData_imputation(df):
 
     return df
 
-def variable_transformation(df, boxcox):
+def imputation_values(df):
+    """ Computes the data dependent imputation values used by missingData_imputation
+
+    Arguments:
+        df {pandas dataframe} -- filtered and renamed dataframe
+
+    Returns:
+        values [dictionary] -- emp_avg (mean employees) and mrr_median (median MRR)
+    """
+    emp_avg = round(df.query("employees.notnull()", engine="python")["employees"].mean(),0)
+    mrr_median = round(df.query("MRR.notnull()", engine="python")["MRR"].median(),0)
+
+    return {"emp_avg": emp_avg, "mrr_median": mrr_median}
+
+# Box-Cox power of each transformed column (0 is the log), zeros are moved to 0.01 before the power
+boxcoxDict = {
+    "MRR": 0,
+    "callsPerQuarter": 1/4,
+    "assoccontacts": 1/4,
+    "associateddeals": 1/2,
+    "admins": -1/2,
+}
+
+# Call cycle to calls per year
+callcycleDict = {'Monthly':12, 'Quarterly':4, 'Yearly':1,'Half Year':2, 'Every Other Month':6, 'None':0}
+
+def boxcox_transform(x, power):
+    """ Box-Cox transformation used by variable_transformation
+
+    Arguments:
+        x {series, numpy array or float} -- values to transform
+        power {float} -- power of the transformation, 0 for the log
+
+    Returns:
+        transformed values (numpy array for array inputs)
+    """
+    if power == 0:
+        return np.log(x)
+
+    return np.where(x == 0, 0.01, x)**power
+
+def variable_transformation(df, boxcox, as_of=None):
     """Manually create formulas to transform variables
     
     Arguments:
         df {pandas dataframe}
+
+    Keyword Arguments:
+        as_of {timestamp} -- as-of date daysAsCustomer is counted to (default: {today, see asOfDate})
     
     Returns:
         df
     """
 
     # Create a "callcycle_numeric" columns that breaks out the call cycle from categorical to numeric
-    cc = {'Monthly':'12', 'Quarterly':'4', 'Yearly':'1','Half Year':'2', 'Every Other Month':'6', 'None':'0'}
-    df["callcycle_numeric"] = df['callcycle'].replace(cc,inplace=False)
-    df["callcycle_numeric"]= pd.to_numeric(df["callcycle_numeric"])
+    codes = pd.Categorical(df["callcycle"], categories=list(callcycleDict.keys())).codes
+    if (codes < 0).any():
+        unknown = df.loc[codes < 0, "callcycle"].unique()
+        raise ValueError("Unknown call cycle values: %s" % list(unknown))
+    df["callcycle_numeric"] = np.array(list(callcycleDict.values()), dtype=np.int64)[codes]
 
     # Create a competingProducts column that counts the number of competitors (instead of a binary)
-    df["competingProducts"] = df["usecompetitors"].copy()
-    df.loc[df.competingProducts.isnull(),"competingProducts"] = 0
-    df.loc[df.competingProducts != 0,'competingProducts'] = df.loc[df.competingProducts != 0,('competingProducts')].str.split(pat=";").str.len()
+    # (object dtype like usecompetitors, so model_prep encodes both the same way)
+    # (counted once per distinct competitor list, then looked up by code)
+    codes, uniques = pd.factorize(df["usecompetitors"])
+    hascomp = codes >= 0
+    ncomp = np.append(pd.Series(uniques, dtype=object).str.count(";").values + 1, 0).astype(np.int64)
+    df["competingProducts"] = pd.Series(ncomp[codes], index=df.index, dtype=object)
 
-    # Create churn column from contracttype, then drop
-    df["churn"] = df["contracttype"].apply(lambda x: 1 if x=="CANCELLED" else 0)
-    df.drop(['contracttype'], axis=1, inplace=True)
+    # Create churn column from contracttype
+    df["churn"] = (df["contracttype"].values == "CANCELLED").astype(np.int64)
 
     # Change usecompetitors from text to binary
-    df.loc[df.usecompetitors.isnull(),"usecompetitors"] = 0
-    df.loc[df.usecompetitors != 0,"usecompetitors"] = 1
+    df["usecompetitors"] = pd.Series(hascomp.astype(np.int64), index=df.index, dtype=object)
 
     # Change columns that have Yes/No, to binary
     nolist = ['FF','associatedpredictionlead','strategic']
-    df[nolist] = df[nolist].replace("No", 0).replace("Yes", 1)
+    for col in nolist:
+        codes, uniques = pd.factorize(df[col])
+        if codes.min(initial=0) >= 0 and set(uniques) <= {"Yes", "No"}:
+            df[col] = (np.asarray(uniques, dtype=object) == "Yes").astype(np.int64)[codes]
+        else:
+            df[col] = df[col].replace({"No": 0, "Yes": 1})
 
     # Change columns that have TRUE/FALSE to binary
-    df[["publiclytraded"]] = df[["publiclytraded"]].replace(False, 0).replace(True, 1)
+    if df["publiclytraded"].isin([True, False]).all():
+        df["publiclytraded"] = df["publiclytraded"].values.astype(bool).astype(np.int64)
+    else:
+        df["publiclytraded"] = df["publiclytraded"].replace({False: 0, True: 1})
+
+    # Fill in firstdealDT (used by daysAsCustomer)
+    firstdeal = firstdeal_dates(df)
+
+    # Drop contracttype & the actual date columns ones calculations are done
+    df.drop(["contracttype","createDT","firstdealDT"], axis=1, inplace=True)
+
+    # Create daysAsCustomer, callsPerQuarter & sessionsPerDay columns
+    df = time_features(df, firstdeal, as_of)
 
-    # Fill in firstdealDT & Create daysAsCustomer column
-    df["firstdealDT"] = pd.to_datetime(df["firstdealDT"].replace(np.NaN, df["createDT"]))
-    df["daysAsCustomer"] = ((pd.datetime.today() - df["firstdealDT"]).dt.days).astype(int)
+    # BoxCox Transformations
+    if boxcox:
+        for col, power in boxcoxDict.items():
+            df[col] = boxcox_transform(df[col].values, power)
+
+    return df
 
-    # Drop the actual date columns ones calculations are done
-    df.drop(["createDT","firstdealDT"], axis=1, inplace=True)
+def firstdeal_dates(df):
+    """ First deal date of each account, the create date when it is missing
+
+    Arguments:
+        df {pandas dataframe} -- dataframe with the firstdealDT & createDT columns
+
+    Returns:
+        firstdeal [pandas series] -- datetime64
+    """
+    return pd.to_datetime(df["firstdealDT"].fillna(df["createDT"]))
+
+def time_features(df, firstdeal, as_of=None):
+    """ Creates the columns that depend on the current date
+
+        daysAsCustomer, callsPerQuarter (customer touch points/quarter) and
+        sessionsPerDay. They are the only cleaned values that change from one day to
+        the next without the account changing.
+
+    Arguments:
+        df {pandas dataframe} -- dataframe with the timescontacted & sessions columns
+        firstdeal {pandas series} -- output of firstdeal_dates
+
+    Keyword Arguments:
+        as_of {timestamp} -- date the days are counted to (default: {today, see asOfDate})
+
+    Returns:
+        df
+    """
+    as_of = asOfDate(as_of)
+
+    # Create daysAsCustomer column
+    df["daysAsCustomer"] = ((as_of - firstdeal).dt.days).values.astype(int)
 
     # Create a column that shows customer touch points/quarter
-    df["callsPerQuarter"] = ((df["timescontacted"] / df["daysAsCustomer"])*(365/4))
+    days = df["daysAsCustomer"].values
+    df["callsPerQuarter"] = (df["timescontacted"].values / days)*(365/4)
 
     # Create a column that shows sessions/day
-    df["sessionsPerDay"] = ((df["sessions"] / df["daysAsCustomer"]))
+    df["sessionsPerDay"] = df["sessions"].values / days
 
-    # BoxCox Transformations
-    if boxcox:
-        df["MRR"] = np.log(df["MRR"])
-        df["callsPerQuarter"] = df["callsPerQuarter"].replace(0,0.01)**(1/4)
-        df["assoccontacts"] = df["assoccontacts"].replace(0,0.01)**(1/4)
-        df["associateddeals"] = df["associateddeals"].replace(0,0.01)**(1/2)
-        df["admins"] = df["admins"].replace(0,0.01)**(-1/2)
+    return df
+
+def compact_dtypes(df):
+    """ Converts a cleaned dataframe to memory-compact dtypes
 
-    return df
\ No newline at end of file
+        - text columns (industry, origsource, callcycle, renewalDT ...) -> category
+        - Yes/No, TRUE/FALSE flags, churn and other integer columns -> smallest integer (int8 for flags)
+        - float columns -> float32
+        Text columns holding numbers (usecompetitors, competingProducts) become integers,
+        so with xcols="ALL" model_prep treats them as numbers instead of one-hot encoding them.
+
+    Arguments:
+        df {pandas dataframe} -- output of cleanData
+
+    Returns:
+        df [pandas dataframe] -- same values with compact dtypes
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object:
+            try:
+                s = pd.to_numeric(s)
+            except (ValueError, TypeError):
+                out[col] = s.astype("category")
+                continue
+
+        if s.dtype.kind in "iu":
+            out[col] = pd.to_numeric(s, downcast="integer")
+        elif s.dtype.kind == "f":
+            out[col] = s.astype(np.float32)
+        else:
+            out[col] = s
+
+    return pd.DataFrame(out, index=df.index)
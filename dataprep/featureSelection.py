@@ -0,0 +1,430 @@
+import hashlib
+import itertools
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn import metrics
+
+# Custom Python Files
+from dataprep.crossValidation import foldIndices
+from dataprep.logistic import balancedWeights, fitLogistic, predictLogistic
+
+# Scores computed on the out-of-fold rows (mean over folds, like mlxtend's cv) or in-sample
+CV_SCORING = ["f1", "accuracy", "roc_auc", "neg_log_loss"]
+IC_SCORING = ["aic", "bic"]
+
+def exhaustiveSearch(X, y, min_features=1, max_features=10, scoring="f1", n_splits=5, random_state=None, folds=None,
+                     standardize=True, class_weight="balanced", prune=True, prune_tol=None, n_jobs=1, batch_size=64,
+                     checkpoint=None, xcolnames=None):
+    """ Exhaustive feature subset search for the unpenalized logistic model (replaces mlxtend's ExhaustiveFeatureSelector)
+
+        Subsets are enumerated level by level (1 feature, 2 features ...), each one being
+        a parent subset plus a feature with a higher index. The fold splits, the
+        standardized matrix and the fold train/test matrices are computed once, then
+        each level is fitted in batches across a process pool (joblib). Every fit is a
+        Newton solve warm started from the parent's coefficients (0 for the new feature),
+        which converges in a few steps.
+
+        Pruning (prune=True): a subset's children are not generated when their score
+        can not beat the current best:
+            - aic / bic: exact bound. Every descendant is nested in the subset plus all
+              the later features, whose deviance bounds theirs from below.
+            - CV scores: no exact bound exists, children are dropped when the parent's
+              score is more than prune_tol below the best (heuristic, off when None).
+
+        With a checkpoint path the search is logged to an append-only file, one record
+        per batch round (the subsets it evaluated) and per level (the queued children),
+        so each save costs the size of the round rather than of the search so far. A
+        search with the same data and settings replays the log and resumes from it.
+
+    Arguments:
+        X {numpy array} -- feature matrix
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        min_features {int} -- smallest subset size considered for the best subset (default: {1})
+        max_features {int} -- largest subset size (default: {10})
+        scoring {string} -- f1, accuracy, roc_auc, neg_log_loss (CV) or aic, bic (in-sample) (default: {"f1"})
+        n_splits {int} -- number of folds, ignored when folds is given (default: {5})
+        random_state {int} -- for reproducibility (default: {None})
+        folds {list} -- precomputed foldIndices (default: {None})
+        standardize {bool} -- standardize X once before the search (default: {True})
+        class_weight {string} -- "balanced" or None, as in LogisticRegression (default: {"balanced"})
+        prune {bool} -- skip the branches that can not beat the best (default: {True})
+        prune_tol {float} -- heuristic CV pruning margin, see above (default: {None})
+        n_jobs {int} -- number of parallel jobs, -1 for all cores (default: {1})
+        batch_size {int} -- subsets per job (default: {64})
+        checkpoint {string} -- file the search state is saved to / resumed from (default: {None})
+        xcolnames {list} -- feature names for the results (default: {None})
+
+    Returns:
+        results [SelectionResults]
+    """
+    ctx = _SearchData(X, y, scoring, n_splits, random_state, folds, standardize, class_weight)
+    p = ctx.X.shape[1]
+    max_features = min(max_features, p)
+    sign = 1 if scoring in CV_SCORING else -1
+
+    key = _searchKey(ctx, "exhaustive", min_features, max_features, prune, prune_tol)
+    state = _loadCheckpoint(checkpoint, key)
+    if state is None:
+        # Level 1: every single feature, warm started from the intercept only model
+        state = {"level": 1, "queue": [((j,), None) for j in range(p)], "pos": 0, "evaluated": [], "rows": [],
+                 "best": -np.inf}
+        _startCheckpoint(checkpoint, key, state)
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        while state["pos"] < len(state["queue"]) or state["evaluated"]:
+            # Evaluate the queued subsets of this level, one round of batches at a time
+            while state["pos"] < len(state["queue"]):
+                n_round = batch_size*max(1, _nJobs(n_jobs))*4
+                todo = state["queue"][state["pos"]:state["pos"] + n_round]
+                batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+                bound = prune and scoring in IC_SCORING and state["level"] < max_features
+                out = list(itertools.chain.from_iterable(parallel(delayed(_evalBatch)(ctx, batch, bound)
+                                                                  for batch in batches)))
+
+                rows = [_row(res) for res in out]
+                for res in out:
+                    if len(res["subset"]) >= min_features:
+                        state["best"] = max(state["best"], res["score"])
+
+                # Only this round is written to the checkpoint
+                round_ = {"rows": rows, "evaluated": out, "best": state["best"], "taken": len(todo)}
+                _replay(state, round_)
+                _appendCheckpoint(checkpoint, round_)
+
+            # Children of the evaluated subsets that can still beat the best
+            queue = []
+            if state["level"] < max_features:
+                for res in state["evaluated"]:
+                    last = res["subset"][-1]
+                    if last == p - 1 or (prune and _pruned(res, state["best"], scoring, prune_tol)):
+                        continue
+                    for j in range(last + 1, p):
+                        queue.append((res["subset"] + (j,), (res["subset"], res["coefs"])))
+            level = {"level": state["level"] + 1, "queue": queue}
+            _replay(state, level)
+            _appendCheckpoint(checkpoint, level)
+
+    return SelectionResults(state["rows"], scoring, min_features, xcolnames, sign)
+
+def stepwiseSearch(X, y, direction="forward", max_features=None, scoring="f1", n_splits=5, random_state=None, folds=None,
+                   standardize=True, class_weight="balanced", tol=0.0, n_jobs=1, xcolnames=None):
+    """ Greedy forward / backward stepwise selection (a cheaper alternative to RFE + exhaustive search)
+
+        Each step fits every one-feature change of the current subset in parallel, warm
+        started from the current coefficients, and keeps the best one while it improves
+        the score by more than tol.
+
+    Arguments:
+        X {numpy array} -- feature matrix
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        direction {string} -- "forward" (add features) or "backward" (remove features) (default: {"forward"})
+        max_features {int} -- forward: stop at this size (default: {all})
+        tol {float} -- minimum improvement to take a step (default: {0.0})
+        other arguments -- same as exhaustiveSearch
+
+    Returns:
+        results [SelectionResults] -- every evaluated subset, path gives the subsets taken
+    """
+    if direction not in ("forward", "backward"):
+        raise ValueError("direction must be forward or backward, got %s" % direction)
+
+    ctx = _SearchData(X, y, scoring, n_splits, random_state, folds, standardize, class_weight)
+    p = ctx.X.shape[1]
+    max_features = p if max_features is None else min(max_features, p)
+    sign = 1 if scoring in CV_SCORING else -1
+
+    rows, path = [], []
+    with Parallel(n_jobs=n_jobs) as parallel:
+        if direction == "forward":
+            current, best = (), -np.inf
+            coefs = None
+        else:
+            res = _evalBatch(ctx, [(tuple(range(p)), None)], False)[0]
+            rows.append(_row(res))
+            current, best, coefs = res["subset"], res["score"], res["coefs"]
+            path.append(current)
+
+        while True:
+            if direction == "forward":
+                if len(current) >= max_features:
+                    break
+                cands = [tuple(sorted(current + (j,))) for j in range(p) if j not in current]
+            else:
+                if len(current) <= 1:
+                    break
+                cands = [tuple(f for f in current if f != j) for j in current]
+
+            init = None if coefs is None else (current, coefs)
+            tasks = [(c, init) for c in cands]
+            batches = [tasks[i::max(1, _nJobs(n_jobs))] for i in range(max(1, _nJobs(n_jobs)))]
+            out = list(itertools.chain.from_iterable(parallel(delayed(_evalBatch)(ctx, b, False) for b in batches if b)))
+            rows.extend(_row(res) for res in out)
+
+            step = max(out, key=lambda r: r["score"])
+            if step["score"] <= best + tol:
+                break
+            current, best, coefs = step["subset"], step["score"], step["coefs"]
+            path.append(current)
+
+    results = SelectionResults(rows, scoring, 1, xcolnames, sign)
+    results.path = path
+
+    return results
+
+class SelectionResults:
+    """ Scores of every evaluated subset
+
+    Arguments:
+        rows {list} -- one dictionary per subset
+        scoring {string} -- scoring used
+        min_features {int} -- smallest subset size considered for the best subset
+        xcolnames {list} -- feature names (default: {None})
+        sign {int} -- 1 when the score is reported as is, -1 for aic/bic (stored negated so higher is better)
+    """
+
+    def __init__(self, rows, scoring, min_features, xcolnames=None, sign=1):
+        self.scoring = scoring
+        self.min_features = min_features
+        self.xcolnames = None if xcolnames is None else list(xcolnames)
+        self.sign = sign
+        self.path = None
+
+        df = pd.DataFrame(rows)
+        df["score"] = sign*df["score"]
+        if self.xcolnames is not None:
+            df["features"] = [[self.xcolnames[j] for j in s] for s in df["subset"]]
+        self.scores = df.drop_duplicates("subset", keep="last").reset_index(drop=True)
+
+    def table(self, n_features=None):
+        """ Evaluated subsets sorted from best to worst (optionally of one size) """
+        df = self.scores if n_features is None else self.scores[self.scores["n_features"] == n_features]
+
+        return df.sort_values("score", ascending=(self.sign < 0)).reset_index(drop=True)
+
+    def bestPerSize(self):
+        """ Best subset of each size """
+        return self.table().groupby("n_features", as_index=False).first()
+
+    @property
+    def best_idx(self):
+        return tuple(self._best()["subset"])
+
+    @property
+    def best_score(self):
+        return self._best()["score"]
+
+    @property
+    def best_names(self):
+        return None if self.xcolnames is None else [self.xcolnames[j] for j in self.best_idx]
+
+    def _best(self):
+        df = self.table()
+        return df[df["n_features"] >= self.min_features].iloc[0]
+
+class _SearchData:
+    """ What every fit of a search shares: standardized matrix, folds, fold matrices and weights """
+
+    def __init__(self, X, y, scoring, n_splits, random_state, folds, standardize, class_weight):
+        if scoring not in CV_SCORING + IC_SCORING:
+            raise ValueError("Unknown scoring %s, expected one of %s" % (scoring, CV_SCORING + IC_SCORING))
+
+        X = np.asarray(X, dtype=np.float64)
+        if standardize:
+            std = X.std(axis=0)
+            X = (X - X.mean(axis=0))/np.where(std > 0, std, 1)
+
+        self.X = X
+        self.y = np.asarray(y).ravel().astype(np.float64)
+        self.scoring = scoring
+        self.class_weight = class_weight
+        self.weights = self._weights(self.y)
+
+        # Fold matrices cut once (the in-sample criteria only use the full data)
+        self.folds, self.fold_index = [], []
+        if scoring in CV_SCORING:
+            if folds is None:
+                folds = foldIndices(self.y, n_splits=n_splits, random_state=random_state)
+            self.fold_index = [np.asarray(test) for _, test in folds]
+            for train, test in folds:
+                self.folds.append((self.X[train], self.y[train], self._weights(self.y[train]), self.X[test], self.y[test]))
+
+    def _weights(self, y):
+        return balancedWeights(y) if self.class_weight == "balanced" else None
+
+def _evalBatch(ctx, batch, bound):
+    """ Fits and scores a batch of (subset, (parent subset, parent coefs) or None) """
+    out = []
+    for subset, init in batch:
+        subset = tuple(subset)
+        parent, parent_coefs = init if init is not None else ((), None)
+        res = {"subset": subset, "coefs": [], "n_iter": 0, "converged": True}
+
+        if ctx.scoring in CV_SCORING:
+            scores = []
+            for k, (Xtr, ytr, wtr, Xte, yte) in enumerate(ctx.folds):
+                start = _initCoef(parent, None if parent_coefs is None else parent_coefs[k], subset)
+                beta, n_iter, conv = fitLogistic(Xtr[:, subset], ytr, wtr, coef_init=start)
+                res["coefs"].append(beta)
+                res["n_iter"] += n_iter
+                res["converged"] &= conv
+                scores.append(_cvScore(ctx.scoring, yte, predictLogistic(Xte[:, subset], beta)))
+            res["score"] = float(np.mean(scores))
+            res["score_std"] = float(np.std(scores))
+        else:
+            start = _initCoef(parent, None if parent_coefs is None else parent_coefs[0], subset)
+            beta, n_iter, conv = fitLogistic(ctx.X[:, subset], ctx.y, ctx.weights, coef_init=start)
+            res["coefs"].append(beta)
+            res["n_iter"], res["converged"] = n_iter, conv
+            dev = _deviance(ctx, subset, beta)
+            res["score"] = -_criterion(ctx, dev, len(subset))
+
+            # Children have at least one more feature and, being nested in the subset plus every
+            # later feature, no lower deviance than that model: best possible child score
+            if bound and subset[-1] < ctx.X.shape[1] - 1:
+                full = subset + tuple(range(subset[-1] + 1, ctx.X.shape[1]))
+                beta_full, _, _ = fitLogistic(ctx.X[:, full], ctx.y, ctx.weights, coef_init=_initCoef(subset, beta, full))
+                res["score_bound"] = -_criterion(ctx, _deviance(ctx, full, beta_full), len(subset) + 1)
+
+        out.append(res)
+
+    return out
+
+def _initCoef(parent, parent_coef, subset):
+    """ Warm start of subset from its parent's coefficients, 0 for the features the parent does not have """
+    beta = np.zeros(len(subset) + 1)
+    if parent_coef is None:
+        return beta
+
+    beta[0] = parent_coef[0]
+    pos = {f: i for i, f in enumerate(subset)}
+    for i, f in enumerate(parent):
+        if f in pos:
+            beta[pos[f] + 1] = parent_coef[i + 1]
+
+    return beta
+
+def _pruned(res, best, scoring, prune_tol):
+    """ True when no child of res can beat best """
+    if scoring in IC_SCORING:
+        return "score_bound" in res and res["score_bound"] <= best
+
+    return prune_tol is not None and res["score"] < best - prune_tol
+
+def _criterion(ctx, dev, k):
+    """ aic / bic of a model with k features and an intercept """
+    n_params = k + 1
+    if ctx.scoring == "aic":
+        return dev + 2*n_params
+
+    return dev + np.log(len(ctx.y))*n_params
+
+def _deviance(ctx, subset, beta):
+    """ -2 * (weighted) log-likelihood """
+    mu = np.clip(predictLogistic(ctx.X[:, subset], beta), 1e-15, 1 - 1e-15)
+    ll = ctx.y*np.log(mu) + (1 - ctx.y)*np.log(1 - mu)
+    w = ctx.weights if ctx.weights is not None else 1.0
+
+    return float(-2*np.sum(w*ll))
+
+def _cvScore(scoring, y, prob):
+    if scoring == "roc_auc":
+        return metrics.roc_auc_score(y, prob)
+    if scoring == "neg_log_loss":
+        prob = np.clip(prob, 1e-15, 1 - 1e-15)
+        return float(np.mean(y*np.log(prob) + (1 - y)*np.log(1 - prob)))
+
+    # Same threshold as LogisticRegression.predict
+    pred = prob > 0.5
+    if scoring == "accuracy":
+        return float(np.mean(pred == (y == 1)))
+
+    tp = np.sum(pred & (y == 1))
+    fp = np.sum(pred & (y == 0))
+    fn = np.sum(~pred & (y == 1))
+
+    return float(2*tp/(2*tp + fp + fn)) if tp else 0.0
+
+def _row(res):
+    row = {"subset": res["subset"], "n_features": len(res["subset"]), "score": res["score"],
+           "n_iter": res["n_iter"], "converged": res["converged"]}
+    if "score_std" in res:
+        row["score_std"] = res["score_std"]
+
+    return row
+
+def _nJobs(n_jobs):
+    return os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+
+def _searchKey(ctx, kind, *settings):
+    """ Identifies a search, a checkpoint is only resumed by the same search """
+    h = hashlib.sha256()
+    h.update(ctx.X.tobytes())
+    h.update(ctx.y.tobytes())
+    for test in ctx.fold_index:
+        h.update(test.tobytes())
+    h.update(repr((kind, ctx.scoring, ctx.class_weight, len(ctx.folds)) + settings).encode())
+
+    return h.hexdigest()
+
+def _loadCheckpoint(path, key):
+    """ Search state replayed from a checkpoint log, None when there is none for this search """
+    if path is None or not os.path.exists(path):
+        return None
+
+    state, end = None, 0
+    with open(path, "rb") as fp:
+        try:
+            # Header: the key & the state the log starts from, then one record per round / level
+            saved = pickle.load(fp)
+            if saved["key"] != key:
+                return None
+            state, end = saved["state"], fp.tell()
+            state.setdefault("pos", 0)
+            while True:
+                _replay(state, pickle.load(fp))
+                end = fp.tell()
+        except (EOFError, pickle.UnpicklingError, AttributeError, ValueError, KeyError):
+            pass
+
+    if state is None:
+        return None
+
+    # Drop a record cut short by an interrupted write, the next ones are appended after the last complete one
+    with open(path, "r+b") as fp:
+        fp.truncate(end)
+
+    return state
+
+def _startCheckpoint(path, key, state):
+    """ Starts a new checkpoint log with the initial search state """
+    if path is None:
+        return
+
+    with open(path + ".tmp", "wb") as fp:
+        pickle.dump({"key": key, "state": state}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def _appendCheckpoint(path, record):
+    """ Appends one round / level record to the checkpoint log """
+    if path is None:
+        return
+
+    with open(path, "ab") as fp:
+        pickle.dump(record, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _replay(state, record):
+    """ Applies a round (evaluated subsets) or level (next queue) record to the search state """
+    if "queue" in record:
+        state.update(level=record["level"], queue=record["queue"], pos=0, evaluated=[])
+    else:
+        state["rows"].extend(record["rows"])
+        state["evaluated"].extend(record["evaluated"])
+        state["best"] = record["best"]
+        state["pos"] += record["taken"]
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.instrumentation import stage
+
+# Dummy column dropped from the one-hot encoding (reference level), as in model_prep
+DROPPED = ["callcycle_Yearly"]
+
+class FeatureSpec:
+    """ Declarative feature specification: columns, higher level terms and interaction terms
+
+        The spec never changes the dataframe or lists it is built from. compile() turns it
+        into a FeaturePlan that fills the whole feature matrix in one pass, so the same
+        spec (e.g. the one in finalmodel.py) can be shared by training, CV and scoring.
+
+        Columns are ordered like model_prep: numeric xcols, higher level terms, interaction
+        terms, then the one-hot encoded categorical xcols (callcycle_Yearly dropped).
+
+        Example:
+            spec = FeatureSpec(['callsPerQuarter','callcycle_numeric'], termDict={'callcycle_numeric': 2},
+                               interactionList=[['assoccontacts', 'MRR']])
+            plan = spec.compile(df)
+            X = plan.transform(df)
+
+    Arguments:
+        xcols {list} -- columns to use as independent var
+
+    Keyword Arguments:
+        termDict {dictionary} -- column -> highest power, e.g. {"callcycle_numeric": 2} adds callcycle_numeric_2 (default: {None})
+        interactionList {list} -- pairs of columns multiplied together (default: {None})
+    """
+
+    def __init__(self, xcols, termDict=None, interactionList=None):
+        if isinstance(xcols, str):
+            raise ValueError("FeatureSpec needs a list of columns, xcols=%r is only supported by model_prep" % xcols)
+
+        self.xcols = tuple(xcols)
+        self.termDict = tuple((col, int(power)) for col, power in dict(termDict or {}).items())
+        self.interactionList = tuple(tuple(pair) for pair in (interactionList or []))
+
+        for pair in self.interactionList:
+            if len(pair) != 2:
+                raise ValueError("Interaction terms are pairs of columns, got %r" % (pair,))
+
+    def terms(self):
+        """ (name, column, power) of each higher level term """
+        return [(col + "_" + str(p), col, p) for col, power in self.termDict for p in range(2, power + 1)]
+
+    def interactions(self):
+        """ (name, left column, right column) of each interaction term """
+        return [(a + ' ' + b, a, b) for a, b in self.interactionList]
+
+    def columns(self):
+        """ Data set columns the spec reads """
+        cols = list(self.xcols) + [c for _, c, _ in self.terms()] + [c for pair in self.interactionList for c in pair]
+
+        return list(dict.fromkeys(cols))
+
+    def compile(self, df=None):
+        """ Compiles the spec into a FeaturePlan
+
+        Keyword Arguments:
+            df {pandas dataframe} -- training data, needed when xcols has categorical columns to freeze their levels (default: {None})
+
+        Returns:
+            plan [FeaturePlan]
+        """
+        categories = {}
+        for col in self.xcols:
+            if df is None or not _isCategorical(df[col]):
+                continue
+            s = df[col]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                categories[col] = list(s.cat.categories)
+            else:
+                categories[col] = sorted(s.dropna().unique())
+
+        return FeaturePlan(self, categories)
+
+    def __repr__(self):
+        return "FeatureSpec(xcols=%r, termDict=%r, interactionList=%r)" % (
+            list(self.xcols), dict(self.termDict), [list(p) for p in self.interactionList])
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSpec) and (self.xcols, self.termDict, self.interactionList) == (
+            other.xcols, other.termDict, other.interactionList)
+
+    def __hash__(self):
+        return hash((self.xcols, self.termDict, self.interactionList))
+
+class FeaturePlan:
+    """ Compiled FeatureSpec: the column layout and the index arrays used to fill the matrix
+
+        transform() reads the source columns once into a matrix, then writes the plain
+        columns, every power (one np.power call with a vector of exponents) and every
+        interaction (one np.multiply call) straight into slices of a preallocated array.
+        Categorical levels are frozen at compile time: unseen levels give all-zero dummies.
+
+    Arguments:
+        spec {FeatureSpec}
+        categories {dictionary} -- categorical xcol -> levels
+    """
+
+    def __init__(self, spec, categories):
+        self.spec = spec
+        self.categories = categories
+
+        numeric = [c for c in spec.xcols if c not in categories]
+        terms = spec.terms()
+        interactions = spec.interactions()
+
+        for _, col, _ in terms:
+            if col in categories:
+                raise ValueError("Higher level term of categorical column %s" % col)
+        for _, a, b in interactions:
+            if a in categories or b in categories:
+                raise ValueError("Interaction term of categorical column %s %s" % (a, b))
+
+        # Source matrix columns
+        self.sources = list(dict.fromkeys(numeric + [c for _, c, _ in terms] + [c for _, a, b in interactions for c in (a, b)]))
+        src = {c: i for i, c in enumerate(self.sources)}
+
+        # Output layout, same order as model_prep
+        self.numeric_index = np.array([src[c] for c in numeric], dtype=np.intp)
+        self.term_index = np.array([src[c] for _, c, _ in terms], dtype=np.intp)
+        self.term_power = np.array([p for _, _, p in terms], dtype=np.float64)
+        self.left_index = np.array([src[a] for _, a, _ in interactions], dtype=np.intp)
+        self.right_index = np.array([src[b] for _, _, b in interactions], dtype=np.intp)
+
+        names = numeric + [n for n, _, _ in terms] + [n for n, _, _ in interactions]
+        self.dummies = []
+        for col, levels in categories.items():
+            index = np.full(len(levels), -1, dtype=np.intp)
+            for k, level in enumerate(levels):
+                name = "%s_%s" % (col, level)
+                if name in DROPPED:
+                    continue
+                index[k] = len(names)
+                names.append(name)
+            self.dummies.append((col, list(levels), index))
+
+        self.names = pd.Index(names)
+
+    @property
+    def n_features(self):
+        return len(self.names)
+
+    def transform(self, df, dtype=np.float64):
+        """ Feature matrix of a cleaned dataframe, df is not modified
+
+        Arguments:
+            df {pandas dataframe} -- output of cleanData
+
+        Keyword Arguments:
+            dtype {numpy dtype} -- matrix dtype (default: {np.float64})
+
+        Returns:
+            X [numpy array] -- n rows x n_features, columns in the order of names
+        """
+        with stage("feature_plan", pipeline="model_prep", data=df) as st:
+            n = len(df)
+            X = np.empty((n, self.n_features), dtype=dtype)
+            B = df[self.sources].to_numpy(dtype=dtype) if self.sources else np.empty((n, 0), dtype=dtype)
+
+            # Plain columns, powers and products written into their slices of X
+            a = len(self.numeric_index)
+            b = a + len(self.term_index)
+            c = b + len(self.left_index)
+            X[:, :a] = B[:, self.numeric_index]
+            if b > a:
+                np.power(B[:, self.term_index], self.term_power.astype(dtype), out=X[:, a:b])
+            if c > b:
+                np.multiply(B[:, self.left_index], B[:, self.right_index], out=X[:, b:c])
+
+            # One-hot columns from the frozen levels
+            X[:, c:] = 0
+            for col, levels, index in self.dummies:
+                if not len(levels):
+                    continue
+                codes = pd.Categorical(df[col], categories=levels).codes
+                cols = np.where(codes >= 0, index[codes], -1)
+                rows = np.flatnonzero(cols >= 0)
+                X[rows, cols[rows]] = 1
+
+            st.output(X)
+
+        return X
+
+def _isCategorical(s):
+    return s.dtype == object or isinstance(s.dtype, pd.CategoricalDtype)
@@ -0,0 +1,297 @@
+import hashlib
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.interpolate import BSpline
+from scipy.special import expit
+from sklearn import metrics
+from sklearn.base import BaseEstimator, ClassifierMixin
+
+# Custom Python Files
+from dataprep.crossValidation import foldIndices
+from dataprep.logistic import newtonStep
+from dataprep.cache import dataKey
+
+# Spline bases of the folds, one folder per data set
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "gam")
+
+# Smoothing penalties tried by default (same grid as pygam's gridsearch)
+LAMS = np.logspace(-3, 3, 11)
+
+class SplineBasis:
+    """ Cubic P-spline basis of each column of a feature matrix
+
+        n_splines B-splines on equally spaced knots between the training min & max of each
+        column (values outside are clamped to the edges), with a second order difference
+        penalty. Each term is constrained to sum to zero over the training rows, so the
+        intercept carries the mean and the penalized system is not singular.
+
+    Keyword Arguments:
+        n_splines {int} -- basis functions per column (default: {10})
+        spline_order {int} -- degree of the B-splines (default: {3})
+    """
+
+    def __init__(self, n_splines=10, spline_order=3):
+        if n_splines <= spline_order:
+            raise ValueError("n_splines must be larger than spline_order (%d <= %d)" % (n_splines, spline_order))
+        self.n_splines = n_splines
+        self.spline_order = spline_order
+
+    def fit_transform(self, X):
+        """ Learns the knots & constraints of the columns of X and returns its basis matrix """
+        X = np.asarray(X, dtype=np.float64)
+        k, m = self.spline_order, self.n_splines
+
+        self.knots_, self.constraints_ = [], []
+        raw = []
+        for j in range(X.shape[1]):
+            lo, hi = X[:, j].min(), X[:, j].max()
+            hi = hi if hi > lo else lo + 1
+            h = (hi - lo)/(m - k)
+            t = lo + h*np.arange(-k, m + 1)
+            t[k], t[m] = lo, hi
+            self.knots_.append((lo, hi, t))
+
+            B = self._raw(X[:, j], j)
+            raw.append(B)
+
+            # Null space of the column sums: sum-to-zero reparameterization of the term
+            q, _ = np.linalg.qr(B.sum(axis=0)[:, None], mode="complete")
+            self.constraints_.append(q[:, 1:])
+
+        # Second order difference penalty of each term, in the constrained coefficients
+        D = np.diff(np.eye(m), n=2, axis=0)
+        self.penalties_ = [Z.T @ D.T @ D @ Z for Z in self.constraints_]
+
+        return np.hstack([B @ Z for B, Z in zip(raw, self.constraints_)])
+
+    def transform(self, X):
+        """ Basis matrix of new rows """
+        X = np.asarray(X, dtype=np.float64)
+
+        return np.hstack([self._raw(X[:, j], j) @ Z for j, Z in enumerate(self.constraints_)])
+
+    def penalty(self):
+        """ Block diagonal penalty matrix of all the terms """
+        p = sum(P.shape[0] for P in self.penalties_)
+        S = np.zeros((p, p))
+        a = 0
+        for P in self.penalties_:
+            S[a:a + len(P), a:a + len(P)] = P
+            a += len(P)
+
+        return S
+
+    def _raw(self, x, j):
+        lo, hi, t = self.knots_[j]
+
+        return BSpline.design_matrix(np.clip(x, lo, hi), t, self.spline_order).toarray()
+
+class LogisticGAM(BaseEstimator, ClassifierMixin):
+    """ Logistic GAM with a P-spline term for every column (pygam's LogisticGAM(s(0) + s(1) + ...))
+
+        Fitted by penalized IRLS (Newton's method on the penalized log likelihood).
+        Follows the sklearn estimator API, so it works with crossValidate, plotROCCurve,
+        compareImbalance ... like the logistic model.
+
+    Keyword Arguments:
+        n_splines {int} -- basis functions per column (default: {10})
+        lam {float} -- smoothing penalty, shared by the terms (default: {0.6})
+        spline_order {int} -- degree of the B-splines (default: {3})
+        tol {float} -- stop when the largest Newton step is below tol (default: {1e-6})
+        max_iter {int} -- maximum Newton steps (default: {100})
+    """
+
+    def __init__(self, n_splines=10, lam=0.6, spline_order=3, tol=1e-6, max_iter=100):
+        self.n_splines = n_splines
+        self.lam = lam
+        self.spline_order = spline_order
+        self.tol = tol
+        self.max_iter = max_iter
+
+    def fit(self, X, y, sample_weight=None):
+        y = np.asarray(y).ravel()
+        self.classes_ = np.unique(y)
+        self.basis_ = SplineBasis(self.n_splines, self.spline_order)
+        B = self.basis_.fit_transform(X)
+        self.coef_, self.n_iter_ = _fitPIRLS(B, y, self.basis_.penalty(), self.lam, sample_weight=sample_weight,
+                                             tol=self.tol, max_iter=self.max_iter)
+
+        return self
+
+    def predict_proba(self, X):
+        p = expit(self.coef_[0] + self.basis_.transform(X) @ self.coef_[1:])
+
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+def gridSearchGAM(X, y, lam=LAMS, n_splines=(10,), spline_order=3, n_splits=3, random_state=None, folds=None,
+                  n_jobs=1, cache_dir=CACHE_DIR, refit=True):
+    """ Cross validated grid search of the LogisticGAM smoothing penalty & number of splines
+
+        Replaces LogisticGAM(n_splines=10).gridsearch(X, y) and the ROC loop of GAM.ipynb:
+            1. the spline basis of each (fold, n_splines) is built once from the training
+               rows and saved as .npy files under cache_dir (keyed by the data, fold and
+               basis), later searches read it memory-mapped
+            2. each (n_splines, fold) job fits the whole lam grid on its basis, from the
+               largest to the smallest penalty, each fit warm started from the previous one
+            3. the jobs run in a process pool (joblib) and candidates are ranked by mean
+               fold AUC
+        With refit=True the best candidate is refitted on all the rows.
+
+    Arguments:
+        X {numpy array} -- feature matrix (e.g. model_prep output)
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        lam {list} -- smoothing penalties (default: {np.logspace(-3, 3, 11)})
+        n_splines {list} -- numbers of splines per column (default: {(10,)})
+        spline_order {int} -- degree of the B-splines (default: {3})
+        n_splits {int} -- number of folds, ignored when folds is given (default: {3})
+        random_state {int} -- fold shuffling (default: {None})
+        folds {list} -- precomputed foldIndices (default: {None})
+        n_jobs {int} -- number of parallel jobs, -1 for all cores (default: {1})
+        cache_dir {string} -- basis cache folder, None to not cache (default: {dataprep/.cache/gam})
+        refit {bool} -- fit the best candidate on all the rows (default: {True})
+
+    Returns:
+        results [GAMSearchResults]
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y).ravel()
+    if folds is None:
+        folds = foldIndices(y, n_splits=n_splits, random_state=random_state)
+
+    lams = np.sort(np.atleast_1d(lam))[::-1]
+    data_key = dataKey(X, y)
+
+    tasks = list(itertools.product(np.atleast_1d(n_splines), range(len(folds))))
+    out = Parallel(n_jobs=n_jobs)(delayed(_evalBasis)(X, y, folds[k], int(m), spline_order, lams, data_key, cache_dir)
+                                  for m, k in tasks)
+
+    rows = [dict(r, n_splines=int(m), fold=k) for (m, k), res in zip(tasks, out) for r in res]
+    results = GAMSearchResults(rows)
+
+    if refit:
+        best = results.best_params
+        results.best_estimator_ = LogisticGAM(spline_order=spline_order, **best).fit(X, y)
+
+    return results
+
+class GAMSearchResults:
+    """ Fold results of gridSearchGAM, one row per (n_splines, lam, fold)
+
+    Arguments:
+        rows {list} -- result dictionaries
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.best_estimator_ = None
+
+    def table(self):
+        """ Mean & std fold AUC, fit seconds summed over folds & Newton steps of each candidate """
+        df = pd.DataFrame(self.rows)
+        out = df.groupby(["n_splines", "lam"]).agg(mean_auc=("auc", "mean"), std_auc=("auc", "std"),
+                                                   fit_seconds=("fit_seconds", "sum"), n_iter=("n_iter", "sum"))
+
+        return out.sort_values("mean_auc", ascending=False).reset_index()
+
+    @property
+    def best_params(self):
+        best = self.table().iloc[0]
+
+        return {"n_splines": int(best["n_splines"]), "lam": float(best["lam"])}
+
+    @property
+    def best_score(self):
+        return float(self.table()["mean_auc"].iloc[0])
+
+def _evalBasis(X, y, fold, n_splines, spline_order, lams, data_key, cache_dir):
+    """ Fits the lam grid on one (fold, n_splines) basis, warm started, and returns the test AUC of each lam """
+    train, test = fold
+    Btr, Bte, P = _foldBasis(X, train, test, n_splines, spline_order, data_key, cache_dir)
+
+    out, beta = [], None
+    for lam in lams:
+        start = time.perf_counter()
+        beta, n_iter = _fitPIRLS(Btr, y[train], P, lam, coef_init=beta)
+        fit_seconds = time.perf_counter() - start
+
+        p = expit(beta[0] + Bte @ beta[1:])
+        out.append({"lam": float(lam), "auc": float(metrics.roc_auc_score(y[test], p)), "fit_seconds": fit_seconds,
+                    "n_iter": n_iter})
+
+    return out
+
+def _foldBasis(X, train, test, n_splines, spline_order, data_key, cache_dir):
+    """ Training & test basis matrices and penalty of a fold, read from the cache when they were built before """
+    names = ["train", "test", "penalty"]
+
+    folder = None
+    if cache_dir is not None:
+        fold_key = hashlib.sha256(np.asarray(train).tobytes() + np.asarray(test).tobytes()).hexdigest()[:16]
+        folder = os.path.join(cache_dir, data_key[:16], "%d_%d_%s" % (n_splines, spline_order, fold_key))
+        if all(os.path.exists(os.path.join(folder, n + ".npy")) for n in names):
+            return tuple(np.load(os.path.join(folder, n + ".npy"), mmap_mode="r") for n in names)
+
+    basis = SplineBasis(n_splines, spline_order)
+    arrays = {"train": basis.fit_transform(X[train]), "test": basis.transform(X[test]), "penalty": basis.penalty()}
+    if folder is None:
+        return tuple(arrays[n] for n in names)
+
+    # Written next to the final files, then swapped in
+    os.makedirs(folder, exist_ok=True)
+    for n, a in arrays.items():
+        path = os.path.join(folder, n + ".npy")
+        with open(path + ".tmp", "wb") as fp:
+            np.save(fp, a)
+        os.replace(path + ".tmp", path)
+
+    return tuple(np.load(os.path.join(folder, n + ".npy"), mmap_mode="r") for n in names)
+
+def _fitPIRLS(B, y, P, lam, sample_weight=None, coef_init=None, tol=1e-6, max_iter=100):
+    """ Penalized IRLS: maximizes loglik - lam/2 * beta' P beta, intercept not penalized
+
+    Returns:
+        beta [numpy array] -- [intercept, coef...], n_iter [int]
+    """
+    n, p = B.shape
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    Z = np.empty((n, p + 1))
+    Z[:, 0] = 1
+    Z[:, 1:] = B
+
+    S = np.zeros((p + 1, p + 1))
+    S[1:, 1:] = lam*np.asarray(P)
+
+    def objective(beta):
+        eta = Z @ beta
+        return np.sum(w*(y*eta - np.logaddexp(0, eta))) - beta @ S @ beta/2
+
+    beta = np.zeros(p + 1) if coef_init is None else np.array(coef_init, dtype=np.float64)
+    current = objective(beta)
+    for n_iter in range(1, max_iter + 1):
+        mu = expit(Z @ beta)
+        grad = Z.T @ (w*(y - mu)) - S @ beta
+        H = (Z*(w*mu*(1 - mu))[:, None]).T @ Z + S
+        step = newtonStep(H, grad)
+
+        # Step halving keeps the penalized likelihood increasing
+        for _ in range(30):
+            new = objective(beta + step)
+            if new >= current - 1e-12*abs(current):
+                break
+            step = step/2
+        beta, current = beta + step, new
+
+        if np.max(np.abs(step)) < tol:
+            break
+
+    return beta, n_iter
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+
+# Custom Python Files
+from dataprep.crossValidation import CVResults, foldIndices
+from dataprep.logistic import balancedWeights
+from dataprep.cache import dataKey
+
+# Resampled training folds, one folder per data set
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "imbalance")
+
+# Ways of handling the class imbalance
+STRATEGIES = ["none", "smote", "undersample", "balanced"]
+
+def compareImbalance(models, X, y, strategies=STRATEGIES, n_splits=3, random_state=None, folds=None, seed=33,
+                     k_neighbors=5, n_jobs=1, cache_dir=CACHE_DIR, threshold=0.5):
+    """ Cross validates every (model, imbalance strategy) pair on the same folds
+
+        Strategies:
+            - none: the training fold as is
+            - smote: SMOTE oversampling of the training fold (as plotROCCurve_smote)
+            - undersample: random undersampling of the majority class
+            - balanced: class_weight='balanced' (as finalmodel), or balanced sample
+              weights for estimators without class_weight
+        The other strategies fit with class_weight=None, so the estimator's own setting
+        does not mix two strategies.
+        The resampled training folds are computed once per (fold, seed) and saved as .npy
+        files under cache_dir, keyed by the data, the fold and the seed; every later
+        call, strategy comparison or estimator reads them memory-mapped. The (model,
+        strategy, fold) fits run in parallel (joblib) and are scored on the untouched
+        test folds.
+
+    Arguments:
+        models {estimator or dictionary} -- unfitted sklearn style estimator, or name -> estimator
+        X {numpy array} -- feature matrix
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        strategies {list} -- strategies to compare (default: {STRATEGIES})
+        n_splits {int} -- number of folds, ignored when folds is given (default: {3})
+        random_state {int} -- fold shuffling (default: {None})
+        folds {list} -- precomputed foldIndices (default: {None})
+        seed {int} -- random state of SMOTE & the undersampling (default: {33})
+        k_neighbors {int} -- SMOTE nearest neighbours (default: {5})
+        n_jobs {int} -- number of parallel jobs (default: {1})
+        cache_dir {string} -- cache folder, None to keep the resampled folds in memory only (default: {dataprep/.cache/imbalance})
+        threshold {float} -- class threshold of the metrics table (default: {0.5})
+
+    Returns:
+        table [pandas dataframe] -- one row per model/strategy: mean ROC AUC, fold AUC mean/std,
+                                    accuracy, precision, recall, f1, training rows & fit seconds
+        results [CVResults] -- out-of-fold predictions, named "model/strategy" (plotROC, confusionMatrix ...)
+    """
+    models = models if isinstance(models, dict) else {type(models).__name__: models}
+    unknown = set(strategies) - set(STRATEGIES)
+    if unknown:
+        raise ValueError("Unknown strategies %s, expected %s" % (sorted(unknown), STRATEGIES))
+
+    X = np.asarray(X)
+    y = np.asarray(y).ravel()
+    if folds is None:
+        folds = foldIndices(y, n_splits=n_splits, random_state=random_state)
+
+    data_key = dataKey(X, y)
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        # 1. Resampled training folds, computed once
+        tasks = [(s, k) for s in strategies if s in ("smote", "undersample") for k in range(len(folds))]
+        out = parallel(delayed(resampledFold)(X, y, folds[k][0], s, seed=seed, k_neighbors=k_neighbors,
+                                              data_key=data_key, cache_dir=cache_dir) for s, k in tasks)
+        resampled = dict(zip(tasks, out))
+
+        # 2. Every (model, strategy, fold)
+        fits = [(name, s, k) for name in models for s in strategies for k in range(len(folds))]
+        out = parallel(delayed(_fitStrategy)(models[name], X, y, folds[k], s, resampled.get((s, k)))
+                       for name, s, k in fits)
+
+    oof, rows, seconds = {}, {}, {}
+    for (name, s, k), (pred, n_rows, fit_seconds) in zip(fits, out):
+        key = "%s/%s" % (name, s)
+        oof.setdefault(key, np.empty(len(y)))[folds[k][1]] = pred
+        rows[key] = rows.get(key, 0) + n_rows
+        seconds[key] = seconds.get(key, 0) + fit_seconds
+
+    results = CVResults(y, folds, oof)
+    table = results.summary(threshold=threshold)
+    table.insert(0, "strategy", [key.split("/")[-1] for key in table.index])
+    table["train_rows"] = [rows[key]/len(folds) for key in table.index]
+    table["fit_seconds"] = [seconds[key] for key in table.index]
+
+    return table, results
+
+def resampledFold(X, y, train_index, strategy, seed=33, k_neighbors=5, data_key=None, cache_dir=CACHE_DIR):
+    """ Resampled training fold, read from the cache when it was computed before
+
+        SMOTE folds are stored as X.npy & y.npy, undersampled folds as the kept row
+        indices (index.npy). Both are loaded with mmap_mode="r", so parallel workers
+        share the pages instead of copying the arrays.
+
+    Arguments:
+        X {numpy array} -- feature matrix
+        y {numpy array} -- response variable
+        train_index {numpy array} -- rows of the training fold
+        strategy {string} -- "smote" or "undersample"
+
+    Keyword Arguments:
+        seed {int} -- random state of the sampler (default: {33})
+        k_neighbors {int} -- SMOTE nearest neighbours (default: {5})
+        data_key {string} -- hash of X & y, computed when None (default: {None})
+        cache_dir {string} -- cache folder, None for no cache (default: {dataprep/.cache/imbalance})
+
+    Returns:
+        fold [dictionary] -- X & y (smote) or index (undersample), memory-mapped when cached
+    """
+    if strategy not in ("smote", "undersample"):
+        raise ValueError("No resampling for strategy %s" % strategy)
+
+    params = [strategy, seed] + ([k_neighbors] if strategy == "smote" else [])
+    names = ["X", "y"] if strategy == "smote" else ["index"]
+
+    folder = None
+    if cache_dir is not None:
+        data_key = data_key or dataKey(X, y)
+        fold_key = hashlib.sha256(np.asarray(train_index).tobytes()).hexdigest()[:16]
+        folder = os.path.join(cache_dir, data_key[:16], "%s_%s" % ("_".join(map(str, params)), fold_key))
+        if all(os.path.exists(os.path.join(folder, n + ".npy")) for n in names):
+            return {n: np.load(os.path.join(folder, n + ".npy"), mmap_mode="r") for n in names}
+
+    xtr, ytr = X[train_index], y[train_index]
+    if strategy == "smote":
+        from imblearn.over_sampling import SMOTE
+        sampler = SMOTE(random_state=seed, k_neighbors=k_neighbors)
+        X_res, y_res = _fitResample(sampler, xtr, ytr)
+        fold = {"X": np.asarray(X_res), "y": np.asarray(y_res)}
+    else:
+        from imblearn.under_sampling import RandomUnderSampler
+        sampler = RandomUnderSampler(random_state=seed)
+        _fitResample(sampler, xtr, ytr)
+        fold = {"index": np.asarray(train_index)[sampler.sample_indices_]}
+
+    if folder is None:
+        return fold
+
+    # Written next to the final files, then swapped in
+    os.makedirs(folder, exist_ok=True)
+    for n, a in fold.items():
+        path = os.path.join(folder, n + ".npy")
+        with open(path + ".tmp", "wb") as fp:
+            np.save(fp, a)
+        os.replace(path + ".tmp", path)
+
+    return {n: np.load(os.path.join(folder, n + ".npy"), mmap_mode="r") for n in names}
+
+def _fitResample(sampler, X, y):
+    """ fit_resample (fit_sample before imbalanced-learn 0.4) """
+    fit = getattr(sampler, "fit_resample", None) or sampler.fit_sample
+
+    return fit(X, y)
+
+def _fitStrategy(model, X, y, fold, strategy, resampled):
+    """ Fits one (strategy, fold) and returns the predicted probability of the test rows, training rows & fit seconds """
+    train, test = fold
+    clf = clone(model)
+    kwargs = {}
+
+    if strategy == "smote":
+        xtr, ytr = resampled["X"], resampled["y"]
+    elif strategy == "undersample":
+        xtr, ytr = X[resampled["index"]], y[resampled["index"]]
+    else:
+        xtr, ytr = X[train], y[train]
+
+    if strategy == "balanced":
+        if "class_weight" in clf.get_params():
+            clf.set_params(class_weight="balanced")
+        else:
+            kwargs["sample_weight"] = balancedWeights(ytr)
+    elif "class_weight" in clf.get_params():
+        clf.set_params(class_weight=None)
+
+    start = time.perf_counter()
+    clf.fit(xtr, ytr, **kwargs)
+    seconds = time.perf_counter() - start
+
+    return clf.predict_proba(X[test])[:,1], len(ytr), seconds
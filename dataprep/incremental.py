@@ -0,0 +1,272 @@
+import datetime
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.cache import codeVersion
+from dataprep.dataPrep import (asOfDate, columnlist_dict, textcols, boxcoxDict, boxcox_transform, dataPath,
+                               filterAndRename, firstdeal_dates, imputation_values, missingData_imputation,
+                               time_features, variable_transformation)
+from dataprep.instrumentation import stage
+
+# Key of the accounts (renamed column)
+KEY = "companyID"
+
+# Parts of the store before they are compacted into one
+MAX_PARTS = 16
+
+def incrementalCleanData(filepath, store_dir, boxcox=False, as_of=None):
+    """ cleanData that only recomputes the accounts that changed since the last run
+
+        The store keeps the cleaned rows of the previous exports, one hash of the mapped
+        raw columns per row, the first deal dates and the imputation values.
+        A new export is compared with it on companyID:
+            1. new & changed rows (different row hash) are cleaned
+            2. rows missing from the export are dropped
+            3. if the imputation values (employee mean, MRR median) moved, the rows
+               with a missing employees/MRR value are cleaned again as well
+            4. the date columns (daysAsCustomer, callsPerQuarter, sessionsPerDay) of
+               the other rows are refreshed from the stored first deal dates to as_of, a
+               few vectorized operations (they move whenever as_of does)
+        Everything is rebuilt when the store is empty or was built with another boxcox
+        flag, column mapping or dataPrep.py version. The result has the rows in export
+        order and the same values as cleanData(filepath, boxcox, as_of=as_of).
+
+        The store is append-only: every run writes one part (part-NNNNN.pkl) with the rows
+        it cleaned and the companyIDs it dropped, then manifest.json, which lists the parts
+        and makes the run visible. A run without changes only rewrites the manifest. The
+        parts are read in order (later rows win) and compacted into one when there are
+        more than MAX_PARTS of them or more stored rows than twice the live ones.
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe (a full export)
+        store_dir {string} -- folder of the materialized tables
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+    Returns:
+        df [pandas dataframe] -- cleaned data set
+        summary [dictionary] -- rows, new, changed, removed, recomputed, restat (imputation values changed),
+                                full (rebuilt), compacted (parts merged into one)
+    """
+    as_of = asOfDate(as_of)
+
+    with stage("incrementalCleanData", pipeline="incrementalCleanData", boxcox=boxcox) as total:
+        # Read & hash the new export
+        with stage("read_csv", pipeline="incrementalCleanData") as st:
+            raw = _readExport(filepath)
+            st.output(raw)
+
+        with stage("row_hash", pipeline="incrementalCleanData", data=raw):
+            hashes = pd.Series(pd.util.hash_pandas_object(raw, index=False).values, index=raw[KEY].values)
+            stats = imputation_values(raw)
+
+        manifest = _loadManifest(store_dir)
+        version = {"boxcox": bool(boxcox), "columns": columnlist_dict, "code": codeVersion()}
+
+        if manifest is None or manifest["version"] != version:
+            # Full build
+            with stage("clean_full", pipeline="incrementalCleanData", data=raw) as st:
+                clean, firstdeal = _clean(raw, stats, boxcox, as_of)
+                st.output(clean)
+            part = _part(hashes, clean, firstdeal)
+            parts, number = [], 0 if manifest is None else manifest["next"]
+            summary = {"rows": len(raw), "new": len(raw), "changed": 0, "removed": 0,
+                       "recomputed": len(raw), "restat": False, "full": True, "compacted": False}
+        else:
+            with stage("load", pipeline="incrementalCleanData") as st:
+                old, stored = _loadTables(store_dir, manifest["parts"])
+                st.output(old["clean"])
+            clean, firstdeal, part, summary = _update(raw, hashes, stats, old, manifest, boxcox, as_of)
+            parts, number = manifest["parts"], manifest["next"]
+
+            # Too many parts or dead rows: one part with the live rows
+            summary["compacted"] = len(parts) >= MAX_PARTS or stored + len(part["clean"]) > 2*len(raw)
+            if summary["compacted"]:
+                part, parts = _part(hashes, clean, firstdeal), []
+
+        with stage("store", pipeline="incrementalCleanData", data=part["clean"]):
+            os.makedirs(store_dir, exist_ok=True)
+            if len(part["clean"]) or len(part["removed"]):
+                parts = parts + [_savePart(store_dir, number, part)]
+                number += 1
+            _saveManifest(store_dir, {"version": version, "stats": stats, "as_of": as_of.isoformat(),
+                                      "parts": parts, "next": number, "summary": summary,
+                                      "updated": datetime.datetime.now().isoformat(timespec="seconds")})
+            _removeStale(store_dir, parts)
+
+        clean = clean.reset_index(drop=True)
+        total.output(clean)
+
+    return clean, summary
+
+def loadCleanTable(store_dir):
+    """ Cleaned table of the last incrementalCleanData run
+
+        Rows in the order the accounts were first stored (export order until they change),
+        date columns counted to the as-of date of that run.
+    """
+    manifest = _loadManifest(store_dir)
+    if manifest is None:
+        raise FileNotFoundError("No incrementalCleanData store in %s" % store_dir)
+
+    tables, _ = _loadTables(store_dir, manifest["parts"])
+    clean = tables["clean"]
+    _refreshDates(clean, tables["firstdeal"], np.ones(len(clean), dtype=bool), pd.Timestamp(manifest["as_of"]),
+                  manifest["version"]["boxcox"])
+
+    return clean.reset_index(drop=True)
+
+def _update(raw, hashes, stats, old, manifest, boxcox, as_of):
+    """ Upserts the new & changed rows into the stored tables, returns the part to append """
+    with stage("diff", pipeline="incrementalCleanData", data=raw):
+        ids = raw[KEY].values
+        old_hash = old["hashes"].reindex(ids)
+
+        new = old_hash.isna().values
+        changed = ~new & (old_hash.values != hashes.values)
+        gone = old["hashes"].index[~old["hashes"].index.isin(ids)]
+
+        # Stats dependent rows are recleaned when the imputation values moved
+        restat = not _sameStats(stats, manifest["stats"])
+        recompute = new | changed
+        if restat:
+            recompute |= raw["employees"].isna().values | raw["MRR"].isna().values
+
+    with stage("upsert", pipeline="incrementalCleanData", data=raw, recomputed=int(recompute.sum())) as st:
+        # Kept rows from the stored table, in export order, then the recleaned rows written over them
+        clean = old["clean"].reindex(ids)
+        firstdeal = old["firstdeal"].reindex(ids)
+        delta, delta_dates = old["clean"].iloc[:0], old["firstdeal"].iloc[:0]
+        if recompute.any():
+            delta, delta_dates = _clean(raw[recompute], stats, boxcox, as_of)
+            clean.loc[delta.index] = delta
+            firstdeal.loc[delta_dates.index] = delta_dates
+
+        # Integer columns come back as floats after the reindex
+        clean = clean.astype(old["clean"].dtypes.to_dict())
+        st.output(clean)
+
+    # Date columns of the kept rows
+    kept = ~recompute
+    if kept.any():
+        with stage("refresh_dates", pipeline="incrementalCleanData", data=clean):
+            _refreshDates(clean, firstdeal, kept, as_of, boxcox)
+
+    part = _part(hashes[recompute], delta, delta_dates, removed=gone)
+    summary = {"rows": len(raw), "new": int(new.sum()), "changed": int(changed.sum()), "removed": len(gone),
+               "recomputed": int(recompute.sum()), "restat": restat, "full": False}
+
+    return clean, firstdeal, part, summary
+
+def _refreshDates(clean, firstdeal, rows, as_of, boxcox):
+    """ Recomputes the date columns of the rows (boolean mask) of clean in place """
+    part = time_features(clean.loc[rows, ["timescontacted", "sessions"]].copy(), firstdeal[rows], as_of)
+    if boxcox:
+        part["callsPerQuarter"] = boxcox_transform(part["callsPerQuarter"].values, boxcoxDict["callsPerQuarter"])
+    for col in ["daysAsCustomer", "callsPerQuarter", "sessionsPerDay"]:
+        clean.loc[rows, col] = part[col].values
+
+def _sameStats(a, b):
+    """ Imputation values equal (missing values compare equal) """
+    return all(a[k] == b[k] or (pd.isna(a[k]) and pd.isna(b[k])) for k in a)
+
+def _clean(raw, stats, boxcox, as_of):
+    """ Cleans raw rows with fixed imputation values, indexed by companyID """
+    df = missingData_imputation(raw.copy(), **stats)
+    firstdeal = firstdeal_dates(df)
+    df = variable_transformation(df, boxcox=boxcox, as_of=as_of)
+
+    df.index = raw[KEY].values
+    firstdeal.index = df.index
+
+    return df, firstdeal
+
+def _readExport(filepath):
+    """ Mapped & renamed raw columns, text columns kept as object so the row hashes are stable """
+    dtypes = {k: object for k, v in columnlist_dict.items() if v in textcols}
+    df = filterAndRename(pd.read_csv(dataPath(filepath), usecols=list(columnlist_dict.keys()), dtype=dtypes))
+
+    if df[KEY].duplicated().any():
+        dup = df.loc[df[KEY].duplicated(), KEY].unique()[:10]
+        raise ValueError("Duplicated %s values in %s: %s" % (KEY, filepath, list(dup)))
+
+    return df
+
+def _part(hashes, clean, firstdeal, removed=None):
+    """ Rows written by one run (indexed by companyID) and the companyIDs it dropped """
+    return {"hashes": hashes, "clean": clean, "firstdeal": firstdeal,
+            "removed": clean.index[:0] if removed is None else removed}
+
+def _loadManifest(store_dir):
+    """ Manifest of the last run, None when the store is empty or a listed part is missing """
+    path = os.path.join(store_dir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as fp:
+        manifest = json.load(fp)
+    if not all(os.path.exists(os.path.join(store_dir, name)) for name in manifest["parts"]):
+        return None
+
+    return manifest
+
+def _saveManifest(store_dir, manifest):
+    """ Writes the manifest (after the parts it lists), which commits the run """
+    path = os.path.join(store_dir, "manifest.json")
+    with open(path + ".tmp", "w") as fp:
+        json.dump(manifest, fp, default=float)
+    os.replace(path + ".tmp", path)
+
+def _loadTables(store_dir, parts):
+    """ Live rows of the stored parts, the last write of each companyID, and the number of stored rows
+
+        A companyID is live when its last write comes after the last part that dropped it.
+    """
+    tables = []
+    for name in parts:
+        with open(os.path.join(store_dir, name), "rb") as fp:
+            tables.append(pickle.load(fp))
+
+    clean = pd.concat([t["clean"] for t in tables])
+    firstdeal = pd.concat([t["firstdeal"] for t in tables])
+    hashes = pd.concat([t["hashes"] for t in tables])
+    written = np.repeat(np.arange(len(tables)), [len(t["clean"]) for t in tables])
+    stored = len(written)
+
+    # Order of the first write, values of the last one
+    order = clean.index.unique()
+    last = ~clean.index.duplicated(keep="last")
+    written = pd.Series(written[last], index=clean.index[last]).reindex(order)
+    clean, firstdeal, hashes = clean[last].reindex(order), firstdeal[last].reindex(order), hashes[last].reindex(order)
+
+    dropped = [pd.Series(k, index=t["removed"]) for k, t in enumerate(tables) if len(t["removed"])]
+    if dropped:
+        dropped = pd.concat(dropped)
+        dropped = dropped[~dropped.index.duplicated(keep="last")].reindex(order)
+        live = ~(dropped.values >= written.values)
+        clean, firstdeal, hashes = clean[live], firstdeal[live], hashes[live]
+
+    return {"hashes": hashes, "clean": clean, "firstdeal": firstdeal}, stored
+
+def _savePart(store_dir, number, part):
+    """ Writes a new part (next to its final name, then swapped in), returns its file name """
+    name = "part-%05d.pkl" % number
+
+    path = os.path.join(store_dir, name)
+    with open(path + ".tmp", "wb") as fp:
+        pickle.dump(part, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+    return name
+
+def _removeStale(store_dir, parts):
+    """ Deletes the parts the manifest no longer lists (compacted or rebuilt) """
+    for name in os.listdir(store_dir):
+        if name.startswith("part-") and name.endswith(".pkl") and name not in parts:
+            os.remove(os.path.join(store_dir, name))
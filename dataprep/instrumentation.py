@@ -0,0 +1,207 @@
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Unix only: without it (Windows) the peak resident memory is None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Active sinks (callables receiving each event), empty when instrumentation is disabled
+_sinks = []
+
+# Stages currently running, innermost last
+_stack = []
+
+# Whether stages record tracemalloc allocations
+_memory = False
+
+def enable(callback=None, path=None, memory=False):
+    """ Turns on stage instrumentation
+
+        Every instrumented stage (read_csv, filterAndRename, missingData_imputation,
+        variable_transformation, the model_prep steps, the model fit ...) then emits one
+        event dictionary:
+            pipeline, stage, parent -- where the stage runs (parent is the enclosing stage)
+            seconds -- wall time
+            rss_mb, max_rss_mb -- current and peak resident memory of the process at the end of the stage (None when unknown)
+            alloc_peak_mb, alloc_delta_mb -- tracemalloc peak above the start and net change (memory=True only)
+            rows_in, cols_in, rows, cols -- input & output shape when known
+            plus any context passed to the stage (e.g. chunk number)
+
+    Keyword Arguments:
+        callback {callable} -- called with each event (default: {None})
+        path {string} -- JSON lines file the events are appended to (default: {None})
+        memory {bool} -- record allocations with tracemalloc, slower (default: {False})
+    """
+    global _memory
+
+    if callback is not None:
+        _sinks.append(callback)
+    if path is not None:
+        _sinks.append(_JSONLines(path))
+
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    """ Turns off stage instrumentation and closes the JSON lines files """
+    global _memory
+
+    for sink in _sinks:
+        if isinstance(sink, _JSONLines):
+            sink.close()
+    del _sinks[:]
+
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memory = False
+
+@contextlib.contextmanager
+def instrumented(callback=None, path=None, memory=False):
+    """ Context manager version of enable/disable
+
+        Example:
+            events = []
+            with instrumented(events.append):
+                finalmodel()
+    """
+    enable(callback=callback, path=path, memory=memory)
+    try:
+        yield
+    finally:
+        disable()
+
+def stage(name, pipeline=None, data=None, **context):
+    """ Measures a block of code when instrumentation is enabled
+
+        With instrumentation disabled this returns a shared no-op object, so the cost
+        is one function call.
+
+        Example:
+            with stage("read_csv", pipeline="cleanData") as st:
+                df = pd.read_csv(filepath)
+                st.output(df)
+
+    Arguments:
+        name {string} -- stage name
+
+    Keyword Arguments:
+        pipeline {string} -- function the stage belongs to (default: {None})
+        data {dataframe or array} -- stage input, for rows_in/cols_in (default: {None})
+        context -- extra fields added to the event
+    """
+    if not _sinks:
+        return _NULL_STAGE
+
+    return _Stage(name, pipeline, data, context)
+
+class _Stage:
+    """ A running instrumented stage """
+
+    def __init__(self, name, pipeline, data, context):
+        self.event = {"pipeline": pipeline, "stage": name}
+        self.event["rows_in"], self.event["cols_in"] = _shape(data)
+        self.event.update(context)
+        self.out = None
+        self.child_peak = 0
+
+    def output(self, data):
+        """ Records the stage output shape """
+        self.out = data
+
+    def __enter__(self):
+        self.event["parent"] = _stack[-1].event["stage"] if _stack else None
+        _stack.append(self)
+
+        if _memory and tracemalloc.is_tracing():
+            self.alloc_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _stack.pop()
+
+        self.event["seconds"] = seconds
+        self.event["rows"], self.event["cols"] = _shape(self.out)
+        self.event["rss_mb"] = _currentRSS()
+        self.event["max_rss_mb"] = maxRSS()
+
+        if _memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+
+            # Nested stages reset the tracemalloc peak, so keep the largest seen below us
+            peak = max(peak, self.child_peak)
+            self.event["alloc_peak_mb"] = (peak - self.alloc_start)/1024**2
+            self.event["alloc_delta_mb"] = (current - self.alloc_start)/1024**2
+            if _stack:
+                _stack[-1].child_peak = max(_stack[-1].child_peak, peak)
+
+        if exc_type is not None:
+            self.event["error"] = exc_type.__name__
+        self.event["timestamp"] = time.time()
+
+        for sink in list(_sinks):
+            sink(self.event)
+
+        return False
+
+class _NullStage:
+    """ Shared no-op stage used when instrumentation is disabled """
+
+    def output(self, data):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _JSONLines:
+    """ Sink appending events to a JSON lines file """
+
+    def __init__(self, path):
+        self.fp = open(path, "a")
+
+    def __call__(self, event):
+        self.fp.write(json.dumps(event, default=str) + "\n")
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+def _shape(data):
+    shape = getattr(data, "shape", None)
+    if shape is None:
+        return None, None
+
+    return int(shape[0]), int(shape[1]) if len(shape) > 1 else 1
+
+def _currentRSS():
+    """ Current resident memory in MB (Linux), None elsewhere """
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/1024**2
+    except (OSError, ValueError, IndexError):
+        return None
+
+def maxRSS():
+    """ Peak resident memory of the process in MB, None without the resource module (Windows) """
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KB, macOS bytes
+    return rss/1024**2 if sys.platform == "darwin" else rss/1024
@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import stats
+
+# Custom Python Files
+from dataprep.instrumentation import stage
+
+# Pairs of cohorts per batch of pairwise log-rank tests
+PAIR_BATCH = 1024
+
+def kaplanMeier(df, by=None, duration="days_cust", event="churn", alpha=0.05, pairwise=False, n_jobs=1,
+                block_size=256):
+    """ Kaplan-Meier curves & log-rank tests for every value of every segmentation column
+
+        Replaces the KaplanMeierFitter-per-cohort loops of timeseries/Surv Analysis.ipynb:
+            1. the durations are sorted once (np.unique) into a time index
+            2. for each block of cohorts, the deaths & removals are counted in one bincount
+               into a cohorts x times matrix (the times of the block), the at risk counts
+               are reverse cumulative sums and the survival curves cumulative products
+               along the rows; the log-rank expected deaths are the pooled cumulative
+               hazard of the column summed over the rows of each cohort
+            3. the log-rank test of each column (all its cohorts) and, with pairwise=True,
+               of every pair of cohorts, are computed from the same matrices in batches
+        Cohorts are processed in blocks of block_size, in parallel (joblib) when n_jobs != 1.
+        A column with more than block_size values is split across blocks for its curves;
+        its log-rank tests are computed afterwards from cohorts x death times matrices
+        of the whole column (the times without a death add nothing to the statistics).
+
+        Confidence intervals are the exponential Greenwood ones of lifelines.
+
+    Arguments:
+        df {pandas dataframe} -- one row per account, e.g. output of survivalData
+
+    Keyword Arguments:
+        by {string or list} -- segmentation columns, None for the whole customer base (default: {None})
+        duration {string} -- duration column (default: {"days_cust"})
+        event {string} -- event column, 1 for churn (default: {"churn"})
+        alpha {float} -- confidence intervals at 1 - alpha (default: {0.05})
+        pairwise {bool} -- also test every pair of cohorts of each column (default: {False})
+        n_jobs {int} -- number of parallel jobs (default: {1})
+        block_size {int} -- number of cohorts per job (default: {256})
+
+    Returns:
+        results [KMResults] -- curves, summary, tests & pairwise tables
+    """
+    by = [None] if by is None else [by] if isinstance(by, str) else list(by)
+    T = df[duration].to_numpy(dtype=np.float64)
+    E = df[event].to_numpy(dtype=np.float64)
+    if np.isnan(T).any() or np.isnan(E).any():
+        raise ValueError("Missing values in %s / %s" % (duration, event))
+
+    z = stats.norm.ppf(1 - alpha/2)
+
+    with stage("kaplanMeier", pipeline="kaplanMeier", data=df, columns=len(by)) as total:
+        # 1. Durations sorted once
+        with stage("sort_durations", pipeline="kaplanMeier", data=df):
+            times, tidx = np.unique(T, return_inverse=True)
+
+        # Cohorts of each column, cut in blocks of at most block_size cohorts
+        with stage("cohorts", pipeline="kaplanMeier", data=df):
+            parts, split = [], []
+            for col in by:
+                col_parts, column = _columnParts(df, col, tidx, E, len(times), block_size)
+                parts.extend(col_parts)
+                if not column.whole:
+                    split.append(column)
+            tasks = _pack(parts, block_size)
+
+        # 2. & 3. Curves and tests of each block
+        with stage("curves", pipeline="kaplanMeier", blocks=len(tasks)):
+            if n_jobs == 1 or len(tasks) == 1:
+                out = [_kmTask(task, times, z, pairwise) for task in tasks]
+            else:
+                out = Parallel(n_jobs=n_jobs)(delayed(_kmTask)(task, times, z, pairwise) for task in tasks)
+
+        # Tests of the columns split across blocks
+        if split:
+            with stage("column_tests", pipeline="kaplanMeier", columns=len(split)):
+                if n_jobs == 1 or len(split) == 1:
+                    out += [_columnTests(column, pairwise) for column in split]
+                else:
+                    out += Parallel(n_jobs=n_jobs)(delayed(_columnTests)(column, pairwise) for column in split)
+
+        names = ["ALL" if col is None else col for col in by]
+        tables = [_byColumn(_concat([o[name] for o in out]), names) for name in ("curves", "summary", "tests", "pairwise")]
+        results = KMResults(*tables, alpha=alpha)
+        total.output(results.curves)
+
+    return results
+
+class KMResults:
+    """ Tidy tables of kaplanMeier
+
+        curves -- column, cohort, time, at_risk, events, censored, survival, ci_lower, ci_upper
+                  (one row per time with an event or a censoring in the cohort)
+        summary -- column, cohort, n, events, median, expected (log-rank expected events)
+        tests -- column, n_cohorts, test_statistic, dof, p_value (log-rank test of all the cohorts)
+        pairwise -- column, cohort_a, cohort_b, test_statistic, p_value (pairwise=True only)
+
+    Arguments:
+        curves, summary, tests, pairwise {pandas dataframe}
+
+    Keyword Arguments:
+        alpha {float} -- level of the confidence intervals (default: {0.05})
+    """
+
+    def __init__(self, curves, summary, tests, pairwise, alpha=0.05):
+        self.curves = curves
+        self.summary = summary
+        self.tests = tests
+        self.pairwise = pairwise
+        self.alpha = alpha
+
+    def survival(self, column, cohort):
+        """ Survival function of one cohort (step function indexed by time, starting at 1 at time 0) """
+        col = "ALL" if column is None else column
+        df = self.curves[(self.curves["column"] == col) & (self.curves["cohort"] == cohort)]
+        s = pd.Series(df["survival"].values, index=df["time"].values, name=cohort)
+
+        return pd.concat([pd.Series([1.0], index=[0.0]), s]) if not len(s) or s.index[0] > 0 else s
+
+    def plotSurvival(self, column, axis, ci=False):
+        """ Plots the curves of every cohort of a column (one step line each) """
+        col = "ALL" if column is None else column
+        for cohort, df in self.curves[self.curves["column"] == col].groupby("cohort", sort=False):
+            t = np.append(0, df["time"].values)
+            line = axis.step(t, np.append(1, df["survival"].values), where="post", label=str(cohort))
+            if ci:
+                axis.fill_between(t, np.append(1, df["ci_lower"].values), np.append(1, df["ci_upper"].values),
+                                  step="post", alpha=.2, color=line[0].get_color())
+        axis.set(xlabel="Days", ylabel="% Surviving", title="Cohort KMF: %s" % col)
+        axis.legend()
+
+class _Part:
+    """ Cohorts [lo, hi) of one column: codes, time index & events of their rows and the column totals """
+
+    def __init__(self, column, levels, codes, tidx, E, totals, whole):
+        self.column = column
+        self.levels = levels
+        self.codes = codes
+        self.tidx = tidx
+        self.E = E
+        self.deaths, self.at_risk, self.hazard = totals
+        self.whole = whole
+
+def _columnParts(df, col, tidx, E, n_times, block_size):
+    """ Splits the rows of a column by cohort (one argsort) into parts of block_size cohorts
+
+        Returns the parts and the whole column as one part (the only part when it fits in a block).
+    """
+    if col is None:
+        name, codes, levels = "ALL", np.zeros(len(df), dtype=np.intp), np.array(["ALL"], dtype=object)
+    else:
+        name = col
+        codes, levels = pd.factorize(df[col], sort=True)
+        levels = np.asarray(levels, dtype=object)
+
+    # Column totals (rows with a missing value are left out)
+    valid = codes >= 0
+    deaths = np.bincount(tidx[valid], weights=E[valid], minlength=n_times)
+    at_risk = _atRisk(np.bincount(tidx[valid], minlength=n_times).astype(np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hazard = np.cumsum(np.where(at_risk > 0, deaths/at_risk, 0))
+
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(levels) + 1))
+
+    whole = len(levels) <= block_size
+    parts = []
+    for lo in range(0, len(levels), block_size):
+        hi = min(lo + block_size, len(levels))
+        rows = order[bounds[lo]:bounds[hi]]
+        parts.append(_Part(name, levels[lo:hi], codes[rows] - lo, tidx[rows], E[rows], (deaths, at_risk, hazard),
+                           whole=whole))
+
+    if whole:
+        return parts, parts[0]
+
+    rows = order[bounds[0]:]
+    return parts, _Part(name, levels, codes[rows], tidx[rows], E[rows], (deaths, at_risk, hazard), whole=False)
+
+def _pack(parts, block_size):
+    """ Groups the parts into jobs of about block_size cohorts """
+    tasks, current, size = [], [], 0
+    for part in parts:
+        if current and size + len(part.levels) > block_size:
+            tasks.append(current)
+            current, size = [], 0
+        current.append(part)
+        size += len(part.levels)
+
+    return tasks + [current] if current else tasks
+
+def _kmTask(parts, times, z, pairwise):
+    out = {"curves": [], "summary": [], "tests": [], "pairwise": []}
+    for part in parts:
+        for name, df in _kmPart(part, times, z, pairwise).items():
+            out[name].append(df)
+
+    return out
+
+def _kmPart(part, times, z, pairwise):
+    """ Curves, summary & tests of the cohorts of one part """
+    # Times of the rows of the part (all the times of the column for a whole column)
+    ut, lidx = np.unique(part.tidx, return_inverse=True)
+    g, n_times = len(part.levels), len(ut)
+
+    # Removals & deaths of each (cohort, time), at risk = removals at or after the time
+    flat = part.codes*n_times + lidx
+    C = np.bincount(flat, minlength=g*n_times).reshape(g, n_times).astype(np.float64)
+    D = np.bincount(flat, weights=part.E, minlength=g*n_times).reshape(g, n_times)
+    N = _atRisk(C)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        S = np.cumprod(1 - np.where(N > 0, D/N, 0), axis=1)
+
+        # Exponential Greenwood intervals, on log(-log S)
+        greenwood = np.cumsum(np.where(N > D, D/(N*(N - D)), 0), axis=1)
+        logS = np.log(S)
+        se = np.sqrt(greenwood)/-logS
+        lower = np.exp(-np.exp(np.log(-logS) + z*se))
+        upper = np.exp(-np.exp(np.log(-logS) - z*se))
+    lower = np.where(np.isfinite(lower), lower, S)
+    upper = np.where(np.isfinite(upper), upper, S)
+
+    gi, ti = np.nonzero(C)
+    curves = pd.DataFrame({
+        "column": part.column, "cohort": part.levels[gi], "time": times[ut[ti]], "at_risk": N[gi, ti].astype(np.int64),
+        "events": D[gi, ti].astype(np.int64), "censored": (C - D)[gi, ti].astype(np.int64),
+        "survival": S[gi, ti], "ci_lower": lower[gi, ti], "ci_upper": upper[gi, ti]})
+
+    # Median: first time the curve reaches 0.5
+    below = S <= 0.5
+    median = np.where(below.any(axis=1), times[ut[below.argmax(axis=1)]], np.inf)
+
+    # Expected deaths of each cohort under the log-rank null (same hazard as the whole column):
+    # sum of the pooled cumulative hazard at the duration of each of its rows
+    expected = np.bincount(part.codes, weights=part.hazard[part.tidx], minlength=g)
+
+    summary = pd.DataFrame({"column": part.column, "cohort": part.levels, "n": C.sum(axis=1).astype(np.int64),
+                            "events": D.sum(axis=1).astype(np.int64), "median": median, "expected": expected})
+
+    # Columns split across blocks are tested by _columnTests
+    out = {"curves": curves, "summary": summary}
+    if not part.whole:
+        return out
+
+    out["tests"] = _logRank(part, ut, N, D.sum(axis=1) - expected)
+    if pairwise:
+        out["pairwise"] = _pairwise(part, D, N)
+
+    return out
+
+def _columnTests(column, pairwise):
+    """ Log-rank tests of a column split across blocks, on the times with a death only """
+    g = len(column.levels)
+    ev = np.flatnonzero(column.deaths)
+    k = len(ev)
+
+    # At risk: a row counts at the death times up to its duration
+    pos = np.searchsorted(ev, column.tidx, side="right")
+    C = np.bincount(column.codes*(k + 1) + pos, minlength=g*(k + 1)).reshape(g, k + 1).astype(np.float64)
+    N = _atRisk(C)[:, 1:]
+
+    # Deaths (their times are death times of the column)
+    died = column.E > 0
+    flat = column.codes[died]*k + np.searchsorted(ev, column.tidx[died])
+    D = np.bincount(flat, weights=column.E[died], minlength=g*k).reshape(g, k)
+
+    expected = np.bincount(column.codes, weights=column.hazard[column.tidx], minlength=g)
+
+    out = {"curves": [], "summary": [], "tests": [_logRank(column, ev, N, D.sum(axis=1) - expected)], "pairwise": []}
+    if pairwise:
+        out["pairwise"].append(_pairwise(column, D, N))
+
+    return out
+
+def _logRank(part, ut, N, U):
+    """ Log-rank test of all the cohorts of a column (same statistic as lifelines' multivariate_logrank_test) """
+    g = len(part.levels)
+    n, d = part.at_risk[ut], part.deaths[ut]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        P = np.where(n > 0, N/n, 0)
+        w = np.where(n > 1, d*(n - d)/(n - 1), 0)
+
+    # Covariance of the observed - expected deaths
+    Pw = P*w
+    V = np.diag(Pw.sum(axis=1)) - Pw @ P.T
+    stat = float(U @ np.linalg.pinv(V) @ U) if g > 1 else np.NaN
+
+    return pd.DataFrame({"column": [part.column], "n_cohorts": [g], "test_statistic": [stat], "dof": [g - 1],
+                         "p_value": [stats.chi2.sf(stat, g - 1) if g > 1 else np.NaN]})
+
+def _pairwise(part, D, N):
+    """ Log-rank test of every pair of cohorts of a column, PAIR_BATCH pairs at a time """
+    a, b = np.triu_indices(len(part.levels), 1)
+
+    stat = np.empty(len(a))
+    for lo in range(0, len(a), PAIR_BATCH):
+        ia, ib = a[lo:lo + PAIR_BATCH], b[lo:lo + PAIR_BATCH]
+        na, nb = N[ia], N[ib]
+        n, d = na + nb, D[ia] + D[ib]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = np.where(n > 0, na*d/n, 0).sum(axis=1)
+            var = np.where(n > 1, na*nb*d*(n - d)/(n*n*(n - 1)), 0).sum(axis=1)
+            stat[lo:lo + PAIR_BATCH] = (D[ia].sum(axis=1) - expected)**2/var
+
+    return pd.DataFrame({"column": part.column, "cohort_a": part.levels[a], "cohort_b": part.levels[b],
+                         "test_statistic": stat, "p_value": stats.chi2.sf(stat, 1)})
+
+def _atRisk(C):
+    """ Reverse cumulative sum along the times """
+    return np.cumsum(C[..., ::-1], axis=-1)[..., ::-1]
+
+def _byColumn(df, names):
+    """ Rows ordered by segmentation column (stable within a column) """
+    if not len(df):
+        return df
+    order = np.argsort(df["column"].map({name: k for k, name in enumerate(names)}).values, kind="stable")
+
+    return df.iloc[order].reset_index(drop=True)
+
+def _concat(frames):
+    frames = [f for part in frames for f in part]
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
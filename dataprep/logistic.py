@@ -0,0 +1,215 @@
+import os
+import tempfile
+import time
+import numpy as np
+from scipy.special import expit
+
+def balancedWeights(y):
+    """ Sample weights of class_weight='balanced': n_samples / (n_classes * count of the class) """
+    y = np.asarray(y).ravel()
+    classes, counts = np.unique(y, return_counts=True)
+    weights = len(y) / (len(classes) * counts)
+
+    return weights[np.searchsorted(classes, y)]
+
+def fitLogistic(X, y, sample_weight=None, coef_init=None, tol=1e-8, max_iter=100, callback=None):
+    """ Unpenalized logistic regression by Newton's method (IRLS)
+
+        Same model as LogisticRegression(penalty='none') with an intercept. A good
+        starting point (coef_init, e.g. the coefficients of a model with one feature
+        less, and 0 for the new one) usually converges in 2-4 Newton steps. Steps that
+        lower the log-likelihood are halved (as the PIRLS of gam.py), so a far off
+        starting point, e.g. a stale previous model, still converges.
+
+    Arguments:
+        X {numpy array} -- feature matrix
+        y {numpy array} -- response variable (0/1)
+
+    Keyword Arguments:
+        sample_weight {numpy array} -- weight of each row, see balancedWeights (default: {None})
+        coef_init {numpy array} -- starting [intercept, coef...] (default: {zeros})
+        tol {float} -- stop when the largest Newton step is below tol (default: {1e-8})
+        max_iter {int} -- maximum Newton steps (default: {100})
+        callback {callable} -- called after each step with a diagnostics dictionary, see _diagnostics (default: {None})
+
+    Returns:
+        beta [numpy array] -- [intercept, coef...], n_iter [int], converged [bool]
+    """
+    n, p = X.shape
+    if n == 0:
+        raise ValueError("fitLogistic needs at least one row")
+    y = np.asarray(y, dtype=np.float64).ravel()
+    w = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    Z = np.empty((n, p + 1))
+    Z[:, 0] = 1
+    Z[:, 1:] = X
+
+    def objective(beta):
+        return np.sum(w*_loglik(y, Z @ beta))
+
+    beta = np.zeros(p + 1) if coef_init is None else np.array(coef_init, dtype=np.float64)
+    current = objective(beta)
+
+    converged = False
+    for n_iter in range(1, max_iter + 1):
+        mu = expit(Z @ beta)
+        grad = Z.T @ (w*(y - mu))
+        H = (Z*(w*mu*(1 - mu))[:, None]).T @ Z
+        step = newtonStep(H, grad)
+
+        # Step halving keeps the log-likelihood increasing
+        for _ in range(30):
+            new = objective(beta + step)
+            if new >= current - 1e-12*abs(current):
+                break
+            step = step/2
+
+        if callback is not None:
+            callback(_diagnostics(n_iter, step, grad, current))
+        beta, current = beta + step, new
+
+        if np.max(np.abs(step)) < tol:
+            converged = True
+            break
+
+    return beta, n_iter, converged
+
+def fitLogisticChunks(chunks, coef_init=None, class_weight="balanced", tol=1e-8, max_iter=100, callback=None):
+    """ fitLogistic over data streamed in chunks (exact Newton steps, memory bounded by one chunk)
+
+        Each Newton step is one pass over the chunks accumulating the gradient and the
+        Hessian. They are accumulated per class so the balanced class weights, which
+        need the class counts of the whole data, are applied at the end of the pass.
+        The pass also gives the log-likelihood of the last step: when it went down, the
+        step is halved and the pass repeated before the next Newton step (step halving
+        without extra passes while the steps are good).
+
+    Arguments:
+        chunks {callable} -- returns a new iterator of (X, y) chunks on every call, e.g. spoolChunks(...)
+
+    Keyword Arguments:
+        coef_init {numpy array} -- starting [intercept, coef...], e.g. the previous model (default: {zeros})
+        class_weight {string} -- "balanced" or None (default: {"balanced"})
+        tol, max_iter, callback -- same as fitLogistic
+
+    Returns:
+        beta [numpy array] -- [intercept, coef...], n_iter [int], converged [bool]
+    """
+    beta = None if coef_init is None else np.array(coef_init, dtype=np.float64)
+    step, current, halvings = None, None, 0
+
+    converged = False
+    n_iter = 0
+    while n_iter < max_iter:
+        grad, H, ll, counts = {}, {}, {}, {}
+        for X, y in chunks():
+            y = np.asarray(y, dtype=np.float64).ravel()
+            Z = np.empty((len(y), X.shape[1] + 1))
+            Z[:, 0] = 1
+            Z[:, 1:] = X
+            if beta is None:
+                beta = np.zeros(Z.shape[1])
+
+            eta = Z @ beta
+            mu = expit(eta)
+            for c in (0, 1):
+                m = y == c
+                if not m.any():
+                    continue
+                Zc, muc = Z[m], mu[m]
+                grad[c] = grad.get(c, 0) + Zc.T @ (c - muc)
+                H[c] = H.get(c, 0) + (Zc*(muc*(1 - muc))[:, None]).T @ Zc
+                ll[c] = ll.get(c, 0) + np.sum(_loglik(float(c), eta[m]))
+                counts[c] = counts.get(c, 0) + int(m.sum())
+
+        if not counts:
+            raise ValueError("fitLogisticChunks got no data: the chunks iterator is empty")
+
+        n = sum(counts.values())
+        w = {c: (n/(len(counts)*counts[c]) if class_weight == "balanced" else 1.0) for c in counts}
+        loglik = sum(w[c]*ll[c] for c in counts)
+
+        # Step halving: the last step lowered the log-likelihood, take back half of it
+        if step is not None and loglik < current - 1e-12*abs(current) and halvings < 30:
+            step = step/2
+            beta -= step
+            halvings += 1
+            continue
+
+        n_iter += 1
+        g = sum(w[c]*grad[c] for c in counts)
+        step = newtonStep(sum(w[c]*H[c] for c in counts), g)
+        beta += step
+        current, halvings = loglik, 0
+
+        if callback is not None:
+            callback(_diagnostics(n_iter, step, g, loglik))
+
+        if np.max(np.abs(step)) < tol:
+            converged = True
+            break
+
+    return beta, n_iter, converged
+
+def spoolChunks(chunks, directory=None):
+    """ Writes streamed (X, y) chunks once to disk and returns a callable re-reading them as memmaps
+
+        Lets fitLogisticChunks make several passes over data that is expensive to
+        produce (e.g. cleanData_chunked + model_prep) without holding it in memory.
+
+    Arguments:
+        chunks {iterable} -- (X, y) chunks
+
+    Keyword Arguments:
+        directory {string} -- folder of the spool files (default: {a new temporary folder})
+
+    Returns:
+        reader [callable] -- returns an iterator of (X, y) memmap chunks, same boundaries as the input
+    """
+    directory = directory or tempfile.mkdtemp(prefix="logistic_spool_")
+    xpath, ypath = os.path.join(directory, "X.bin"), os.path.join(directory, "y.bin")
+
+    sizes, n_features = [], None
+    with open(xpath, "wb") as fx, open(ypath, "wb") as fy:
+        for X, y in chunks:
+            X = np.ascontiguousarray(X, dtype=np.float64)
+            n_features = X.shape[1]
+            fx.write(X.tobytes())
+            fy.write(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+            sizes.append(len(X))
+
+    n = sum(sizes)
+    bounds = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+
+    def reader():
+        if n == 0:
+            return
+        X = np.memmap(xpath, dtype=np.float64, mode="r", shape=(n, n_features))
+        y = np.memmap(ypath, dtype=np.float64, mode="r", shape=(n,))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            yield X[a:b], y[a:b]
+
+    reader.directory = directory
+    reader.n_rows = n
+
+    return reader
+
+def predictLogistic(X, beta):
+    """ Predicted probability of a fitLogistic model """
+    return expit(beta[0] + X @ beta[1:])
+
+def _loglik(y, eta):
+    """ Log-likelihood of each row from the linear predictor (no clipping of the probabilities) """
+    return y*eta - np.logaddexp(0, eta)
+
+def _diagnostics(n_iter, step, grad, loglik):
+    """ Convergence diagnostics of one Newton step """
+    return {"iter": n_iter, "max_step": float(np.max(np.abs(step))), "grad_norm": float(np.linalg.norm(grad)),
+            "loglik": float(loglik), "time": time.perf_counter()}
+
+def newtonStep(H, g):
+    """ Newton step H^-1 g (also used by the penalized IRLS of gam.py), least squares when the Hessian is singular (e.g. separable data) """
+    try:
+        return np.linalg.solve(H, g)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(H, g, rcond=None)[0]
@@ -1,121 +1,318 @@
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import auc
-from sklearn.metrics import roc_curve
-from sklearn.preprocessing import PolynomialFeatures
-from scipy import interp
-from imblearn.over_sampling import SMOTE
-
-def model_prep(df, xcols, ycol, standardize=True, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[]):
+
+# scipy, sklearn & imblearn are imported by the functions that use them, so building a
+# feature matrix (training or scoring) does not load them
+
+# Custom Python Files
+from dataprep.dataPrep import cleanData_chunked
+from dataprep.featureSpec import FeaturePlan, FeatureSpec
+from dataprep.instrumentation import stage
+
+def model_prep(df, xcols, ycol, standardize=True, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[], compact=False, sparse=False):
     """ Prepares a feature matrix and response var from a dataset 
+
+        df and xcols are not modified. A list of xcols (with termDict & interactionList)
+        or a FeatureSpec is compiled into a FeaturePlan that builds the matrix in one pass.
     
     Arguments:
         df {dataframe} -- dataframe to pass in for modeling
-        xcols {any} -- columns to use as independent var, or ALL if you don't want filtering
+        xcols {any} -- columns to use as independent var, a FeatureSpec/FeaturePlan (its terms are used instead of termDict & interactionList), or ALL if you don't want filtering
         ycol {any} -- columns to use as response
         standardize -- True by default. Whether you would like to standardize the dataset
+        compact -- False by default. Build a float32 matrix with the one-hot columns filled from categorical codes
+        sparse -- False by default. Build a scipy.sparse CSR matrix (for wide xcols="ALL" baselines), standardizing only scales the columns
     
     Returns:
         X (feature matrix), y (response variable), xcolnames
     """
-    # Set up response variable 
-    y = df[ycol].values.astype(np.int)
+    with stage("model_prep", pipeline="model_prep", data=df) as total:
+        # Set up response variable 
+        y = df[ycol].values.astype(np.int)
+
+        if isinstance(xcols, (FeatureSpec, FeaturePlan)) or (xcols != "ALL" and not sparse):
+            # Compiled feature plan, filled in one pass
+            plan = feature_plan(df, xcols, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
+            X = plan.transform(df, dtype=np.float32 if compact else np.float64)
+            xcolnames = plan.names
+        elif sparse:
+            # One-hot straight from categorical codes into a CSR matrix
+            X = feature_columns(df, xcols, ycol, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
+            with stage("sparse_matrix", pipeline="model_prep", data=X) as st:
+                X, xcolnames = sparse_matrix(X, dtype=np.float32 if compact else np.float64)
+                st.output(X)
+        elif compact:
+            # One-hot straight from categorical codes into a float32 matrix
+            X = feature_columns(df, xcols, ycol, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
+            with stage("compact_matrix", pipeline="model_prep", data=X) as st:
+                X, xcolnames = compact_matrix(X)
+                st.output(X)
+        else:
+            # Build the one-hot encoded feature dataframe
+            X = feature_frame(df, xcols, ycol, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
+
+            # save colnames
+            xcolnames = X.columns
+
+            # Build Feature Matrix
+            with stage("to_matrix", pipeline="model_prep", data=X) as st:
+                X = X.values.astype(np.float)
+                st.output(X)
+
+        # Control what we send back based on if we are standardizing or not
+        if standardize:
+            with stage("standardize", pipeline="model_prep", data=X):
+                if sparse:
+                    # Centering would fill in the zeros, so sparse matrices are only scaled
+                    X, X_mean, X_std = scale_sparse(X)
+                else:
+                    # statistics in float64 even for a float32 matrix
+                    X_mean = X.mean(axis=0, dtype=np.float64)
+                    X_std = X.std(axis=0, dtype=np.float64)
+                    if compact:
+                        X -= X_mean.astype(X.dtype)
+                        X /= X_std.astype(X.dtype)
+                    else:
+                        X = (X - X_mean)/X_std
+
+        total.output(X)
 
-    # Add in higher level terms if specified
-    if higherTerms:
-        for i in termDict:
-            for j in range(termDict[i]-1):
-                name = i + "_" + str(j+2) # Create name for dataset
+    if standardize:
+        return X, y, X_mean, X_std, xcolnames
+    else:
+        return X, y, xcolnames
 
-                df[name] = df[i]**(j+2) # Transform the original variable to desired higher term
+def model_prep_chunked(filepath, xcols, ycol, boxcox=False, chunksize=100000, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[], dtype=np.float64, as_of=None):
+    """ Streams the unstandardized feature matrix & response of a raw export, one chunk at a time
 
-                xcols.append(name) # add the newly created column to filter list
+        cleanData_chunked (global imputation values) followed by a compiled FeaturePlan,
+        so every chunk has the same columns as model_prep(cleanData(filepath), ...).
 
-    # Add in interaction level terms if specified
-    if interactionTerms:
-        for i in interactionList:
-            name = i[0] + ' ' + i[1] # create the column name
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+        xcols {list, FeatureSpec or FeaturePlan} -- columns to use as independent var (pass a FeaturePlan compiled on the full data for categorical xcols)
+        ycol {any} -- columns to use as response
 
-            df[name] = df[i[0]]*df[i[1]] # create the interaction column
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        chunksize {int} -- number of rows read per chunk (default: {100000})
+        dtype {numpy dtype} -- matrix dtype (default: {np.float64})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
 
-            xcols.append(name) # add the newly created column to filter list
+    Yields:
+        X (feature matrix), y (response variable) of each chunk
+    """
+    plan = xcols if isinstance(xcols, FeaturePlan) else None
 
-    # Filter independent variables if needed
-    if xcols != "ALL":
-        X = df[xcols].copy()
-    else:
-        X = df.drop(ycol, axis=1, inplace=False)
+    for df in cleanData_chunked(filepath, boxcox=boxcox, chunksize=chunksize, as_of=as_of):
+        if plan is None:
+            spec = xcols if isinstance(xcols, FeatureSpec) else FeatureSpec(xcols)
+            categorical = [c for c in spec.xcols if df[c].dtype == object or isinstance(df[c].dtype, pd.CategoricalDtype)]
+            if categorical:
+                raise ValueError("Categorical xcols %s need a FeaturePlan compiled on the full data, the levels of one chunk are not enough" % categorical)
+            plan = feature_plan(df, xcols, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
+
+        yield plan.transform(df, dtype=dtype), df[ycol].values.astype(np.int64)
+
+def feature_plan(df, xcols, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[]):
+    """ Compiled FeaturePlan for a list of xcols and model_prep's term arguments
+
+    Arguments:
+        df {dataframe} -- training data (freezes the categorical levels)
+        xcols {list, FeatureSpec or FeaturePlan} -- columns to use as independent var
+
+    Returns:
+        plan [FeaturePlan]
+    """
+    if isinstance(xcols, FeaturePlan):
+        return xcols
+    if not isinstance(xcols, FeatureSpec):
+        xcols = FeatureSpec(xcols, termDict=termDict if higherTerms else None,
+                            interactionList=interactionList if interactionTerms else None)
+
+    return xcols.compile(df)
+
+def feature_frame(df, xcols, ycol, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[]):
+    """ Builds the one-hot encoded feature dataframe used by model_prep
+
+    Arguments:
+        df {dataframe} -- dataframe to pass in for modeling
+        xcols {any} -- columns to use as independent var, or ALL if you don't want filtering
+        ycol {any} -- columns to use as response
+
+    Returns:
+        X {dataframe} -- feature dataframe, before conversion to a matrix
+    """
+    X = feature_columns(df, xcols, ycol, higherTerms=higherTerms, termDict=termDict, interactionTerms=interactionTerms, interactionList=interactionList)
 
     # Convert categoricals to one-hot encoding
-    X = pd.get_dummies(X)
+    with stage("get_dummies", pipeline="model_prep", data=X) as st:
+        X = pd.get_dummies(X)
+        st.output(X)
 
     # drop callcycle is being used for dummy encoding
     if 'callcycle_Yearly' in X.columns:
         X.drop("callcycle_Yearly", axis=1, inplace=True)
 
-    # save colnames
-    xcolnames = X.columns
+    return X
 
-    # Build Feature Matrix
-    X = X.values.astype(np.float)
+def feature_columns(df, xcols, ycol, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[]):
+    """ Filters the feature columns and adds the higher level & interaction terms (before one-hot encoding)
 
-    # Control what we send back based on if we are standardizing or not
-    if standardize:
-        X_mean = X.mean(axis=0)
-        X_std = X.std(axis=0)
-        X = (X - X_mean)/X_std
+        df and xcols are not modified.
 
-        return X, y, X_mean, X_std, xcolnames
-    else:
-        return X, y, xcolnames
+    Arguments:
+        df {dataframe} -- dataframe to pass in for modeling
+        xcols {any} -- columns to use as independent var, or ALL if you don't want filtering
+        ycol {any} -- columns to use as response
+
+    Returns:
+        X {dataframe} -- feature columns, categoricals not yet encoded
+    """
+    with stage("feature_terms", pipeline="model_prep", data=df):
+        # Filter independent variables if needed
+        if xcols != "ALL":
+            X = df[list(xcols)].copy()
+        else:
+            X = df.drop(ycol, axis=1, inplace=False)
+
+        # Add in higher level terms if specified
+        if higherTerms:
+            for i in termDict:
+                for j in range(termDict[i]-1):
+                    name = i + "_" + str(j+2) # Create name for dataset
+
+                    X[name] = df[i].astype(np.float64)**(j+2) # Transform the original variable to desired higher term (in float, compact int8 columns would overflow)
+
+        # Add in interaction level terms if specified
+        if interactionTerms:
+            for i in interactionList:
+                name = i[0] + ' ' + i[1] # create the column name
+
+                X[name] = df[i[0]].astype(np.float64)*df[i[1]].astype(np.float64) # create the interaction column
+
+    return X
+
+def compact_matrix(X, dtype=np.float32):
+    """ Feature matrix with the one-hot columns filled straight from categorical codes
+
+        Same columns and order as pd.get_dummies + dropping callcycle_Yearly, but written
+        into one preallocated matrix (float32 by default) without the intermediate
+        dummy dataframe.
 
-def plotROCCurve(clf_class, X, y, axis, color, random_state, **kwargs):
-    """Takes in a calssification model and data set and returns a plotted ROC Curve
-    
     Arguments:
-        clf_class -- classifiction model
-        X {numpy array} -- feature matrix to predict response variable, y
-        y {numpy array} -- response variable
-        axis {var} -- ax variable to plot the figure on
-        random_state --- For reproducibility
+        X {dataframe} -- feature columns (output of feature_columns)
+
+    Keyword Arguments:
+        dtype {numpy dtype} -- matrix dtype (default: {np.float32})
+
+    Returns:
+        X [numpy array], xcolnames [pandas index]
     """
+    numeric, names, blocks = _one_hot_layout(X)
 
-    # KFold
-    kf = StratifiedKFold(n_splits=3,shuffle=True,random_state=random_state)
+    M = np.zeros((len(X), len(names)), dtype=dtype)
+    for j, c in enumerate(numeric):
+        M[:, j] = X[c].values
 
-    # Data Range
-    mean_fpr = np.linspace(0, 1, 100)
+    for rows, cols in blocks:
+        M[rows, cols] = 1
 
-    # initialization params
-    tprs = []
+    return M, pd.Index(names)
 
-    for train_index,test_index in kf.split(X,y):
-        xtr,xvl = X[train_index],X[test_index]
-        ytr,yvl = y[train_index],y[test_index]
+def sparse_matrix(X, dtype=np.float64):
+    """ scipy.sparse CSR feature matrix, one-hot columns built straight from categorical codes
 
-        # fit models
-        clf = clf_class(**kwargs)
-        clf.fit(xtr,ytr)
+        Same columns and order as pd.get_dummies + dropping callcycle_Yearly. Only the
+        non-zero numeric values and one entry per row and categorical are stored, so
+        wide xcols="ALL" matrices stay small.
 
-        #get prediction data
-        pred_test = clf.predict_proba(xvl)[:,1]
+    Arguments:
+        X {dataframe} -- feature columns (output of feature_columns)
 
-        # ROC Curve Plotting
-        fpr, tpr, _ = roc_curve(yvl, pred_test)
-        interp_tpr = interp(mean_fpr, fpr, tpr)
-        interp_tpr[0] = 0.0
-        tprs.append(interp_tpr)
+    Keyword Arguments:
+        dtype {numpy dtype} -- matrix dtype (default: {np.float64})
 
-    # Return mean true positive rate & AUC
-    mean_tpr = np.mean(tprs, axis=0)
-    mean_auc = auc(mean_fpr, mean_tpr)
+    Returns:
+        X [scipy.sparse csr_matrix], xcolnames [pandas index]
+    """
+    from scipy import sparse as sp
 
-    # Plot object
-    axis.plot(mean_fpr, mean_tpr, color=color,
-    label=r'%s ROC (AUC = %0.2f)' % (clf_class.__name__, mean_auc),lw=2, alpha=.8)
+    numeric, names, blocks = _one_hot_layout(X)
 
-def plotROCCurve_smote(clf_class, X, y, axis, color, random_state, **kwargs):
+    rows, cols, vals = [], [], []
+    for j, c in enumerate(numeric):
+        v = X[c].values.astype(dtype)
+        nz = np.flatnonzero(v)
+        rows.append(nz)
+        cols.append(np.full(len(nz), j))
+        vals.append(v[nz])
+
+    for r, k in blocks:
+        rows.append(r)
+        cols.append(k)
+        vals.append(np.ones(len(r), dtype=dtype))
+
+    M = sp.csr_matrix((np.concatenate(vals) if vals else np.empty(0, dtype=dtype),
+                       (np.concatenate(rows) if rows else np.empty(0, dtype=int),
+                        np.concatenate(cols) if cols else np.empty(0, dtype=int))),
+                      shape=(len(X), len(names)), dtype=dtype)
+
+    return M, pd.Index(names)
+
+def scale_sparse(X):
+    """ Divides each column of a sparse matrix by its standard deviation, without centering
+
+        Columns with a zero standard deviation are left as they are.
+
+    Arguments:
+        X {scipy.sparse matrix} -- feature matrix
+
+    Returns:
+        X [scipy.sparse csr_matrix], X_mean [numpy array] (zeros, nothing is subtracted), X_std [numpy array]
+    """
+    from scipy import sparse as sp
+
+    X = sp.csr_matrix(X)
+
+    # statistics in float64 even for a float32 matrix
+    mean = np.asarray(X.mean(axis=0, dtype=np.float64)).ravel()
+    sq = np.asarray(X.multiply(X).mean(axis=0, dtype=np.float64)).ravel()
+    X_std = np.sqrt(np.maximum(sq - mean**2, 0))
+    scale = np.where(X_std > 0, X_std, 1.0)
+
+    X.data /= scale[X.indices].astype(X.dtype)
+
+    return X, np.zeros(X.shape[1]), scale
+
+def _one_hot_layout(X):
+    """ Numeric columns, output column names (get_dummies order) and the (rows, cols) of the ones of each categorical """
+    encoded = [c for c in X.columns if X[c].dtype == object or isinstance(X[c].dtype, pd.CategoricalDtype)]
+    numeric = [c for c in X.columns if c not in encoded]
+
+    # Column names in get_dummies order: numeric columns, then each encoded column's categories
+    names = list(numeric)
+    blocks = []
+    for c in encoded:
+        cat = X[c] if isinstance(X[c].dtype, pd.CategoricalDtype) else X[c].astype("category")
+        index = np.full(len(cat.cat.categories), -1)
+        for k, value in enumerate(cat.cat.categories):
+            name = "%s_%s" % (c, value)
+            if name == "callcycle_Yearly":
+                continue
+            index[k] = len(names)
+            names.append(name)
+        if not len(index):
+            continue
+
+        codes = cat.cat.codes.values
+        cols = np.where(codes >= 0, index[codes], -1)
+        rows = np.flatnonzero(cols >= 0)
+        blocks.append((rows, cols[rows]))
+
+    return numeric, names, blocks
+
+def plotROCCurve(clf_class, X, y, axis, color, random_state, **kwargs):
     """Takes in a calssification model and data set and returns a plotted ROC Curve
     
     Arguments:
@@ -124,42 +321,46 @@ def plotROCCurve_smote(clf_class, X, y, axis, color, random_state, **kwargs):
         y {numpy array} -- response variable
         axis {var} -- ax variable to plot the figure on
         random_state --- For reproducibility
-    """
 
-    # KFold
-    kf = StratifiedKFold(n_splits=3,shuffle=True,random_state=random_state)
+    Returns:
+        results [CVResults] -- out-of-fold predictions, for further metrics without refitting (this used
+                               to return None; the folds, fold AUCs and plotted curve are unchanged)
+    """
+    from dataprep.crossValidation import crossValidate
 
-    # Data Range
-    mean_fpr = np.linspace(0, 1, 100)
+    name = clf_class.__name__
 
-    # initialization params
-    tprs = []
+    # 3 fold CV, fitted once (see crossValidation.crossValidate)
+    results = crossValidate({name: clf_class(**kwargs)}, X, y, n_splits=3, random_state=random_state)
 
-    for train_index,test_index in kf.split(X,y):
-        xtr,xvl = X[train_index],X[test_index]
-        ytr,yvl = y[train_index],y[test_index]
+    # Plot object
+    results.plotROC(name, axis, color)
 
-        # Use SMOTE to boost training set
-        sm = SMOTE(random_state = 33)
-        X_train_new, y_train_new = sm.fit_sample(xtr, ytr.ravel())
+    return results
 
-        # fit models
-        clf = clf_class(**kwargs)
-        clf.fit(X_train_new,y_train_new)
+def plotROCCurve_smote(clf_class, X, y, axis, color, random_state, **kwargs):
+    """Takes in a calssification model and data set and returns a plotted ROC Curve
+    
+    Arguments:
+        clf_class -- classifiction model
+        X {numpy array} -- feature matrix to predict response variable, y
+        y {numpy array} -- response variable
+        axis {var} -- ax variable to plot the figure on
+        random_state --- For reproducibility
 
-        #get prediction data
-        pred_test = clf.predict_proba(xvl)[:,1]
+    Returns:
+        results [CVResults] -- out-of-fold predictions, for further metrics without refitting (this used
+                               to return None; the folds, fold AUCs and plotted curve are unchanged)
+    """
+    from dataprep.crossValidation import crossValidate
 
-        # ROC Curve Plotting
-        fpr, tpr, _ = roc_curve(yvl, pred_test)
-        interp_tpr = interp(mean_fpr, fpr, tpr)
-        interp_tpr[0] = 0.0
-        tprs.append(interp_tpr)
+    name = clf_class.__name__
 
-    # Return mean true positive rate & AUC
-    mean_tpr = np.mean(tprs, axis=0)
-    mean_auc = auc(mean_fpr, mean_tpr)
+    # 3 fold CV, SMOTE on each training fold (see imbalance.resampledFold)
+    results = crossValidate({name: clf_class(**kwargs)}, X, y, n_splits=3, random_state=random_state,
+                            resample="smote", seed=33)
 
     # Plot object
-    axis.plot(mean_fpr, mean_tpr, color=color,
-    label=r'%s ROC (AUC = %0.2f) SMOTE' % (clf_class.__name__, mean_auc),lw=2, alpha=.8)
\ No newline at end of file
+    results.plotROC(name, axis, color, suffix=" SMOTE")
+
+    return results
\ No newline at end of file
@@ -0,0 +1,285 @@
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.cache import dataKey
+from dataprep.scoring import ChurnModel
+
+# Fitted models, one set of files per key
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "models")
+MAX_BYTES = 256 * 1024**2
+
+# Sources the feature matrix and the scoring depend on (the cleaned data is hashed itself)
+CODE_FILES = ["featureSpec.py", "modelPrep.py", "preprocessor.py", "scoring.py"]
+
+class ModelArtifact:
+    """ Model read back from the store
+
+    Arguments:
+        model {estimator or ChurnModel} -- fitted model
+        xcolnames {list} -- feature names, in the order of the coefficients
+        meta {dictionary} -- stored metadata (key, config, created, files ...)
+    """
+
+    def __init__(self, model, xcolnames, meta):
+        self.model = model
+        self.xcolnames = xcolnames
+        self.meta = meta
+
+    @property
+    def key(self):
+        return self.meta["key"]
+
+def modelKey(data, config, model=None):
+    """ Content address of a fitted model
+
+        The key is built from:
+            - the cleaned data: a dataframe is hashed row by row (values, index, column
+              names & dtypes), a string is taken as a data key already (e.g. cache.cacheKey)
+            - the training configuration (feature spec, response, flags ...)
+            - the estimator class and its parameters, and the version of its library
+            - the featureSpec/modelPrep/preprocessor/scoring sources
+        Any change to one of these gives a new key, so a stored model is never returned
+        for different data or settings.
+
+    Arguments:
+        data {pandas dataframe or string} -- cleaned training data, or its content key
+        config {dictionary} -- training configuration, values json serializable or with a stable repr (e.g. FeatureSpec)
+
+    Keyword Arguments:
+        model {estimator} -- unfitted estimator (default: {None})
+
+    Returns:
+        key [string] -- hex digest
+    """
+    h = hashlib.sha256()
+    h.update((data if isinstance(data, str) else dataKey(data)).encode())
+    h.update(json.dumps(config, sort_keys=True, default=repr).encode())
+
+    if model is not None:
+        library = sys.modules.get(type(model).__module__.split(".")[0])
+        params = model.get_params(deep=False) if hasattr(model, "get_params") else {}
+        h.update(json.dumps({"class": _className(model), "params": params, "version": getattr(library, "__version__", None)},
+                            sort_keys=True, default=repr).encode())
+
+    h.update(codeVersion().encode())
+
+    return h.hexdigest()
+
+def codeVersion():
+    """ sha256 of the CODE_FILES sources """
+    h = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(folder, name), "rb") as fp:
+            h.update(fp.read())
+
+    return h.hexdigest()
+
+def saveModel(key, model, xcolnames=None, info=None, model_dir=MODEL_DIR, max_bytes=MAX_BYTES):
+    """ Stores a fitted model under key
+
+        Compact, quick to load files:
+            - key.npz: the numeric arrays (coefficients, intercept, classes ... of an sklearn
+              estimator, coef & intercept of a ChurnModel), uncompressed
+            - key.pkl: only what is not arrays: the frozen ChurnPreprocessor of a ChurnModel,
+              or the whole model when it has fitted attributes other than arrays & numbers
+            - key.json: class, parameters, scalar attributes, xcolnames & info, written last
+              so an entry is only visible once complete
+        The least recently used entries are then evicted past max_bytes.
+
+    Arguments:
+        key {string} -- modelKey of the training data & configuration
+        model {estimator or ChurnModel} -- fitted model
+
+    Keyword Arguments:
+        xcolnames {list} -- feature names (default: {None})
+        info {dictionary} -- extra metadata shown by listModels, json serializable (default: {None})
+        model_dir {string} -- store folder (default: {dataprep/.cache/models})
+        max_bytes {int} -- size limit of the store (default: {256MB})
+
+    Returns:
+        key [string]
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    kind, arrays, fields, obj = _split(model)
+
+    files = []
+    if arrays:
+        files.append(key + ".npz")
+        _write(os.path.join(model_dir, key + ".npz"), lambda fp: np.savez(fp, **arrays))
+    if obj is not None:
+        files.append(key + ".pkl")
+        _write(os.path.join(model_dir, key + ".pkl"), lambda fp: pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL))
+
+    meta = dict(fields, key=key, kind=kind, files=files, info=info or {},
+                xcolnames=None if xcolnames is None else [str(c) for c in xcolnames],
+                created=datetime.datetime.now().isoformat(timespec="seconds"))
+    meta_path = os.path.join(model_dir, key + ".json")
+    with open(meta_path + ".tmp", "w") as fp:
+        json.dump(meta, fp)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    evictModels(model_dir, max_bytes)
+
+    return key
+
+def loadModel(key, model_dir=MODEL_DIR):
+    """ Reads a stored model, returns None on a miss
+
+    Arguments:
+        key {string} -- modelKey of the training data & configuration
+
+    Keyword Arguments:
+        model_dir {string} -- store folder (default: {dataprep/.cache/models})
+
+    Returns:
+        artifact [ModelArtifact or None]
+    """
+    meta_path = os.path.join(model_dir, key + ".json")
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, "r") as fp:
+        meta = json.load(fp)
+    paths = [os.path.join(model_dir, f) for f in meta["files"]]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+
+    arrays, obj = {}, None
+    for path in paths:
+        if path.endswith(".npz"):
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        else:
+            with open(path, "rb") as fp:
+                obj = pickle.load(fp)
+
+    if meta["kind"] == "ChurnModel":
+        model = ChurnModel(obj, arrays["coef"], arrays["intercept"])
+    elif meta["kind"] == "estimator":
+        module, name = meta["class"].rsplit(".", 1)
+        model = getattr(importlib.import_module(module), name)(**meta["params"])
+        for attr, value in list(arrays.items()) + list(meta["attributes"].items()):
+            setattr(model, attr, value)
+    else:
+        model = obj
+
+    # Mark as recently used for eviction
+    os.utime(meta_path, None)
+
+    return ModelArtifact(model, meta["xcolnames"], meta)
+
+def listModels(model_dir=MODEL_DIR):
+    """ Lists the stored models
+
+    Keyword Arguments:
+        model_dir {string} -- store folder (default: {dataprep/.cache/models})
+
+    Returns:
+        entries [pandas dataframe] -- key, kind, class, n_features, info, bytes, created and last access of each model
+    """
+    rows = []
+    for meta_path in _entries(model_dir):
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        rows.append({"key": meta["key"], "kind": meta["kind"], "class": meta.get("class"),
+                     "n_features": len(meta["xcolnames"]) if meta["xcolnames"] is not None else None,
+                     "info": meta["info"], "bytes": _bytes(model_dir, meta),
+                     "created": pd.Timestamp(meta["created"]),
+                     "last_used": datetime.datetime.fromtimestamp(os.path.getmtime(meta_path))})
+
+    columns = ["key", "kind", "class", "n_features", "info", "bytes", "created", "last_used"]
+
+    return pd.DataFrame(rows, columns=columns).sort_values("last_used", ascending=False).reset_index(drop=True)
+
+def evictModels(model_dir=MODEL_DIR, max_bytes=MAX_BYTES):
+    """ Removes the least recently used models until the store is under max_bytes
+
+    Keyword Arguments:
+        model_dir {string} -- store folder (default: {dataprep/.cache/models})
+        max_bytes {int} -- size limit of the store (default: {256MB})
+
+    Returns:
+        removed [list] -- keys of the removed models
+    """
+    entries = []
+    for meta_path in _entries(model_dir):
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        entries.append((os.path.getmtime(meta_path), meta["key"], _bytes(model_dir, meta)))
+
+    total = sum(e[2] for e in entries)
+    removed = []
+
+    # Oldest access first
+    for _, key, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        removeModel(key, model_dir)
+        total -= size
+        removed.append(key)
+
+    return removed
+
+def removeModel(key, model_dir=MODEL_DIR):
+    """ Removes one stored model (metadata first, so it is never half visible) """
+    meta_path = os.path.join(model_dir, key + ".json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for ext in (".npz", ".pkl"):
+        path = os.path.join(model_dir, key + ext)
+        if os.path.exists(path):
+            os.remove(path)
+
+def clearModels(model_dir=MODEL_DIR):
+    """ Removes every stored model """
+    return evictModels(model_dir, max_bytes=-1)
+
+def _split(model):
+    """ Kind, arrays (npz), json fields & pickled object of a model """
+    if isinstance(model, ChurnModel):
+        return "ChurnModel", {"coef": model.coef, "intercept": np.array(model.intercept)}, {}, model.preprocessor
+
+    # sklearn estimator whose fitted attributes are all numeric arrays & numbers: no pickle
+    fitted = {k: v for k, v in vars(model).items() if k.endswith("_") and not k.startswith("_")}
+    arrays = {k: v for k, v in fitted.items() if isinstance(v, np.ndarray) and v.dtype.kind in "biuf"}
+    numbers = {k: v.item() if isinstance(v, np.generic) else v for k, v in fitted.items()
+               if k not in arrays and isinstance(v, (int, float, np.integer, np.floating))}
+    if hasattr(model, "get_params") and fitted and len(arrays) + len(numbers) == len(fitted):
+        try:
+            params = json.loads(json.dumps(model.get_params(deep=False)))
+        except TypeError:
+            params = None
+        if params is not None:
+            return "estimator", arrays, {"class": _className(model), "params": params, "attributes": numbers}, None
+
+    return "pickle", {}, {"class": _className(model)}, model
+
+def _className(model):
+    return "%s.%s" % (type(model).__module__, type(model).__qualname__)
+
+def _write(path, dump):
+    """ Writes a file next to its final path, then swaps it in """
+    with open(path + ".tmp", "wb") as fp:
+        dump(fp)
+    os.replace(path + ".tmp", path)
+
+def _entries(model_dir):
+    """ Metadata files of the stored models """
+    if not os.path.isdir(model_dir):
+        return []
+
+    return [os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith(".json")]
+
+def _bytes(model_dir, meta):
+    paths = [os.path.join(model_dir, meta["key"] + ".json")] + [os.path.join(model_dir, f) for f in meta["files"]]
+
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
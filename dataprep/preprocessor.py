@@ -0,0 +1,193 @@
+import pickle
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.dataPrep import asOfDate, columnlist_dict, textcols, compact_dtypes, dataPath, filterAndRename, imputation_values, missingData_imputation, variable_transformation
+from dataprep.featureSpec import FeaturePlan, FeatureSpec
+from dataprep.modelPrep import feature_frame, feature_plan, model_prep
+
+class ChurnPreprocessor:
+    """ Fit/transform wrapper around cleanData + model_prep
+
+        fit() runs the normal cleaning and feature steps once on the training data and
+        freezes everything that depends on it:
+            - imputation values (employee mean, MRR median)
+            - Box-Cox choice
+            - compiled feature plan (FeaturePlan, xcols="ALL" keeps the dummy encoded column set xcolnames)
+            - standardization vectors (X_mean, X_std)
+            - as-of date of the time features (as_of_)
+        transform() then applies the same steps to new raw records without re-reading
+        the historical data. The time features of new records are counted to as_of
+        (the scoring date by default, as_of_ reproduces the training values).
+
+    Arguments:
+        xcols {any} -- columns to use as independent var, a FeatureSpec/FeaturePlan, or ALL if you don't want filtering
+
+    Keyword Arguments:
+        ycol {string} -- response column (default: {"churn"})
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        compact {bool} -- compact dtypes and float32 features, see compact_dtypes (default: {False})
+        standardize, higherTerms, termDict, interactionTerms, interactionList -- same as model_prep
+    """
+
+    def __init__(self, xcols, ycol="churn", boxcox=False, standardize=True, higherTerms=False, termDict=None,
+                 interactionTerms=True, interactionList=None, compact=False):
+        self.xcols = xcols if xcols == "ALL" or isinstance(xcols, (FeatureSpec, FeaturePlan)) else list(xcols)
+        self.ycol = ycol
+        self.boxcox = boxcox
+        self.standardize = standardize
+        self.higherTerms = higherTerms
+        self.termDict = dict(termDict or {})
+        self.interactionTerms = interactionTerms
+        self.interactionList = [list(i) for i in (interactionList or [])]
+        self.compact = compact
+
+    def fit(self, data, as_of=None):
+        """ Learns the imputation values, dummy columns and standardization vectors
+
+        Arguments:
+            data {string or dataframe} -- file path of the raw data set or the raw dataframe itself
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+        Returns:
+            self
+        """
+        self.fit_transform(data, as_of=as_of)
+
+        return self
+
+    def fit_transform(self, data, as_of=None):
+        """ Fits the preprocessor and returns the training feature matrix & response
+
+        Arguments:
+            data {string or dataframe} -- file path of the raw data set or the raw dataframe itself
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features, kept as as_of_ (default: {today, see asOfDate})
+
+        Returns:
+            X (feature matrix), y (response variable)
+        """
+        df = self._raw(data)
+        df = filterAndRename(df)
+
+        # Freeze the imputation values & the snapshot date
+        self.imputation_ = imputation_values(df)
+        self.as_of_ = asOfDate(as_of)
+
+        df = missingData_imputation(df, **self.imputation_)
+        df = variable_transformation(df, boxcox=self.boxcox, as_of=self.as_of_)
+        if self.compact:
+            df = compact_dtypes(df)
+
+        # Freeze the feature plan (categorical levels)
+        if self.xcols == "ALL":
+            self.plan_ = None
+            xcols = "ALL"
+        else:
+            self.plan_ = feature_plan(df, self.xcols, higherTerms=self.higherTerms, termDict=self.termDict,
+                                      interactionTerms=self.interactionTerms, interactionList=self.interactionList)
+            xcols = self.plan_
+
+        out = model_prep(df, xcols, self.ycol, standardize=self.standardize, higherTerms=self.higherTerms,
+                         termDict=self.termDict, interactionTerms=self.interactionTerms,
+                         interactionList=self.interactionList, compact=self.compact)
+
+        if self.standardize:
+            X, y, self.X_mean_, self.X_std_, self.xcolnames_ = out
+        else:
+            X, y, self.xcolnames_ = out
+            self.X_mean_, self.X_std_ = None, None
+
+        return X, y
+
+    def clean(self, data, as_of=None):
+        """ Runs the cleanData steps on new raw records with the frozen imputation values
+
+        Arguments:
+            data {string, dataframe, dict or list of dicts} -- raw records using the HubSpot column names
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features, as_of_ for the training values (default: {today, see asOfDate})
+
+        Returns:
+            df [pandas dataframe] -- cleaned records
+        """
+        df = self._raw(data)
+
+        # Columns missing from the records are treated as missing values
+        df = df.reindex(columns=list(columnlist_dict.keys()))
+        df = filterAndRename(df)
+        df[textcols] = df[textcols].astype(object)
+        df = missingData_imputation(df, **self.imputation_)
+        df = variable_transformation(df, boxcox=self.boxcox, as_of=as_of)
+        if self.compact:
+            df = compact_dtypes(df)
+
+        return df
+
+    def transform(self, data, as_of=None):
+        """ Builds the feature matrix for new raw records using the frozen state
+
+        Arguments:
+            data {string, dataframe, dict or list of dicts} -- raw records using the HubSpot column names
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features, see clean (default: {today, see asOfDate})
+
+        Returns:
+            X [numpy array] -- feature matrix with the columns of xcolnames_
+        """
+        return self.transform_clean(self.clean(data, as_of=as_of))
+
+    def transform_clean(self, df):
+        """ Builds the feature matrix from an already cleaned dataframe
+
+        Arguments:
+            df {pandas dataframe} -- output of cleanData (or clean)
+
+        Returns:
+            X [numpy array] -- feature matrix with the columns of xcolnames_
+        """
+        dtype = np.float32 if self.compact else np.float64
+
+        if getattr(self, "plan_", None) is not None:
+            # Categories not seen in training get all-zero dummies
+            X = self.plan_.transform(df, dtype=dtype)
+        else:
+            X = feature_frame(df, self.xcols, self.ycol, higherTerms=self.higherTerms, termDict=self.termDict,
+                              interactionTerms=self.interactionTerms, interactionList=self.interactionList)
+
+            # Dummy categories not seen in training are dropped, missing ones are zero
+            X = X.reindex(columns=self.xcolnames_, fill_value=0)
+            X = X.values.astype(dtype)
+
+        if self.standardize:
+            X = ((X - self.X_mean_)/self.X_std_).astype(X.dtype)
+
+        return X
+
+    def save(self, path):
+        """ Pickles the fitted preprocessor to path """
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """ Loads a preprocessor saved with save() """
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+    def _raw(self, data):
+        """ Turns a file path, dict or list of records into a raw dataframe """
+        if isinstance(data, str):
+            return pd.read_csv(dataPath(data), usecols=list(columnlist_dict.keys()))
+        if isinstance(data, dict):
+            return pd.DataFrame([data])
+        if isinstance(data, pd.DataFrame):
+            return data.copy()
+
+        return pd.DataFrame(list(data))
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+# Reference implementations of vectorized steps, not used by the pipeline
+
+def rowwise_variable_transformation(df, boxcox, as_of):
+    """ variable_transformation before it was vectorized (apply/replace chains), kept as the reference
+
+        Timed against the vectorized version by the benchmark (variable_transformation_rowwise
+        stage) and compared with it by tests/test_variable_transformation.py.
+
+        Only two changes from the original: the as-of date is an argument instead of
+        pd.datetime.today(), and firstdealDT is filled with fillna, which is what
+        replace(np.NaN, Series) did on the pandas it was written for.
+    """
+
+    # Create a "callcycle_numeric" columns that breaks out the call cycle from categorical to numeric
+    cc = {'Monthly':'12', 'Quarterly':'4', 'Yearly':'1','Half Year':'2', 'Every Other Month':'6', 'None':'0'}
+    df["callcycle_numeric"] = df['callcycle'].replace(cc,inplace=False)
+    df["callcycle_numeric"]= pd.to_numeric(df["callcycle_numeric"])
+
+    # Create a competingProducts column that counts the number of competitors (instead of a binary)
+    df["competingProducts"] = df["usecompetitors"].copy()
+    df.loc[df.competingProducts.isnull(),"competingProducts"] = 0
+    df.loc[df.competingProducts != 0,'competingProducts'] = df.loc[df.competingProducts != 0,('competingProducts')].str.split(pat=";").str.len()
+
+    # Create churn column from contracttype, then drop
+    df["churn"] = df["contracttype"].apply(lambda x: 1 if x=="CANCELLED" else 0)
+    df.drop(['contracttype'], axis=1, inplace=True)
+
+    # Change usecompetitors from text to binary
+    df.loc[df.usecompetitors.isnull(),"usecompetitors"] = 0
+    df.loc[df.usecompetitors != 0,"usecompetitors"] = 1
+
+    # Change columns that have Yes/No, to binary
+    nolist = ['FF','associatedpredictionlead','strategic']
+    df[nolist] = df[nolist].replace("No", 0).replace("Yes", 1)
+
+    # Change columns that have TRUE/FALSE to binary
+    df[["publiclytraded"]] = df[["publiclytraded"]].replace(False, 0).replace(True, 1)
+
+    # Fill in firstdealDT & Create daysAsCustomer column
+    df["firstdealDT"] = pd.to_datetime(df["firstdealDT"].fillna(df["createDT"]))
+    df["daysAsCustomer"] = ((as_of - df["firstdealDT"]).dt.days).astype(int)
+
+    # Drop the actual date columns ones calculations are done
+    df.drop(["createDT","firstdealDT"], axis=1, inplace=True)
+
+    # Create a column that shows customer touch points/quarter
+    df["callsPerQuarter"] = ((df["timescontacted"] / df["daysAsCustomer"])*(365/4))
+
+    # Create a column that shows sessions/day
+    df["sessionsPerDay"] = ((df["sessions"] / df["daysAsCustomer"]))
+
+    # BoxCox Transformations
+    if boxcox:
+        df["MRR"] = np.log(df["MRR"])
+        df["callsPerQuarter"] = df["callsPerQuarter"].replace(0,0.01)**(1/4)
+        df["assoccontacts"] = df["assoccontacts"].replace(0,0.01)**(1/4)
+        df["associateddeals"] = df["associateddeals"].replace(0,0.01)**(1/2)
+        df["admins"] = df["admins"].replace(0,0.01)**(-1/2)
+
+    return df
+
+def columnwise_model_prep(df, xcols, ycol, standardize=True, higherTerms=False, termDict={}, interactionTerms=True, interactionList=[]):
+    """ model_prep before the compiled FeaturePlan (column by column, get_dummies), kept as the reference
+
+        Compared with the FeaturePlan path by tests/test_model_prep.py. Unchanged from the
+        original apart from np.float/np.int, which are np.float64/np.int64 here. Note it
+        adds the term columns to df and appends their names to xcols, as it always did.
+    """
+    # Set up response variable 
+    y = df[ycol].values.astype(np.int64)
+
+    # Add in higher level terms if specified
+    if higherTerms:
+        for i in termDict:
+            for j in range(termDict[i]-1):
+                name = i + "_" + str(j+2) # Create name for dataset
+
+                df[name] = df[i]**(j+2) # Transform the original variable to desired higher term
+
+                xcols.append(name) # add the newly created column to filter list
+
+    # Add in interaction level terms if specified
+    if interactionTerms:
+        for i in interactionList:
+            name = i[0] + ' ' + i[1] # create the column name
+
+            df[name] = df[i[0]]*df[i[1]] # create the interaction column
+
+            xcols.append(name) # add the newly created column to filter list
+
+    # Filter independent variables if needed
+    if xcols != "ALL":
+        X = df[xcols].copy()
+    else:
+        X = df.drop(ycol, axis=1, inplace=False)
+
+    # Convert categoricals to one-hot encoding
+    X = pd.get_dummies(X)
+
+    # drop callcycle is being used for dummy encoding
+    if 'callcycle_Yearly' in X.columns:
+        X.drop("callcycle_Yearly", axis=1, inplace=True)
+
+    # save colnames
+    xcolnames = X.columns
+
+    # Build Feature Matrix
+    X = X.values.astype(np.float64)
+
+    # Control what we send back based on if we are standardizing or not
+    if standardize:
+        X_mean = X.mean(axis=0)
+        X_std = X.std(axis=0)
+        X = (X - X_mean)/X_std
+
+        return X, y, X_mean, X_std, xcolnames
+    else:
+        return X, y, xcolnames
+
+def loop_plotROCCurve(clf_class, X, y, axis, color, random_state, smote=False, **kwargs):
+    """ plotROCCurve & plotROCCurve_smote before crossValidate (one fit per fold in a loop), kept as the reference
+
+        Compared with the crossValidate versions by tests/test_roc.py. The two originals only
+        differed by the SMOTE step (smote=True). Changes: np.interp for scipy.interp,
+        fit_resample for the old fit_sample, and the fold AUCs are returned.
+    """
+    from imblearn.over_sampling import SMOTE
+    from sklearn.metrics import auc, roc_curve
+    from sklearn.model_selection import StratifiedKFold
+
+    # KFold
+    kf = StratifiedKFold(n_splits=3,shuffle=True,random_state=random_state)
+
+    # Data Range
+    mean_fpr = np.linspace(0, 1, 100)
+
+    # initialization params
+    tprs, aucs = [], []
+
+    for train_index,test_index in kf.split(X,y):
+        xtr,xvl = X[train_index],X[test_index]
+        ytr,yvl = y[train_index],y[test_index]
+
+        # Use SMOTE to boost training set
+        if smote:
+            sm = SMOTE(random_state = 33)
+            xtr, ytr = sm.fit_resample(xtr, ytr.ravel())
+
+        # fit models
+        clf = clf_class(**kwargs)
+        clf.fit(xtr,ytr)
+
+        #get prediction data
+        pred_test = clf.predict_proba(xvl)[:,1]
+
+        # ROC Curve Plotting
+        fpr, tpr, _ = roc_curve(yvl, pred_test)
+        interp_tpr = np.interp(mean_fpr, fpr, tpr)
+        interp_tpr[0] = 0.0
+        tprs.append(interp_tpr)
+        aucs.append(auc(fpr, tpr))
+
+    # Return mean true positive rate & AUC
+    mean_tpr = np.mean(tprs, axis=0)
+    mean_auc = auc(mean_fpr, mean_tpr)
+
+    # Plot object
+    axis.plot(mean_fpr, mean_tpr, color=color,
+    label=r'%s ROC (AUC = %0.2f)%s' % (clf_class.__name__, mean_auc, " SMOTE" if smote else ""),lw=2, alpha=.8)
+
+    return np.array(aucs)
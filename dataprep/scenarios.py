@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.dataPrep import boxcoxDict, boxcox_transform
+from dataprep.featureSpec import FeaturePlan
+from dataprep.scoring import ChurnModel
+
+def scenarioGrid(model, df, ranges, spec=None, fixed=None, boxcox=None):
+    """ Churn probability over the full grid of what-if values of any features
+
+        Replaces the nested loops of feature_visualization.ipynb. Every column not in
+        ranges stays at its median in df (or its fixed value). The model features are
+        rebuilt from the columns with the plan of the training spec (same Box-Cox
+        transformations, higher level terms, interaction terms and dummies), each as a
+        NumPy array along its own grid axis, so the linear predictor of the whole grid is
+        a sum of broadcast products, with no rows built one at a time.
+
+        Example (heatmaps at the 25/50/75% callsPerQuarter, as in the notebook):
+            df, lr, _, _, X, y = finalmodel.finalmodel()
+            grid = scenarioGrid(lr, df, {"associateddeals": np.linspace(0, 8, 100),
+                                         "assoccontacts": np.linspace(0, 12, 100),
+                                         "callsPerQuarter": rawQuantiles(df, "callsPerQuarter", [.25, .5, .75])},
+                                spec=finalmodel.spec)
+            grid.pivot("associateddeals", "assoccontacts", callsPerQuarter=1)
+
+    Arguments:
+        model {LogisticRegression, ChurnModel or numpy array} -- fitted model or its [intercept, coef...]
+        df {pandas dataframe} -- cleaned training data (the baseline is the median of each column)
+        ranges {dictionary} -- column -> values of its grid axis, in the units of the raw export (before Box-Cox)
+
+    Keyword Arguments:
+        spec {FeatureSpec or FeaturePlan} -- features of the model, the plan of a ChurnModel by default (default: {None})
+        fixed {dictionary} -- column -> value replacing the median, raw units (default: {None})
+        boxcox {bool} -- the model was trained on Box-Cox transformed data (default: {ChurnModel setting, else True})
+
+    Returns:
+        grid [ScenarioGrid] -- probabilities with one axis per ranges column, in the order of ranges
+    """
+    plan, beta, boxcox = _modelPlan(model, df, spec, boxcox)
+    fixed = dict(fixed or {})
+
+    axes = {col: np.asarray(values).ravel() for col, values in ranges.items()}
+    shape = tuple(len(v) for v in axes.values())
+
+    # Value of each column: an array along its own axis, or a scalar
+    columns = set(plan.sources) | {col for col, _, _ in plan.dummies}
+    missing = (set(axes) | set(fixed)) - columns
+    if missing:
+        raise ValueError("Columns not used by the model: %s" % sorted(missing))
+
+    values = {}
+    for col in columns:
+        if col in axes:
+            k = list(axes).index(col)
+            v = _transform(axes[col], col, boxcox, plan)
+            values[col] = v.reshape([len(v) if i == k else 1 for i in range(len(shape))])
+        elif col in fixed:
+            values[col] = _transform(np.asarray([fixed[col]]), col, boxcox, plan)[0]
+        else:
+            values[col] = _baseline(df[col])
+
+    eta = _linearPredictor(plan, beta, values, shape)
+
+    return ScenarioGrid(axes, 1/(1 + np.exp(-eta)))
+
+class ScenarioGrid:
+    """ Churn probabilities of a scenarioGrid
+
+    Arguments:
+        axes {dictionary} -- column -> values of the grid axis (raw units)
+        proba {numpy array} -- churn probability, one axis per column of axes
+    """
+
+    def __init__(self, axes, proba):
+        self.axes = axes
+        self.proba = proba
+
+    def table(self):
+        """ Tidy table: one row per grid point, the axes columns & churn (probability) """
+        mesh = np.meshgrid(*self.axes.values(), indexing="ij")
+        df = pd.DataFrame({col: m.ravel() for col, m in zip(self.axes, mesh)})
+        df["churn"] = self.proba.ravel()
+
+        return df
+
+    def pivot(self, index, columns, **at):
+        """ 2-D slice as a dataframe (rows index, columns columns), other axes at the grid position given in at
+
+        Example:
+            grid.pivot("associateddeals", "assoccontacts", callsPerQuarter=1)  # 2nd callsPerQuarter value
+        """
+        names = list(self.axes)
+        others = [n for n in names if n not in (index, columns)]
+        if set(others) - set(at):
+            raise ValueError("Position needed for the axes %s" % sorted(set(others) - set(at)))
+
+        p = self.proba[tuple(at[n] if n in others else slice(None) for n in names)]
+        if names.index(index) > names.index(columns):
+            p = p.T
+
+        return pd.DataFrame(p, index=pd.Index(self.axes[index], name=index),
+                            columns=pd.Index(self.axes[columns], name=columns))
+
+    def plotHeatmap(self, index, columns, axis, **at):
+        """ Plots a 2-D slice (in %) like the seaborn heatmaps of the notebook, highest index at the top """
+        p = self.pivot(index, columns, **at).sort_index(ascending=False)*100
+        image = axis.imshow(p.values, vmin=0, vmax=100, cmap="RdYlGn_r", aspect="auto")
+        axis.set_xticks(range(len(p.columns)))
+        axis.set_xticklabels(np.round(p.columns, 2))
+        axis.set_yticks(range(len(p.index)))
+        axis.set_yticklabels(np.round(p.index, 2))
+        axis.set(xlabel=columns, ylabel=index)
+
+        return image
+
+def rawQuantiles(df, column, q, boxcox=True):
+    """ Quantiles of a column in raw units (Box-Cox undone), e.g. the callsPerQuarter percentiles of the heatmaps
+
+    Arguments:
+        df {pandas dataframe} -- cleaned data
+        column {string} -- column name
+        q {list} -- quantiles, between 0 and 1
+
+    Keyword Arguments:
+        boxcox {bool} -- df was cleaned with boxcox=True (default: {True})
+
+    Returns:
+        values [numpy array]
+    """
+    values = np.quantile(df[column].values, q)
+    if not boxcox or column not in boxcoxDict:
+        return values
+
+    power = boxcoxDict[column]
+
+    return np.exp(values) if power == 0 else values**(1/power)
+
+def _modelPlan(model, df, spec, boxcox):
+    """ Feature plan, [intercept, coef...] in the units of the plan, and boxcox flag of a model """
+    if isinstance(model, ChurnModel):
+        pre = model.preprocessor
+        beta = np.concatenate([[model.intercept], model.coef])
+        spec = spec if spec is not None else getattr(pre, "plan_", None)
+        boxcox = pre.boxcox if boxcox is None else boxcox
+
+        # Standardized features: fold the means & standard deviations into the coefficients
+        if pre.standardize:
+            mean, std = np.ravel(pre.X_mean_), np.ravel(pre.X_std_)
+            beta = np.concatenate([[beta[0] - np.sum(beta[1:]*mean/std)], beta[1:]/std])
+    elif hasattr(model, "coef_"):
+        beta = np.concatenate([np.ravel(model.intercept_), np.ravel(model.coef_)])
+    else:
+        beta = np.asarray(model, dtype=np.float64).ravel()
+
+    if spec is None:
+        raise ValueError("scenarioGrid needs the FeatureSpec of the model (e.g. finalmodel.spec)")
+    plan = spec if isinstance(spec, FeaturePlan) else spec.compile(df)
+    if plan.n_features != len(beta) - 1:
+        raise ValueError("The model has %d coefficients, the spec %d features" % (len(beta) - 1, plan.n_features))
+
+    return plan, beta, True if boxcox is None else boxcox
+
+def _linearPredictor(plan, beta, values, shape):
+    """ intercept + plain columns + powers + interactions + dummies, broadcast to shape
+
+    Arguments:
+        plan {FeaturePlan} -- features of the model
+        beta {numpy array} -- [intercept, coef...] in the units of the plan
+        values {dictionary} -- column -> value in the units of the model, a scalar or an array broadcastable to shape
+        shape {tuple} -- shape of the result
+    """
+    coef = beta[1:]
+    a, b = len(plan.numeric_index), len(plan.numeric_index) + len(plan.term_index)
+    eta = np.full(shape, beta[0])
+    for j, k in enumerate(plan.numeric_index):
+        eta = eta + coef[j]*values[plan.sources[k]]
+    for j, (k, p) in enumerate(zip(plan.term_index, plan.term_power)):
+        eta = eta + coef[a + j]*values[plan.sources[k]]**p
+    for j, (l, r) in enumerate(zip(plan.left_index, plan.right_index)):
+        eta = eta + coef[b + j]*(values[plan.sources[l]]*values[plan.sources[r]])
+    for col, levels, index in plan.dummies:
+        # Coefficient of each level (0 for the dropped and unseen levels)
+        level_coef = np.append(np.where(index >= 0, coef[np.maximum(index, 0)], 0), 0)
+        codes = pd.Categorical(np.ravel(values[col]), categories=levels).codes
+        eta = eta + level_coef[codes].reshape(np.shape(values[col]))
+
+    return np.broadcast_to(eta, shape)
+
+def _transform(values, col, boxcox, plan):
+    """ Raw values of a column in the units of the model """
+    if any(col == c for c, _, _ in plan.dummies):
+        return values.astype(object)
+    values = values.astype(np.float64)
+    if boxcox and col in boxcoxDict:
+        return boxcox_transform(values, boxcoxDict[col])
+
+    return values
+
+def _baseline(s):
+    """ Median of a numeric column, most frequent value of a categorical one """
+    if s.dtype == object or isinstance(s.dtype, pd.CategoricalDtype):
+        return s.mode().iloc[0]
+
+    return float(np.median(s.values))
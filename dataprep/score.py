@@ -0,0 +1,42 @@
+import argparse
+import sys
+import time
+
+# Custom Python Files
+from dataprep.scoring import batchScore
+
+# Slim scoring entry point: only NumPy, pandas and the frozen feature pipeline are
+# imported (no sklearn, scipy or imblearn), and importing it changes no process state.
+#
+#     python -m dataprep.score churn_model.pkl export.csv scores.csv --chunksize 50000
+#
+# The cold start is measured by benchmark.runStartup.
+
+def main(argv=None):
+    """ Scores a raw export with a saved ChurnModel
+
+    Keyword Arguments:
+        argv {list} -- command line arguments (default: {sys.argv[1:]})
+
+    Returns:
+        status [int] -- exit status
+    """
+    parser = argparse.ArgumentParser(prog="python -m dataprep.score",
+                                     description="Churn probability of every account of a raw export")
+    parser.add_argument("model", help="file path of a model saved with ChurnModel.save")
+    parser.add_argument("inpath", help="raw export (.csv or .parquet)")
+    parser.add_argument("outpath", help="scores file (.csv or .parquet): companyID, churn_probability")
+    parser.add_argument("--chunksize", type=int, default=100000, help="accounts per chunk")
+    parser.add_argument("--n-jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--as-of", default=None, help="snapshot date of the time features (default: today)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    nrows = batchScore(args.model, args.inpath, args.outpath, chunksize=args.chunksize, n_jobs=args.n_jobs,
+                       as_of=args.as_of)
+    print("scored %d accounts in %.2fs -> %s" % (nrows, time.perf_counter() - start, args.outpath), file=sys.stderr)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
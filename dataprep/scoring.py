@@ -0,0 +1,201 @@
+import collections
+import pickle
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Custom Python Files
+from dataprep.dataPrep import asOfDate, columnlist_dict, textcols, dataPath
+
+class ChurnModel:
+    """ Logistic churn model packaged with its frozen preprocessing
+
+        Scoring only needs the fitted ChurnPreprocessor and the coefficient vector,
+        probabilities are one NumPy dot product per batch of accounts.
+
+    Arguments:
+        preprocessor {ChurnPreprocessor} -- fitted preprocessor
+        coef {numpy array} -- logistic regression coefficients, same order as preprocessor.xcolnames_
+        intercept {float} -- logistic regression intercept
+    """
+
+    def __init__(self, preprocessor, coef, intercept):
+        self.preprocessor = preprocessor
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0])
+
+    @classmethod
+    def from_estimator(cls, preprocessor, lr):
+        """ Builds a ChurnModel from a fitted sklearn LogisticRegression """
+        return cls(preprocessor, lr.coef_, lr.intercept_)
+
+    @property
+    def xcolnames(self):
+        return self.preprocessor.xcolnames_
+
+    def predict_proba(self, data, as_of=None):
+        """ Churn probability of raw records
+
+        Arguments:
+            data {string, dataframe, dict or list of dicts} -- raw records using the HubSpot column names
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+        Returns:
+            p [numpy array] -- churn probability of each record
+        """
+        return self.predict_proba_matrix(self.preprocessor.transform(data, as_of=as_of))
+
+    def predict_proba_matrix(self, X):
+        """ Churn probability from an already built feature matrix """
+        return 1/(1 + np.exp(-(X @ self.coef + self.intercept)))
+
+    def score(self, data, as_of=None):
+        """ Churn probability of raw records, keyed by companyID
+
+        Arguments:
+            data {string, dataframe, dict or list of dicts} -- raw records using the HubSpot column names
+
+        Keyword Arguments:
+            as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+        Returns:
+            scores [pandas dataframe] -- companyID & churn_probability
+        """
+        df = self.preprocessor.clean(data, as_of=as_of)
+        p = self.predict_proba_matrix(self.preprocessor.transform_clean(df))
+
+        return pd.DataFrame({"companyID": df["companyID"].values, "churn_probability": p})
+
+    def save(self, path):
+        """ Pickles the model to path """
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """ Loads a model saved with save() """
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+def batchScore(model, inpath, outpath, chunksize=100000, n_jobs=1, as_of=None):
+    """ Scores every account of a raw export, streaming it in chunks
+
+        Each chunk goes through the frozen feature pipeline (imputation, Box-Cox, higher
+        terms, interactions, dummies) and is scored with one dot product. Scores are
+        written as soon as a chunk is done, so memory stays bounded by chunksize. With
+        n_jobs > 1 the chunks are scored in a process pool; at most 2*n_jobs chunks are
+        in flight and the output keeps the input order.
+
+    Arguments:
+        model {ChurnModel or string} -- model or file path of a saved model
+        inpath {string} -- raw export (.csv or .parquet)
+        outpath {string} -- scores file (.csv or .parquet)
+
+    Keyword Arguments:
+        chunksize {int} -- number of accounts per chunk (default: {100000})
+        n_jobs {int} -- number of worker processes (default: {1})
+        as_of {timestamp} -- snapshot date of the time features, the same for every chunk (default: {today, see asOfDate})
+
+    Returns:
+        nrows [int] -- number of accounts scored
+    """
+    if isinstance(model, str):
+        model = ChurnModel.load(model)
+
+    # One date for the whole export, as cleanData_chunked
+    as_of = asOfDate(as_of)
+
+    writer = _ScoreWriter(outpath)
+    nrows = 0
+
+    try:
+        if n_jobs == 1:
+            for chunk in readChunks(inpath, chunksize):
+                scores = model.score(chunk, as_of=as_of)
+                writer.write(scores)
+                nrows += len(scores)
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(model, as_of)) as pool:
+                pending = collections.deque()
+                for chunk in readChunks(inpath, chunksize):
+                    pending.append(pool.submit(_score_chunk, chunk))
+
+                    # Keep the number of chunks in memory bounded
+                    if len(pending) >= 2*n_jobs:
+                        scores = pending.popleft().result()
+                        writer.write(scores)
+                        nrows += len(scores)
+
+                while pending:
+                    scores = pending.popleft().result()
+                    writer.write(scores)
+                    nrows += len(scores)
+    finally:
+        writer.close()
+
+    return nrows
+
+def readChunks(inpath, chunksize=100000, columnlist_dict=columnlist_dict):
+    """ Reads the mapped columns of a raw csv or parquet export in chunks
+
+    Arguments:
+        inpath {string} -- raw export (.csv or .parquet)
+
+    Keyword Arguments:
+        chunksize {int} -- number of rows per chunk (default: {100000})
+
+    Yields:
+        chunk [pandas dataframe] -- raw rows
+    """
+    inpath = dataPath(inpath)
+    if inpath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(inpath)
+        columns = [c for c in columnlist_dict.keys() if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        dtypes = {k: object for k, v in columnlist_dict.items() if v in textcols}
+        for chunk in pd.read_csv(inpath, usecols=list(columnlist_dict.keys()), dtype=dtypes, chunksize=chunksize):
+            yield chunk
+
+class _ScoreWriter:
+    """ Appends score chunks to a csv or parquet file """
+
+    def __init__(self, outpath):
+        self.outpath = outpath
+        self.parquet = outpath.endswith(".parquet")
+        self.writer = None
+        self.header = True
+
+    def write(self, scores):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(scores, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.outpath, table.schema)
+            self.writer.write_table(table)
+        else:
+            scores.to_csv(self.outpath, mode="w" if self.header else "a", header=self.header, index=False)
+            self.header = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+# Model & as-of date held by each worker process, set once by _init_worker
+_worker_model = None
+_worker_as_of = None
+
+def _init_worker(model, as_of):
+    global _worker_model, _worker_as_of
+    _worker_model = model
+    _worker_as_of = as_of
+
+def _score_chunk(chunk):
+    return _worker_model.score(chunk, as_of=_worker_as_of)
@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.scoring import ChurnModel
+
+class ServiceStats:
+    """ Latency and throughput counters of the scoring service
+
+    Keyword Arguments:
+        window {int} -- number of recent request latencies kept for the percentiles (default: {10000})
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def record_request(self, seconds, nrecords):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.records += nrecords
+
+    def snapshot(self):
+        """ Current counters
+
+        Returns:
+            stats [dictionary] -- p50/p99 latency (ms), throughput (records/s) and counts
+        """
+        elapsed = time.perf_counter() - self.started
+        lat = np.array(self.latencies)*1000
+
+        return {
+            "requests": self.requests,
+            "records": self.records,
+            "batches": self.batches,
+            "errors": self.errors,
+            "mean_batch_records": self.records/self.batches if self.batches else 0.0,
+            "p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+            "p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+            "records_per_s": self.records/elapsed if elapsed > 0 else 0.0,
+            "requests_per_s": self.requests/elapsed if elapsed > 0 else 0.0,
+        }
+
+class MicroBatcher:
+    """ Coalesces concurrent scoring requests into one vectorized call
+
+        Requests are queued; a batch is scored as soon as max_batch records are waiting
+        or max_wait seconds have passed since the first request of the batch. Scoring
+        runs in a worker thread so the event loop keeps accepting requests.
+
+    Arguments:
+        model {ChurnModel} -- fitted model
+
+    Keyword Arguments:
+        max_batch {int} -- maximum number of records per batch (default: {1024})
+        max_wait {float} -- maximum seconds a request waits for the batch to fill (default: {0.002})
+        stats {ServiceStats} -- counters to update (default: {None})
+    """
+
+    def __init__(self, model, max_batch=1024, max_wait=0.002, stats=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats if stats is not None else ServiceStats()
+        self.queue = None
+        self.task = None
+        self.loop = None
+
+    def start(self):
+        """ Starts the batching task on the running event loop (a new queue, bound to that loop) """
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self._run())
+
+    @property
+    def running(self):
+        """ The batching task is alive on the current event loop """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+        return self.task is not None and not self.task.done() and self.loop is loop
+
+    async def stop(self):
+        """ Stops the batching task, requests still queued fail instead of waiting forever """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        if self.queue is not None:
+            while not self.queue.empty():
+                _, future = self.queue.get_nowait()
+                _fail(future, RuntimeError("scoring service stopped"))
+
+    async def submit(self, records):
+        """ Scores a list of raw records as part of the next batch
+
+        Arguments:
+            records {list of dicts} -- raw records using the HubSpot column names
+
+        Returns:
+            p [list] -- churn probability of each record
+        """
+        # First request, or the previous event loop is gone (e.g. a second asyncio.run)
+        if not self.running:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            nrecords = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+
+            try:
+                # Fill the batch until it is full or the wait is over
+                while nrecords < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(item)
+                    nrecords += len(item[0])
+
+                await self._score(loop, batch)
+            except asyncio.CancelledError:
+                # Stopped mid batch: its requests fail too
+                for _, future in batch:
+                    _fail(future, RuntimeError("scoring service stopped"))
+                raise
+
+    async def _score(self, loop, batch):
+        records = [r for recs, _ in batch for r in recs]
+        self.stats.batches += 1
+
+        try:
+            p = await loop.run_in_executor(None, self.model.predict_proba, pd.DataFrame(records))
+        except Exception:
+            # Score requests one by one so a bad record only fails its own request
+            for recs, future in batch:
+                try:
+                    p = await loop.run_in_executor(None, self.model.predict_proba, pd.DataFrame(recs))
+                    _resolve(future, p.tolist())
+                except Exception as e:
+                    _fail(future, e)
+            return
+
+        start = 0
+        for recs, future in batch:
+            _resolve(future, p[start:start + len(recs)].tolist())
+            start += len(recs)
+
+class ScoringService:
+    """ Local HTTP churn scoring service
+
+        The model is loaded once; requests are coalesced by a MicroBatcher.
+        Routes:
+            POST /score   -- body is a record, a list of records or {"records": [...]}
+                             returns {"churn_probability": [...]}
+            GET /metrics  -- ServiceStats snapshot
+            GET /health   -- {"status": "ok"}
+
+    Arguments:
+        model {ChurnModel or string} -- model or file path of a saved model
+
+    Keyword Arguments:
+        max_batch {int} -- maximum number of records per batch (default: {1024})
+        max_wait {float} -- maximum seconds a request waits for the batch to fill (default: {0.002})
+    """
+
+    def __init__(self, model, max_batch=1024, max_wait=0.002):
+        if isinstance(model, str):
+            model = ChurnModel.load(model)
+        self.model = model
+        self.stats = ServiceStats()
+        self.batcher = MicroBatcher(model, max_batch=max_batch, max_wait=max_wait, stats=self.stats)
+        self.server = None
+
+    async def handle(self, method, path, body=b""):
+        """ Handles one request, independent of the transport
+
+        Arguments:
+            method {string} -- HTTP method
+            path {string} -- request path
+            body {bytes} -- request body
+
+        Returns:
+            status [int], payload [dictionary]
+        """
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.stats.snapshot()
+        if path != "/score":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "method not allowed"}
+
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            return 400, {"error": "body is not valid json"}
+
+        if isinstance(payload, dict) and "records" in payload:
+            records = payload["records"]
+        elif isinstance(payload, dict):
+            records = [payload]
+        else:
+            records = payload
+        if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+            return 400, {"error": "expected a record, a list of records or {\"records\": [...]}"}
+
+        start = time.perf_counter()
+        try:
+            p = await self.batcher.submit(records)
+        except Exception as e:
+            self.stats.errors += 1
+            return 500, {"error": str(e)}
+        self.stats.record_request(time.perf_counter() - start, len(records))
+
+        return 200, {"churn_probability": p}
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """ Starts listening, returns the asyncio server """
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._connection, host, port)
+
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        await self.batcher.stop()
+
+    async def _connection(self, reader, writer):
+        """ Minimal HTTP/1.1 with keep-alive """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, version = line.decode("latin-1").split()
+                except ValueError:
+                    await _respond(writer, 400, {"error": "bad request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+
+                length, error = _contentLength(method, headers)
+                if error is not None:
+                    # The body cannot be delimited, so the connection is closed
+                    await _respond(writer, error[0], {"error": error[1]}, False)
+                    break
+
+                body = await reader.readexactly(length)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                status, payload = await self.handle(method, path.split("?")[0], body)
+                await _respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+class LocalClient:
+    """ In-process stand-in client, calls the service handler without a socket
+
+    Arguments:
+        service {ScoringService} -- service to call
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def score(self, records):
+        status, payload = await self.service.handle("POST", "/score", json.dumps(records).encode())
+        if status != 200:
+            raise RuntimeError("%d: %s" % (status, payload.get("error")))
+
+        return payload["churn_probability"]
+
+    async def metrics(self):
+        return (await self.service.handle("GET", "/metrics"))[1]
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+            500: "Internal Server Error"}
+
+def _contentLength(method, headers):
+    """ Body length of a request from its Content-Length header
+
+    Returns:
+        length [int], error [(status, message) or None] -- POST needs the header, any value must be a non-negative integer
+    """
+    value = headers.get("content-length")
+    if value is None:
+        return 0, ((411, "Content-Length header required") if method == "POST" else None)
+    try:
+        length = int(value)
+    except ValueError:
+        length = -1
+    if length < 0:
+        return 0, (400, "invalid Content-Length header: %r" % value)
+
+    return length, None
+
+async def _respond(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = ("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n"
+            % (status, _REASONS.get(status, ""), len(body), "keep-alive" if keep_alive else "close"))
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+def _resolve(future, value):
+    if not future.done():
+        future.set_result(value)
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+def serve(model, host="127.0.0.1", port=8080, max_batch=1024, max_wait=0.002):
+    """ Runs the scoring service until interrupted
+
+    Arguments:
+        model {ChurnModel or string} -- model or file path of a saved model
+    """
+    async def main():
+        service = ScoringService(model, max_batch=max_batch, max_wait=max_wait)
+        server = await service.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local churn scoring service")
+    parser.add_argument("model", help="file path of a model saved with ChurnModel.save")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=1024)
+    parser.add_argument("--max-wait", type=float, default=0.002, help="seconds")
+    args = parser.parse_args()
+
+    serve(args.model, args.host, args.port, args.max_batch, args.max_wait)
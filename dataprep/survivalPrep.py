@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+# Custom Python Files
+from dataprep.dataPrep import (asOfDate, columnlist_dict, textcols, dataPath, filterAndRename, missingData_imputation,
+                               variable_transformation)
+from dataprep.instrumentation import stage
+
+# Raw date columns of the survival analysis (timeseries/Surv Analysis.ipynb) -> renamed
+survival_dict = {
+    "Close Date": "closeDT",
+    "First Deal Created Date": "firstdealDT",
+    "Last Call Cycle Date": "lastcallDT",
+    "Time of Last Session": "lastsessionDT",
+    "Last Activity Date": "lastactivityDT",
+}
+
+# Raw segmentation columns kept as they are (not in the cleanData columns)
+segment_dict = {"Gauge": "gauge"}
+
+# Date formats of the export, tried in order (HubSpot writes "2019-05-06 08:48")
+DATE_FORMATS = ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%m/%d/%Y %H:%M", "%m/%d/%Y"]
+
+# Account start (earliest of) and last seen (latest of) date columns
+OPEN_COLS = ["closeDT", "firstdealDT"]
+CLOSE_COLS = ["lastcallDT", "lastsessionDT", "lastactivityDT"]
+
+def survivalData(filepath, boxcox=False, as_of=None, impute=True, formats=DATE_FORMATS):
+    """ cleanData plus the duration/event columns of the survival models, from one read of the file
+
+        The raw segment_dict columns (Gauge) are carried over too, for the cohorts of kaplanMeier.
+
+        1. read_csv of the cleanData columns and the survival date columns
+        2. filterAndRename, missingData_imputation & variable_transformation:
+            same cleaned columns as cleanData
+        3. durationTable:
+            open, close & days_cust (duration), with churn as the event
+
+    Arguments:
+        filepath {string} -- file path of the raw dataframe
+
+    Keyword Arguments:
+        boxcox {bool} -- apply the Box-Cox transformations (default: {False})
+        as_of {timestamp} -- date the open accounts are followed up to (default: {today, see asOfDate})
+        impute {bool} -- replace missing or negative durations with the average, as in the notebook (default: {True})
+        formats {list} -- date formats of the export, see parseDates (default: {DATE_FORMATS})
+
+    Returns:
+        df [pandas dataframe] -- cleaned data set with the segment_dict (gauge), open, close & days_cust columns
+    """
+    as_of = asOfDate(as_of)
+    dtypes = {k: object for k, v in columnlist_dict.items() if v in textcols}
+    dtypes.update({k: object for k in survival_dict})
+
+    with stage("survivalData", pipeline="survivalData", boxcox=boxcox) as total:
+        # One read for the cleaned columns & the survival dates
+        with stage("read_csv", pipeline="survivalData") as st:
+            usecols = list(dict.fromkeys(list(columnlist_dict) + list(survival_dict) + list(segment_dict)))
+            raw = pd.read_csv(dataPath(filepath), usecols=usecols, dtype=dtypes)
+            st.output(raw)
+
+        # Survival dates, parsed before cleanData drops firstdealDT
+        with stage("parseDates", pipeline="survivalData", data=raw) as st:
+            dates = pd.DataFrame({name: parseDates(raw[col], formats) for col, name in survival_dict.items()},
+                                 index=raw.index)
+            st.output(dates)
+
+        with stage("clean", pipeline="survivalData", data=raw) as st:
+            df = filterAndRename(raw)
+            df = missingData_imputation(df)
+            df = variable_transformation(df, boxcox=boxcox, as_of=as_of)
+            st.output(df)
+
+        with stage("durationTable", pipeline="survivalData", data=dates) as st:
+            surv = durationTable(dates, df["churn"].values, as_of=as_of, impute=impute)
+            st.output(surv)
+
+        df = pd.concat([df, raw[list(segment_dict)].rename(segment_dict, axis=1), surv], axis=1)
+        total.output(df)
+
+    return df
+
+def durationTable(dates, event, as_of=None, impute=True):
+    """ Duration of each account from its parsed dates
+
+        open = earliest of the close & first deal dates, close = latest of the last call,
+        session & activity dates, or as_of for the accounts that did not churn. Dates are
+        counted in whole days (the time of day is dropped) with datetime64[D] arithmetic.
+
+    Arguments:
+        dates {pandas dataframe} -- parsed date columns (closeDT, firstdealDT, lastcallDT, lastsessionDT, lastactivityDT)
+        event {numpy array} -- 1 for the churned accounts
+
+    Keyword Arguments:
+        as_of {timestamp} -- date the open accounts are followed up to (default: {today, see asOfDate})
+        impute {bool} -- replace missing or negative durations with the average duration (default: {True})
+
+    Returns:
+        surv [pandas dataframe] -- open, close (datetime64) & days_cust (float, days)
+    """
+    as_of = asOfDate(as_of)
+    day = np.datetime64(as_of.date(), "D")
+    event = np.asarray(event).ravel()
+
+    # NaT is skipped by fmin/fmax unless the whole row is missing
+    start = np.fmin.reduce([dates[c].values.astype("datetime64[D]") for c in OPEN_COLS])
+    end = np.fmax.reduce([dates[c].values.astype("datetime64[D]") for c in CLOSE_COLS])
+    end[event == 0] = day
+
+    days = (end - start).astype(np.float64)
+    days[np.isnat(start) | np.isnat(end)] = np.NaN
+
+    # Set negative or missing survival as the average days
+    if impute:
+        bad = np.isnan(days) | (days < 0)
+        days[bad] = np.nanmean(days) if (~np.isnan(days)).any() else np.NaN
+
+    return pd.DataFrame({"open": start.astype("datetime64[ns]"), "close": end.astype("datetime64[ns]"),
+                         "days_cust": days}, index=dates.index)
+
+def parseDates(s, formats=DATE_FORMATS):
+    """ Parses a date column with explicit formats (no per value format inference)
+
+        Each format is tried, in order, on the values the previous ones did not parse.
+        The distinct strings are parsed once and mapped back by their codes.
+
+    Arguments:
+        s {pandas series} -- date strings
+
+    Keyword Arguments:
+        formats {list} -- strftime formats (default: {DATE_FORMATS})
+
+    Raises:
+        ValueError -- values that match none of the formats
+
+    Returns:
+        dates [pandas series] -- datetime64, NaT for the missing values
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+
+    codes, uniques = pd.factorize(s)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+    todo = uniques.notna().values
+    for fmt in formats:
+        if not todo.any():
+            break
+        out = pd.to_datetime(uniques[todo], format=fmt, errors="coerce")
+        parsed[out.index] = out
+        todo &= parsed.isna().values
+
+    if todo.any():
+        raise ValueError("Dates of %s not in %s: %s" % (s.name, formats, list(uniques[todo][:5])))
+
+    values = np.where(codes >= 0, parsed.values[np.maximum(codes, 0)], np.datetime64("NaT"))
+
+    return pd.Series(values, index=s.index, name=s.name, dtype="datetime64[ns]")
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+# Category levels and weights, loosely following the cleaned sample in archive/Lu Misc/data.csv
+CALLCYCLE = (['Yearly', 'Quarterly', 'None', 'Half Year', 'Monthly', 'Every Other Month'],
+             [0.45, 0.20, 0.19, 0.08, 0.05, 0.03])
+ORIGSOURCE = (['Offline Sources', 'Organic Search', 'Direct Traffic', 'Referrals', 'Paid Search', 'Social Media'],
+              [0.80, 0.06, 0.05, 0.04, 0.03, 0.02])
+INDUSTRY = (['Construction', 'Other', 'Oil & Energy', 'Utilities', 'Insurance', 'Real Estate',
+             'Management Consulting', 'Computer Software', 'Chemicals', 'Mining & Metals'],
+            [0.50, 0.22, 0.06, 0.05, 0.04, 0.04, 0.03, 0.02, 0.02, 0.02])
+GAUGE = (['Green', 'Red', 'Yellow'], [0.6, 0.25, 0.15])
+CONTRACTTYPE = (['CANCELLED', 'ACTIVE', 'AUTO RENEW'], [0.2, 0.55, 0.25])
+COMPETITORS = ['Procore', 'OTHER (Enter Notes)', 'iAuditor', 'Microsoft', 'Enablon', 'ProcessMap', 'eVision',
+               'Pronto Forms', 'SAP', 'Internal Systems', 'HammerTech']
+EMPLOYEES = [10, 50, 100, 250, 500, 1000, 5000, 10000]
+
+# Share of missing values per raw column
+MISSING = {
+    "Number of Pageviews": 0.15,
+    "Admins": 0.30,
+    "Number of Employees": 0.25,
+    "Competitors In Use": 0.79,
+    "Contracted Days": 0.40,
+    "Call Cycle": 0.20,
+    "Associated Deals": 0.10,
+    "Number of times contacted": 0.05,
+    "Original Source Type": 0.10,
+    "First Deal Created Date": 0.08,
+    "Number of Sessions": 0.15,
+    "FF Working": 0.35,
+    "Associated Contacts": 0.10,
+    "Renewal Date": 0.30,
+    "Has Associated Prediction Lead": 0.50,
+    "Industry": 0.10,
+    "Is Public": 0.60,
+    "Strategic?": 0.40,
+    "Monthly Recurring Revenue (MRR)": 0.15,
+    "Gauge": 0.15,
+    "Last Call Cycle Date": 0.20,
+    "Time of Last Session": 0.25,
+    "Last Activity Date": 0.05,
+}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+def syntheticExport(n_rows, seed=0, n_extra=10, start_id=0, end_date="2020-06-30"):
+    """ Deterministic HubSpot-shaped raw export
+
+        Has every column of columnnames_dict.json (same raw names), the survival date
+        columns used in timeseries/Surv Analysis.ipynb, Gauge, and n_extra unmapped
+        columns standing in for the rest of the export. Missing values, the Call Cycle
+        levels, the ";"-separated competitor lists, the date strings and the CANCELLED
+        contract type follow the shape of the real export.
+
+    Arguments:
+        n_rows {int} -- number of accounts
+
+    Keyword Arguments:
+        seed {int} -- random seed, same seed gives the same export (default: {0})
+        n_extra {int} -- number of unmapped filler columns (default: {10})
+        start_id {int} -- first Company ID (default: {0})
+        end_date {string} -- latest date in the export (default: {"2020-06-30"})
+
+    Returns:
+        df [pandas dataframe] -- raw export
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_date)
+
+    def choice(levels):
+        return np.asarray(levels[0], dtype=object)[rng.choice(len(levels[0]), size=n_rows, p=levels[1])]
+
+    def dates(ts):
+        return pd.Series(ts).dt.strftime(DATE_FORMAT).values.astype(object)
+
+    def minutes(n):
+        return pd.to_timedelta(rng.integers(0, 24*60, n), unit="m")
+
+    # Account history: created, then first deal, then activity up to the end date
+    created = end - pd.to_timedelta(rng.integers(30, 3650, n_rows), unit="D") + minutes(n_rows)
+    firstdeal = created + pd.to_timedelta(rng.integers(0, 120, n_rows), unit="D")
+    firstdeal = firstdeal.where(firstdeal < end, end)
+    span = (end - firstdeal).days.values + 1
+    closed = firstdeal + pd.to_timedelta(rng.integers(0, 30, n_rows), unit="D")
+    lastcall = firstdeal + pd.to_timedelta((rng.random(n_rows)*span).astype(int), unit="D") + minutes(n_rows)
+    lastsession = firstdeal + pd.to_timedelta((rng.random(n_rows)*span).astype(int), unit="D") + minutes(n_rows)
+    lastactivity = firstdeal + pd.to_timedelta((rng.random(n_rows)*span).astype(int), unit="D") + minutes(n_rows)
+    renewal = firstdeal + pd.to_timedelta(365*rng.integers(1, 4, n_rows), unit="D")
+
+    # ";"-separated competitor lists with 1-3 names
+    ncomp = rng.choice([1, 2, 3], size=n_rows, p=[0.85, 0.10, 0.05])
+    names = np.asarray(COMPETITORS, dtype=object)[rng.integers(0, len(COMPETITORS), size=(n_rows, 3))]
+    competitors = np.where(ncomp == 1, names[:, 0],
+                  np.where(ncomp == 2, names[:, 0] + "; " + names[:, 1],
+                           names[:, 0] + "; " + names[:, 1] + "; " + names[:, 2]))
+
+    df = pd.DataFrame({
+        "Company ID": np.arange(start_id, start_id + n_rows),
+        "Number of Pageviews": np.floor(rng.lognormal(2.0, 2.0, n_rows)),
+        "Admins": rng.poisson(1.5, n_rows).astype(np.float64),
+        "Number of Employees": np.asarray(EMPLOYEES, dtype=np.float64)[rng.integers(0, len(EMPLOYEES), n_rows)],
+        "Competitors In Use": competitors,
+        "Contracted Days": rng.poisson(2.0, n_rows).astype(np.float64),
+        "Call Cycle": choice(CALLCYCLE),
+        "Associated Deals": rng.poisson(2.0, n_rows).astype(np.float64),
+        "Contract Type": choice(CONTRACTTYPE),
+        "Number of times contacted": np.floor(rng.lognormal(2.8, 1.0, n_rows)),
+        "Original Source Type": choice(ORIGSOURCE),
+        "First Deal Created Date": dates(firstdeal),
+        "Create Date": dates(created),
+        "Number of Sessions": np.floor(rng.lognormal(1.0, 2.0, n_rows)),
+        "FF Working": np.where(rng.random(n_rows) < 0.5, "Yes", "No").astype(object),
+        "Associated Contacts": rng.poisson(3.0, n_rows).astype(np.float64),
+        "Renewal Date": dates(renewal),
+        "Has Associated Prediction Lead": np.where(rng.random(n_rows) < 0.2, "Yes", "No").astype(object),
+        "Industry": choice(INDUSTRY),
+        "Is Public": rng.random(n_rows) < 0.1,
+        "Strategic?": np.where(rng.random(n_rows) < 0.2, "Yes", "No").astype(object),
+        "Monthly Recurring Revenue (MRR)": np.round(rng.lognormal(6.5, 1.2, n_rows)),
+        "Gauge": choice(GAUGE),
+        "Close Date": dates(closed),
+        "Last Call Cycle Date": dates(lastcall),
+        "Time of Last Session": dates(lastsession),
+        "Last Activity Date": dates(lastactivity),
+    })
+
+    # Some accounts report zero revenue
+    df.loc[rng.random(n_rows) < 0.01, "Monthly Recurring Revenue (MRR)"] = 0.0
+
+    # Missing values
+    for col, rate in MISSING.items():
+        mask = rng.random(n_rows) < rate
+        if df[col].dtype == bool:
+            df[col] = df[col].astype(object)
+        df.loc[mask, col] = np.NaN
+
+    # Columns of the export that columnnames_dict.json drops
+    for i in range(n_extra):
+        df["Extra Property %d" % (i + 1)] = np.round(rng.random(n_rows)*1000, 2)
+
+    return df
+
+def writeSyntheticExport(path, n_rows, seed=0, n_extra=10, chunksize=500000):
+    """ Writes a synthetic export to csv, generated chunk by chunk to bound memory
+
+        Chunk i uses the seed (seed, i), so the file is deterministic for a given
+        seed and chunksize.
+
+    Arguments:
+        path {string} -- csv file to write
+        n_rows {int} -- number of accounts
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+        n_extra {int} -- number of unmapped filler columns (default: {10})
+        chunksize {int} -- rows generated at a time (default: {500000})
+
+    Returns:
+        path [string]
+    """
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        n = min(chunksize, n_rows - start)
+        df = syntheticExport(n, seed=[seed, i], n_extra=n_extra, start_id=start)
+        df.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+
+    return path
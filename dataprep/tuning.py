@@ -0,0 +1,316 @@
+import hashlib
+import json
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn import metrics
+from sklearn.model_selection import ParameterSampler
+
+# Custom Python Files
+from dataprep.crossValidation import foldIndices
+from dataprep.cache import dataKey
+
+# (config, fold) results are cached next to the cleaned data cache
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tuning")
+
+# Budgets in training rows: stratified subsets with at least MIN_CLASS_ROWS rows of each class,
+# and never fewer than MIN_SAMPLES rows, so every fit sees both classes
+MIN_CLASS_ROWS = 5
+MIN_SAMPLES = 50
+
+# Baselines of OverallModeling.ipynb: fixed options, budget parameter and default search space
+BASELINES = {
+    "lr": {
+        "estimator": "sklearn.linear_model.LogisticRegression",
+        "fixed": {"class_weight": "balanced", "max_iter": 10000},
+        "resource": "n_samples",
+        "space": {"C": list(np.logspace(-3, 3, 13)), "penalty": ["l2"]},
+    },
+    "rf": {
+        "estimator": "sklearn.ensemble.RandomForestClassifier",
+        "fixed": {"n_jobs": 1},
+        "resource": "n_estimators",
+        "space": {"max_depth": [None, 4, 8, 16, 32], "min_samples_leaf": [1, 2, 5, 10, 25],
+                  "max_features": ["sqrt", "log2", 0.3, 0.5], "class_weight": [None, "balanced"]},
+    },
+    "xgb": {
+        "estimator": "xgboost.XGBClassifier",
+        "fixed": {"n_jobs": 1, "verbosity": 0},
+        "resource": "n_estimators",
+        "space": {"max_depth": [2, 3, 4, 6, 8], "learning_rate": [0.01, 0.03, 0.1, 0.3],
+                  "subsample": [0.5, 0.75, 1.0], "colsample_bytree": [0.5, 0.75, 1.0], "min_child_weight": [1, 5, 10]},
+    },
+}
+
+def successiveHalving(estimator, X, y, space=None, n_candidates=27, resource=None, min_resource=None, max_resource=None,
+                      eta=3, folds=None, n_splits=3, random_state=None, fixed=None, n_jobs=1, cache_dir=CACHE_DIR,
+                      configs=None, bracket=0):
+    """ Successive halving search of an estimator's hyperparameters
+
+        n_candidates configurations are sampled from space and cross validated with a
+        small budget (min_resource trees, or training rows when resource="n_samples": a
+        stratified subset of each training fold, see _budgetRows).
+        The best 1/eta of them by mean fold AUC move on to eta times the budget, until
+        max_resource. Each rung fits its (config, fold) pairs in parallel (joblib) on the
+        shared folds, and every result (AUC, fit seconds) is cached on disk under a key
+        of the data, fold, estimator, parameters and budget, so repeated or extended
+        searches only fit what is new.
+
+    Arguments:
+        estimator {string or class} -- "lr", "rf", "xgb" (see BASELINES) or an sklearn style classifier class
+        X {numpy array or sparse matrix} -- feature matrix (model_prep output)
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        space {dictionary} -- parameter -> list of values or scipy distribution (default: {baseline space})
+        n_candidates {int} -- configurations sampled (default: {27})
+        resource {string} -- budget parameter (e.g. "n_estimators") or "n_samples" (default: {baseline resource})
+        min_resource {int} -- budget of the first rung, at least MIN_SAMPLES rows (default: {max_resource/eta^(rungs-1), one rung per halving of n_candidates})
+        max_resource {int} -- budget of the last rung (default: {500 trees / all training rows})
+        eta {int} -- halving rate (default: {3})
+        folds {list} -- precomputed foldIndices, shared with the other searches (default: {None})
+        n_splits {int} -- number of folds when folds is None (default: {3})
+        random_state {int} -- for reproducibility (default: {None})
+        fixed {dictionary} -- parameters passed to every configuration (default: {baseline fixed options})
+        n_jobs {int} -- number of parallel jobs, -1 for all cores (default: {1})
+        cache_dir {string} -- result cache folder, None to disable (default: {dataprep/.cache/tuning})
+        configs {list} -- explicit configurations instead of sampling from space (default: {None})
+        bracket {int} -- label of the search, used by hyperband (default: {0})
+
+    Returns:
+        results [TuningResults]
+    """
+    est = _Estimator(estimator, space, resource, fixed)
+    y = np.asarray(y).ravel()
+    if folds is None:
+        folds = foldIndices(y, n_splits=n_splits, random_state=random_state)
+
+    if max_resource is None:
+        max_resource = min(len(f[0]) for f in folds) if est.resource == "n_samples" else 500
+    if configs is None:
+        configs = [dict(c) for c in ParameterSampler(est.space, n_candidates, random_state=random_state)]
+
+    # Rungs: enough halvings to get down to one configuration, or to go from min to max budget
+    floor = MIN_SAMPLES if est.resource == "n_samples" else 1
+    if min_resource is None:
+        n_rungs = max(1, int(math.floor(math.log(len(configs), eta) + 1e-9)) + 1)
+        min_resource = max(floor, int(max_resource / eta**(n_rungs - 1)))
+    else:
+        min_resource = max(floor, min_resource)
+        n_rungs = max(1, int(math.floor(math.log(max_resource / min_resource, eta) + 1e-9)) + 1)
+
+    data_key = dataKey(X, y)
+    rows = []
+    survivors = list(range(len(configs)))
+    r = min_resource
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for rung in range(n_rungs):
+            budget = int(min(r, max_resource)) if rung < n_rungs - 1 else int(max_resource)
+            tasks = [(i, k) for i in survivors for k in range(len(folds))]
+            out = parallel(delayed(_evalConfig)(est, configs[i], budget, X, y, folds[k], k, data_key, cache_dir, random_state)
+                           for i, k in tasks)
+
+            # Mean fold AUC of each surviving configuration
+            scores = {}
+            for (i, k), res in zip(tasks, out):
+                scores.setdefault(i, []).append(res)
+            for i in survivors:
+                res = scores[i]
+                rows.append({"bracket": bracket, "rung": rung, "config_id": i, "params": configs[i], "resource": budget,
+                             "mean_auc": np.mean([x["auc"] for x in res]), "std_auc": np.std([x["auc"] for x in res]),
+                             "fit_seconds": sum(x["fit_seconds"] for x in res),
+                             "cached": all(x["cached"] for x in res)})
+
+            if rung == n_rungs - 1 or len(survivors) <= 1:
+                break
+
+            # Keep the best 1/eta
+            keep = max(1, len(survivors) // eta)
+            ranked = sorted(survivors, key=lambda i: -np.mean([x["auc"] for x in scores[i]]))
+            survivors = ranked[:keep]
+            r *= eta
+
+    return TuningResults(est.name, rows)
+
+def hyperband(estimator, X, y, space=None, max_resource=None, eta=3, resource=None, folds=None, n_splits=3,
+              random_state=None, fixed=None, n_jobs=1, cache_dir=CACHE_DIR):
+    """ Hyperband: successive halving brackets trading more configurations against a larger first budget
+
+        Bracket s starts n = ceil((s_max+1)/(s+1) * eta^s) configurations at
+        max_resource/eta^s, so aggressive (many cheap candidates) and conservative (few
+        full budget candidates) searches are both tried. All brackets share the folds
+        and the result cache.
+
+    Arguments:
+        estimator {string or class} -- see successiveHalving
+        X {numpy array or sparse matrix} -- feature matrix
+        y {numpy array} -- response variable
+
+    Keyword Arguments:
+        max_resource {int} -- largest budget (default: {500 trees / all training rows})
+        eta {int} -- halving rate (default: {3})
+        other arguments -- same as successiveHalving
+
+    Returns:
+        results [TuningResults] -- every bracket
+    """
+    est = _Estimator(estimator, space, resource, fixed)
+    y = np.asarray(y).ravel()
+    if folds is None:
+        folds = foldIndices(y, n_splits=n_splits, random_state=random_state)
+    if max_resource is None:
+        max_resource = min(len(f[0]) for f in folds) if est.resource == "n_samples" else 500
+
+    min_budget = MIN_SAMPLES if est.resource == "n_samples" else 1
+    s_max = max(0, int(math.floor(math.log(max_resource / min_budget, eta))))
+
+    rows = []
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta**s))
+        seed = None if random_state is None else random_state + s
+        configs = [dict(c) for c in ParameterSampler(est.space, n, random_state=seed)]
+        res = successiveHalving(est, X, y, resource=est.resource, min_resource=max(1, int(max_resource / eta**s)),
+                                max_resource=max_resource, eta=eta, folds=folds, random_state=random_state,
+                                n_jobs=n_jobs, cache_dir=cache_dir, configs=configs, bracket=s)
+        rows.extend(res.rows)
+
+    return TuningResults(est.name, rows)
+
+class TuningResults:
+    """ Rows of a successive halving / hyperband search, one per (configuration, rung)
+
+    Arguments:
+        name {string} -- estimator name
+        rows {list} -- result dictionaries
+    """
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def table(self):
+        """ Every evaluated (configuration, budget): mean & std fold AUC, fit seconds summed over folds """
+        df = pd.DataFrame(self.rows)
+        df["params"] = df["params"].apply(_paramString)
+
+        return df.sort_values(["resource", "mean_auc"], ascending=[False, False]).reset_index(drop=True)
+
+    def candidates(self):
+        """ One row per configuration at its largest budget, with the compute time spent on it over all rungs """
+        df = pd.DataFrame(self.rows)
+        df["params"] = df["params"].apply(_paramString)
+        total = df.groupby(["bracket", "config_id"])["fit_seconds"].sum().rename("total_fit_seconds")
+        last = df.sort_values("resource").groupby(["bracket", "config_id"]).tail(1).set_index(["bracket", "config_id"])
+
+        return last.join(total).sort_values("mean_auc", ascending=False).reset_index()
+
+    @property
+    def best(self):
+        """ Best configuration at the largest budget reached """
+        df = pd.DataFrame(self.rows)
+        df = df[df["resource"] == df["resource"].max()]
+
+        return df.sort_values("mean_auc", ascending=False).iloc[0].to_dict()
+
+    @property
+    def best_params(self):
+        return self.best["params"]
+
+    @property
+    def best_score(self):
+        return self.best["mean_auc"]
+
+    def plotAUCvsTime(self, axis, color='b'):
+        """ Plots mean fold AUC against fit seconds of every evaluated (configuration, budget) """
+        df = self.table()
+        axis.scatter(df["fit_seconds"], df["mean_auc"], c=color, alpha=.6, label=self.name)
+        axis.set(xlabel="fit seconds (sum over folds)", ylabel="mean fold AUC")
+
+class _Estimator:
+    """ Estimator class, fixed options, search space and budget parameter of a search """
+
+    def __init__(self, estimator, space=None, resource=None, fixed=None):
+        if isinstance(estimator, _Estimator):
+            self.__dict__.update(estimator.__dict__)
+            return
+
+        base = BASELINES.get(estimator, {}) if isinstance(estimator, str) else {}
+        if isinstance(estimator, str) and not base:
+            raise ValueError("Unknown estimator %s, expected one of %s or a class" % (estimator, list(BASELINES)))
+
+        self.path = base["estimator"] if base else "%s.%s" % (estimator.__module__, estimator.__name__)
+        self.name = estimator if base else estimator.__name__
+        self.space = space if space is not None else base.get("space", {})
+        self.resource = resource or base.get("resource", "n_samples")
+        self.fixed = dict(base.get("fixed", {}), **(fixed or {}))
+
+    def make(self, params, budget, random_state):
+        """ Estimator instance of a configuration at a budget """
+        module, name = self.path.rsplit(".", 1)
+        cls = getattr(__import__(module, fromlist=[name]), name)
+
+        kwargs = dict(self.fixed, **params)
+        if self.resource != "n_samples":
+            kwargs[self.resource] = budget
+        if random_state is not None and "random_state" in cls().get_params():
+            kwargs.setdefault("random_state", random_state)
+
+        return cls(**kwargs)
+
+def _evalConfig(est, params, budget, X, y, fold, k, data_key, cache_dir, random_state):
+    """ Fits one (configuration, fold) at a budget, or reads it from the cache """
+    train, test = fold
+    key = hashlib.sha256(json.dumps([data_key, k, hashlib.sha256(np.asarray(test).tobytes()).hexdigest(), est.path,
+                                     est.resource, budget, random_state, sorted(dict(est.fixed, **params).items()),
+                                     "stratified"], default=str).encode()).hexdigest()
+
+    path = None if cache_dir is None else os.path.join(cache_dir, key + ".json")
+    if path is not None and os.path.exists(path):
+        with open(path, "r") as fp:
+            return dict(json.load(fp), cached=True)
+
+    # Budget in training rows: a fixed stratified subset of the fold's training rows
+    if est.resource == "n_samples" and budget < len(train):
+        train = _budgetRows(train, y, budget, random_state)
+
+    clf = est.make(params, budget, random_state)
+    start = time.perf_counter()
+    clf.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - start
+
+    res = {"auc": float(metrics.roc_auc_score(y[test], clf.predict_proba(X[test])[:, 1])), "fit_seconds": fit_seconds}
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + ".tmp", "w") as fp:
+            json.dump(res, fp)
+        os.replace(path + ".tmp", path)
+
+    return dict(res, cached=False)
+
+def _budgetRows(train, y, budget, random_state, min_class=MIN_CLASS_ROWS):
+    """ Stratified random subset of budget training rows
+
+        Each class gets its share of the budget (largest remainders for the rounding),
+        and at least min_class rows (all of them when it has fewer), taken from the
+        largest class. The same random_state gives the same rows.
+    """
+    rng = np.random.RandomState(0 if random_state is None else random_state)
+    classes, counts = np.unique(y[train], return_counts=True)
+
+    quota = budget*counts/counts.sum()
+    take = np.floor(quota).astype(int)
+    take[np.argsort(take - quota)[:budget - take.sum()]] += 1
+    take = np.minimum(np.maximum(take, np.minimum(min_class, counts)), counts)
+    take[np.argmax(take)] -= max(0, take.sum() - budget)
+
+    rows = [rng.permutation(train[y[train] == c])[:n] for c, n in zip(classes, take)]
+
+    return np.sort(np.concatenate(rows))
+
+def _paramString(params):
+    return ", ".join("%s=%s" % (k, params[k]) for k in sorted(params))
@@ -1,18 +1,54 @@
+import shutil
+import time
 import numpy as np
 import pandas as pd
 from sklearn import linear_model
 
 # Custom Python Files
-from dataprep.dataPrep import cleanData
-from dataprep.modelPrep import model_prep
+from dataprep.dataPrep import asOfDate, cleanData
+from dataprep.modelPrep import model_prep, model_prep_chunked
+from dataprep.logistic import balancedWeights, fitLogistic, fitLogisticChunks, predictLogistic, spoolChunks
+from dataprep.cache import cacheKey, cachedCleanData
+from dataprep.featureSpec import FeatureSpec
+from dataprep.preprocessor import ChurnPreprocessor
+from dataprep.scoring import ChurnModel
+from dataprep.modelStore import loadModel, modelKey, saveModel
+from dataprep.instrumentation import stage
 
-def finalmodel():
+# Final model specification
+seed = 1234 # random state for consistency
+xcols = ['callsPerQuarter','associateddeals','sessionsPerDay','callcycle_numeric']
+
+# List of interaction terms (each their own sublist)
+interactionList = [ ['callsPerQuarter', 'associateddeals'],
+                    ['assoccontacts', 'associateddeals'],
+                    ['assoccontacts', 'MRR'],
+]
+
+termDict = {
+    "callcycle_numeric" : 2 # Higher level terms desired
+}
+
+ycol = "churn"
+
+# Compiled into the feature matrix by model_prep (training), crossValidate and scoring alike
+spec = FeatureSpec(xcols, termDict=termDict, interactionList=interactionList)
+
+def finalmodel(cache=False, filepath="PSCCustomerData.csv", store=False, as_of=None):
     """ This will produce the final logistic regression model, using data from PSCCustomerData.xlsx
 
         The logistic regression model predicts churn and has the following univariate features:
             callsPerQuarter, associateddeals, sessionsPerDay, callcycle_numeric
         and the following interaction terms: 
             'callsPerQuarter * associateddeals', 'assoccontacts * associateddeals', 'assoccontacts * MRR'
+
+    Keyword Arguments:
+        cache {bool} -- load the cleaned data through the on-disk cache (default: {False})
+        filepath {string} -- training data set (default: {"PSCCustomerData.csv"})
+        store {bool} -- reuse the model fitted on the same cleaned data & configuration from the
+                        model store (dataprep.modelStore), fit and store it otherwise (default: {False})
+        as_of {timestamp} -- snapshot date of the time features, for reproducible fits (default: {today, see asOfDate})
+
     Returns:
         df - Cleaned and prepped dataframe for model building 
         X - feature matrix
@@ -21,33 +57,183 @@ def finalmodel():
         predictions - prediction response from model 
         xcolnames - list of column names for reference
     """
-    seed = 1234 # random state for consistency
-    xcols = ['callsPerQuarter','associateddeals','sessionsPerDay','callcycle_numeric']
+    # One date for the whole fit, whichever path the data takes
+    as_of = asOfDate(as_of)
+
+    with stage("finalmodel", pipeline="finalmodel", cache=cache) as total:
+        if cache:
+            df = cachedCleanData(filepath, boxcox=True, as_of=as_of)
+        else:
+            df = cleanData(filepath, boxcox=True, as_of=as_of)
+
+        X, y, xcolnames = model_prep(df, spec, ycol, standardize=False)
+
+        # Model building and KFold
+        lr = linear_model.LogisticRegression(class_weight='balanced',penalty='none', max_iter=10000, random_state=seed)
 
-    # List of interaction terms (each their own sublist)
-    interactionList = [ ['callsPerQuarter', 'associateddeals'],
-                        ['assoccontacts', 'associateddeals'],
-                        ['assoccontacts', 'MRR'],
-    ]
+        # Same cleaned data, spec and estimator: read the stored fit
+        stored = None
+        if store:
+            key = modelKey(df, {"model": "finalmodel", "spec": spec, "ycol": ycol, "standardize": False}, lr)
+            stored = loadModel(key)
 
-    termDict = {
-        "callcycle_numeric" : 2 # Higher level terms desired
-    }
+        if stored is not None:
+            lr = stored.model
+        else:
+            # fit model
+            with stage("fit", pipeline="finalmodel", data=X):
+                lr.fit(X,y)
 
-    ycol = "churn"
+            if store:
+                saveModel(key, lr, xcolnames, info={"model": "finalmodel", "rows": len(y)})
 
-    df = cleanData("PSCCustomerData.csv", boxcox=True)
+        # Produce predictions
+        with stage("predict", pipeline="finalmodel", data=X):
+            predictions = lr.predict_proba(X)[:,1]
 
-    X, y, xcolnames = model_prep(df,xcols,ycol, higherTerms=True, termDict=termDict, interactionTerms=True, interactionList = interactionList, standardize=False)
+        total.output(X)
 
-    # Model building and KFold
+    # return model and feature list
+    return df, lr, predictions, xcolnames, X, y
+
+def finalscorer(filepath="PSCCustomerData.csv", store=False, as_of=None):
+    """ Fits the final logistic regression model together with its frozen preprocessing
+
+        Same features and estimator as finalmodel, packaged as a ChurnModel that scores new
+        accounts (see dataprep.scoring.batchScore) without re-reading the training data.
+
+    Keyword Arguments:
+        filepath {string} -- training data set (default: {"PSCCustomerData.csv"})
+        store {bool} -- reuse the model fitted on the same data & configuration from the model store,
+                        keyed by the content address of the cleaned data (cache.cacheKey), so a hit
+                        reads no data at all (default: {False})
+        as_of {timestamp} -- snapshot date of the time features, kept as preprocessor.as_of_ (default: {today, see asOfDate})
+
+    Returns:
+        model [ChurnModel] -- fitted preprocessor and coefficients
+    """
+    # Same date for the store key & the fit
+    as_of = asOfDate(as_of)
+
+    preprocessor = ChurnPreprocessor(xcols, ycol, boxcox=True, standardize=False, higherTerms=True, termDict=termDict,
+                                     interactionTerms=True, interactionList=interactionList)
     lr = linear_model.LogisticRegression(class_weight='balanced',penalty='none', max_iter=10000, random_state=seed)
 
-    # fit model
+    if store:
+        key = modelKey(cacheKey(filepath, boxcox=True, as_of=as_of), {"model": "finalscorer", "preprocessor": vars(preprocessor)}, lr)
+        stored = loadModel(key)
+        if stored is not None:
+            return stored.model
+
+    X, y = preprocessor.fit_transform(filepath, as_of=as_of)
     lr.fit(X,y)
+    model = ChurnModel.from_estimator(preprocessor, lr)
 
-    # Produce predictions
-    predictions = lr.predict_proba(X)[:,1]
+    if store:
+        saveModel(key, model, model.xcolnames, info={"model": "finalscorer", "rows": len(y)})
 
-    # return model and feature list
-    return df, lr, predictions, xcolnames, X, y
\ No newline at end of file
+    return model
+
+def retrain(previous, cache=False, filepath="PSCCustomerData.csv", streamed=False, chunksize=100000, tol=1e-8,
+            max_iter=100, check=False, atol=1e-4, as_of=None):
+    """ Refits the final logistic regression model on new data, starting from the previous coefficients
+
+        Same model as finalmodel (balanced class weights, no penalty), solved by Newton's
+        method warm started from the previous model, which typically converges in 2-4
+        steps when the history only grew a little.
+            - streamed=False: in memory, on cleanData + model_prep
+            - streamed=True: the feature matrix is built chunk by chunk (cleanData_chunked),
+              spooled once to disk, and every Newton step is one pass over the chunks
+
+        check=True also runs a cold refit (Newton from zero on the same data) and compares
+        the predicted probabilities and coefficients. The cold refit is not the lbfgs fit of
+        finalmodel: on these unscaled features lbfgs stops ~1e-3 away from the optimum.
+
+    Arguments:
+        previous {LogisticRegression, ChurnModel or numpy array} -- previous model or its [intercept, coef...]
+
+    Keyword Arguments:
+        cache {bool} -- load the cleaned data through the on-disk cache, in memory only (default: {False})
+        filepath {string} -- training data set (default: {"PSCCustomerData.csv"})
+        streamed {bool} -- stream the data in chunks instead of loading it (default: {False})
+        chunksize {int} -- rows per chunk when streamed (default: {100000})
+        tol {float} -- stop when the largest Newton step is below tol (default: {1e-8})
+        max_iter {int} -- maximum Newton steps (default: {100})
+        check {bool} -- compare with a cold refit (default: {False})
+        atol {float} -- largest allowed difference of the predicted probabilities with the cold refit (default: {1e-4})
+        as_of {timestamp} -- snapshot date of the time features (default: {today, see asOfDate})
+
+    Returns:
+        lr - Logistic regression model with the updated coefficients
+        diagnostics - dictionary: n_iter, converged, seconds, history (one entry per Newton step:
+                      max_step, grad_norm, loglik, time) and, with check, the cold refit comparison
+                      (cold_max_abs_diff, cold_max_coef_diff, within_tol)
+    """
+    beta0 = _previousBeta(previous)
+    as_of = asOfDate(as_of)
+    history = []
+    start = time.perf_counter()
+
+    with stage("retrain", pipeline="finalmodel", streamed=streamed) as total:
+        if streamed:
+            chunks = spoolChunks(model_prep_chunked(filepath, spec, ycol, boxcox=True, chunksize=chunksize, as_of=as_of))
+            try:
+                with stage("fit", pipeline="finalmodel"):
+                    beta, n_iter, converged = fitLogisticChunks(chunks, coef_init=beta0, tol=tol, max_iter=max_iter,
+                                                                callback=history.append)
+                seconds = time.perf_counter() - start
+
+                if check:
+                    cold, _, _ = fitLogisticChunks(chunks, tol=tol, max_iter=max_iter)
+                    diff = max((np.max(np.abs(predictLogistic(X, beta) - predictLogistic(X, cold))) for X, _ in chunks()),
+                               default=0.0)
+            finally:
+                shutil.rmtree(chunks.directory, ignore_errors=True)
+        else:
+            if cache:
+                df = cachedCleanData(filepath, boxcox=True, as_of=as_of)
+            else:
+                df = cleanData(filepath, boxcox=True, as_of=as_of)
+            X, y, xcolnames = model_prep(df, spec, ycol, standardize=False)
+            total.output(X)
+
+            with stage("fit", pipeline="finalmodel", data=X):
+                beta, n_iter, converged = fitLogistic(X, y, balancedWeights(y), coef_init=beta0, tol=tol, max_iter=max_iter,
+                                                      callback=history.append)
+            seconds = time.perf_counter() - start
+
+            if check:
+                cold, _, _ = fitLogistic(X, y, balancedWeights(y), tol=tol, max_iter=max_iter)
+                diff = np.max(np.abs(predictLogistic(X, beta) - predictLogistic(X, cold)))
+
+    # Step times relative to the start
+    for h in history:
+        h["time"] -= start
+
+    lr = _asEstimator(beta, n_iter)
+    diagnostics = {"streamed": streamed, "n_iter": n_iter, "converged": converged, "seconds": seconds, "history": history}
+    if check:
+        diagnostics.update({"cold_max_abs_diff": float(diff), "cold_max_coef_diff": float(np.max(np.abs(beta - cold))),
+                            "within_tol": bool(diff <= atol)})
+
+    return lr, diagnostics
+
+def _previousBeta(previous):
+    """ [intercept, coef...] of a previous model """
+    if isinstance(previous, ChurnModel):
+        return np.concatenate([[previous.intercept], previous.coef])
+    if hasattr(previous, "coef_"):
+        return np.concatenate([np.ravel(previous.intercept_), np.ravel(previous.coef_)])
+
+    return np.asarray(previous, dtype=np.float64).ravel()
+
+def _asEstimator(beta, n_iter):
+    """ LogisticRegression carrying fitted coefficients, so predict/predict_proba work as after fit """
+    lr = linear_model.LogisticRegression(class_weight='balanced',penalty='none', max_iter=10000, random_state=seed)
+    lr.classes_ = np.array([0, 1])
+    lr.coef_ = beta[1:].reshape(1, -1)
+    lr.intercept_ = beta[:1].copy()
+    lr.n_iter_ = np.array([n_iter])
+    lr.n_features_in_ = len(beta) - 1
+
+    return lr
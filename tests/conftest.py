@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Tests import the dataprep package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Custom Python Files
+from dataprep.preprocessor import ChurnPreprocessor
+from dataprep.scoring import ChurnModel
+from dataprep.syntheticData import syntheticExport
+
+XCOLS = ["MRR", "employees", "sessions", "usecompetitors", "industry"]
+
+@pytest.fixture(scope="session")
+def raw():
+    """ Small raw export with the HubSpot column names """
+    return syntheticExport(500, seed=0)
+
+@pytest.fixture(scope="session")
+def model(raw):
+    """ ChurnModel with a fitted preprocessor and fixed coefficients (no solver involved) """
+    preprocessor = ChurnPreprocessor(XCOLS).fit(raw)
+    coef = np.linspace(-1, 1, len(preprocessor.xcolnames_))
+
+    return ChurnModel(preprocessor, coef, -0.5)
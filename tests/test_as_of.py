@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+# Custom Python Files
+import finalmodel as fm
+from dataprep.backtest import backtest
+from dataprep.cache import cachedCleanData
+from dataprep.dataPrep import cleanData
+from dataprep.modelPrep import model_prep
+from dataprep.preprocessor import ChurnPreprocessor
+from dataprep.scoring import ChurnModel, batchScore
+from dataprep.survivalPrep import durationTable
+
+from conftest import XCOLS
+
+AS_OF = pd.Timestamp("2020-07-01")
+
+def test_fit_keeps_as_of(raw):
+    preprocessor = ChurnPreprocessor(XCOLS + ["daysAsCustomer"], standardize=False)
+    X, _ = preprocessor.fit_transform(raw, as_of=AS_OF)
+
+    assert preprocessor.as_of_ == AS_OF
+    np.testing.assert_array_equal(preprocessor.transform(raw, as_of=preprocessor.as_of_), X)
+
+    later = preprocessor.clean(raw, as_of=AS_OF + pd.Timedelta(days=10))
+    earlier = preprocessor.clean(raw, as_of=AS_OF)
+    np.testing.assert_array_equal(later["daysAsCustomer"].values, earlier["daysAsCustomer"].values + 10)
+
+def test_batch_score_as_of(raw, tmp_path):
+    preprocessor = ChurnPreprocessor(XCOLS + ["sessionsPerDay"]).fit(raw, as_of=AS_OF)
+    model = ChurnModel(preprocessor, np.linspace(-1, 1, len(preprocessor.xcolnames_)), -0.5)
+
+    inpath, outpath = str(tmp_path / "export.csv"), str(tmp_path / "scores.csv")
+    raw.to_csv(inpath, index=False)
+    batchScore(model, inpath, outpath, chunksize=128, as_of=AS_OF)
+
+    expected = model.score(raw, as_of=AS_OF)
+    np.testing.assert_allclose(pd.read_csv(outpath)["churn_probability"].values, expected["churn_probability"].values)
+
+def test_duration_as_of():
+    dates = pd.DataFrame({c: pd.to_datetime(["2020-01-01", "2020-03-01"]) for c in
+                          ["closeDT", "firstdealDT", "lastcallDT", "lastsessionDT", "lastactivityDT"]})
+
+    surv = durationTable(dates, np.array([0, 1]), as_of=AS_OF, impute=False)
+
+    assert surv["days_cust"].tolist() == [(AS_OF - pd.Timestamp("2020-01-01")).days, 0]
+
+def test_default_as_of_agrees(raw, tmp_path):
+    path = str(tmp_path / "export.csv")
+    raw.to_csv(path, index=False)
+
+    cached = cachedCleanData(path, boxcox=True, cache_dir=str(tmp_path / "cache"))
+    pd.testing.assert_frame_equal(cached, cleanData(path, boxcox=True))
+
+def test_same_features_every_path(raw, tmp_path):
+    path = str(tmp_path / "export.csv")
+    raw.to_csv(path, index=False)
+    dates = pd.DatetimeIndex([AS_OF - pd.Timedelta(days=400), AS_OF, AS_OF + pd.Timedelta(hours=13)])
+
+    plan = fm.spec.compile(cleanData(path, boxcox=True, as_of=AS_OF))
+    beta = np.linspace(-0.5, 0.5, plan.n_features + 1)
+    bt = backtest(beta, path, dates, spec=plan, boxcox=True)
+
+    for k, as_of in enumerate(dates):
+        df = cleanData(path, boxcox=True, as_of=as_of)
+        pd.testing.assert_frame_equal(cachedCleanData(path, boxcox=True, as_of=as_of, cache_dir=str(tmp_path / "cache")), df)
+
+        # Customers at that date: the backtest probabilities are the model on cleanData(as_of)
+        X, _, _ = model_prep(df, plan, "churn", standardize=False)
+        active = df["daysAsCustomer"].values > 0
+        np.testing.assert_array_equal(np.isnan(bt.proba[:, k]), ~active)
+        np.testing.assert_allclose(bt.proba[active, k], expit(beta[0] + X[active] @ beta[1:]), rtol=1e-12)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# Custom Python Files
+from dataprep.dataPrep import (cleanData, cleanData_chunked, cleanData_toFile, filterAndRename, imputation_stats,
+                               imputation_values)
+
+AS_OF = pd.Timestamp("2020-07-01")
+
+@pytest.fixture(params=[500, 499], ids=["even", "odd"])
+def export(raw, request, tmp_path):
+    """ Raw export with repeated MRR values, a first chunk without competitors and an all-missing column
+
+        The number of known MRR values is even or odd, so the median from the value counts
+        is checked both between two values and on one.
+    """
+    df = raw.iloc[:request.param].copy()
+    mrr = "Monthly Recurring Revenue (MRR)"
+    df[mrr] = df[mrr].round(-2)
+    if df[mrr].notna().sum() % 2 != request.param % 2:
+        df.loc[df[mrr].first_valid_index(), mrr] = np.NaN
+    df.loc[df.index[:64], "Competitors In Use"] = np.NaN
+    df["Strategic?"] = np.NaN
+
+    path = str(tmp_path / "export.csv")
+    df.to_csv(path, index=False)
+
+    return path
+
+def test_imputation_stats(export):
+    raw = filterAndRename(pd.read_csv(export))
+
+    assert imputation_stats(export, chunksize=64) == imputation_values(raw)
+
+@pytest.mark.parametrize("boxcox", [False, True])
+def test_chunked_matches_cleanData(export, boxcox):
+    chunks = list(cleanData_chunked(export, boxcox=boxcox, chunksize=64, as_of=AS_OF))
+
+    assert len(chunks) == 8
+    pd.testing.assert_frame_equal(pd.concat(chunks), cleanData(export, boxcox=boxcox, as_of=AS_OF))
+
+def test_toFile_matches_cleanData(export, tmp_path):
+    outpath, expected = str(tmp_path / "clean.csv"), str(tmp_path / "expected.csv")
+    nrows = cleanData_toFile(export, outpath, boxcox=True, chunksize=64, as_of=AS_OF)
+    cleanData(export, boxcox=True, as_of=AS_OF).to_csv(expected, index=False)
+
+    with open(outpath) as out, open(expected) as exp:
+        assert out.read() == exp.read()
+    assert nrows == len(pd.read_csv(expected))
@@ -0,0 +1,71 @@
+import os
+import pandas as pd
+import pytest
+
+# Custom Python Files
+from dataprep import incremental
+from dataprep.dataPrep import cleanData
+from dataprep.incremental import incrementalCleanData, loadCleanTable
+
+AS_OF = pd.Timestamp("2020-07-01")
+
+@pytest.fixture
+def export(tmp_path):
+    """ Writes a raw export, returns its path """
+    count = iter(range(100))
+
+    def write(df):
+        path = str(tmp_path / ("export%d.csv" % next(count)))
+        df.to_csv(path, index=False)
+        return path
+
+    return write
+
+def parts(store):
+    return sorted(name for name in os.listdir(store) if name.startswith("part-"))
+
+def check(path, store, day):
+    clean, summary = incrementalCleanData(path, store, as_of=AS_OF + pd.Timedelta(days=day))
+    pd.testing.assert_frame_equal(clean, cleanData(path, as_of=AS_OF + pd.Timedelta(days=day)))
+
+    return summary
+
+def test_runs_append_parts(raw, export, tmp_path):
+    store = str(tmp_path / "store")
+    assert check(export(raw.iloc[:400]), store, 0)["full"]
+    assert parts(store) == ["part-00000.pkl"]
+
+    # Nothing changed: only the manifest is written
+    summary = check(export(raw.iloc[:400]), store, 1)
+    assert summary["recomputed"] == 0 and parts(store) == ["part-00000.pkl"]
+
+    # Changed, removed & new accounts
+    df = raw.iloc[20:450].copy()
+    df.loc[df.index[:10], "Number of Sessions"] = df["Number of Sessions"].fillna(0)[:10] + 1
+    summary = check(export(df), store, 2)
+    assert (summary["new"], summary["changed"], summary["removed"]) == (50, 10, 20)
+    assert parts(store) == ["part-00000.pkl", "part-00001.pkl"]
+
+    # Removed accounts come back
+    summary = check(export(raw.iloc[:450]), store, 3)
+    assert summary["new"] == 20 and len(parts(store)) == 3
+
+    table = loadCleanTable(store)
+    expected = cleanData(export(raw.iloc[:450]), as_of=AS_OF + pd.Timedelta(days=3))
+    pd.testing.assert_frame_equal(table, expected)
+
+def test_compaction(raw, export, tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "MAX_PARTS", 2)
+    store = str(tmp_path / "store")
+    os.makedirs(store)
+    with open(os.path.join(store, "tables.pkl"), "w") as fp:
+        fp.write("not ours")
+
+    check(export(raw.iloc[:300]), store, 0)
+    check(export(raw.iloc[:320]), store, 1)
+    summary = check(export(raw.iloc[:340]), store, 2)
+
+    # Only the compacted part is left, other files of the folder are kept
+    assert summary["compacted"] and parts(store) == ["part-00002.pkl"]
+    assert os.path.exists(os.path.join(store, "tables.pkl"))
+    check(export(raw.iloc[10:340]), store, 3)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+# Custom Python Files
+from dataprep.kaplanMeier import kaplanMeier
+
+Z = stats.norm.ppf(0.975)
+
+@pytest.fixture
+def small():
+    """ A: deaths at 1, 2 & 4, censored at 3. B: deaths at 2 & 3, censored at 5 """
+    return pd.DataFrame({"days_cust": [1, 2, 3, 4, 2, 3, 5], "churn": [1, 1, 0, 1, 1, 1, 0],
+                         "group": ["A"]*4 + ["B"]*3})
+
+def greenwoodCI(S, var):
+    """ Exponential Greenwood interval, computed on log(-log S) """
+    se = np.sqrt(var)/-np.log(S)
+    return np.exp(-np.exp(np.log(-np.log(S)) + Z*se)), np.exp(-np.exp(np.log(-np.log(S)) - Z*se))
+
+@pytest.mark.parametrize("block_size", [256, 1], ids=["whole", "split"])
+def test_hand_computed(small, block_size):
+    km = kaplanMeier(small, by="group", pairwise=True, block_size=block_size)
+
+    # Survival: product of (1 - d/n) over the times
+    curves = km.curves.set_index(["cohort", "time"])
+    expected = {("A", 1): 3/4, ("A", 2): 1/2, ("A", 3): 1/2, ("A", 4): 0.0,
+                ("B", 2): 2/3, ("B", 3): 1/3, ("B", 5): 1/3}
+    assert curves["survival"].to_dict() == pytest.approx(expected)
+    assert curves["at_risk"].to_dict() == {("A", 1): 4, ("A", 2): 3, ("A", 3): 2, ("A", 4): 1,
+                                           ("B", 2): 3, ("B", 3): 2, ("B", 5): 1}
+
+    # Greenwood variance: sum of d/(n(n - d)), e.g. A at 2: 1/12 + 1/6, B at 3: 1/6 + 1/2
+    for key, S, var in [(("A", 2), 1/2, 1/12 + 1/6), (("B", 3), 1/3, 1/6 + 1/2), (("A", 1), 3/4, 1/12)]:
+        lower, upper = greenwoodCI(S, var)
+        assert curves.loc[key, "ci_lower"] == pytest.approx(lower)
+        assert curves.loc[key, "ci_upper"] == pytest.approx(upper)
+
+    # Log-rank: pooled deaths at 1, 2, 3, 4 with 7, 6, 4, 2 at risk
+    #   E_A = 4/7 + 3/6*2 + 2/4 + 1/2 = 18/7, O_A = 3
+    #   V = 4*3*1*6/(49*6) + 3*3*2*4/(36*5) + 2*2*1*3/(16*3) + 1*1*1*1/(4*1) = 561/490
+    #   chi2 = (3/7)**2/(561/490) = 30/187
+    summary = km.summary.set_index("cohort")
+    assert summary["expected"].to_dict() == pytest.approx({"A": 18/7, "B": 17/7})
+    assert summary["median"].to_dict() == {"A": 2, "B": 3}
+
+    test = km.tests.iloc[0]
+    assert (test["column"], test["n_cohorts"], test["dof"]) == ("group", 2, 1)
+    assert test["test_statistic"] == pytest.approx(30/187)
+    assert test["p_value"] == pytest.approx(stats.chi2.sf(30/187, 1))
+    assert km.pairwise["test_statistic"].tolist() == pytest.approx([30/187])
+
+def test_split_columns_match_whole():
+    """ Columns with more cohorts than block_size get the same tests as in one block """
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame({"days_cust": rng.randint(1, 60, 2000), "churn": rng.uniform(size=2000) < 0.3,
+                       "many": rng.randint(0, 37, 2000), "few": rng.choice(["x", "y", "z", None], 2000)})
+    df.loc[df["many"] == 5, "churn"] = False
+    df.loc[:10, "many"] = np.NaN
+
+    whole = kaplanMeier(df, by=["many", "few"], pairwise=True, block_size=256)
+    split = kaplanMeier(df, by=["many", "few"], pairwise=True, block_size=8)
+
+    assert not split.tests[["n_cohorts", "test_statistic", "dof", "p_value"]].isna().any().any()
+    for name in ["curves", "summary", "tests", "pairwise"]:
+        pd.testing.assert_frame_equal(getattr(split, name), getattr(whole, name), check_exact=False, rtol=1e-9)
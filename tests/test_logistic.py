@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+# Custom Python Files
+import finalmodel as fm
+from dataprep.dataPrep import cleanData
+from dataprep.logistic import balancedWeights, fitLogistic, fitLogisticChunks, predictLogistic
+from dataprep.modelPrep import model_prep
+
+AS_OF = "2020-07-01"
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(2000, 4))*[1, 5, 20, 0.1]
+    y = (rng.uniform(size=2000) < 1/(1 + np.exp(-(0.3 + X @ [1, -0.2, 0.05, 3])))).astype(float)
+
+    return X, y
+
+def chunked(X, y, size=300):
+    return lambda: ((X[a:a + size], y[a:a + size]) for a in range(0, len(y), size))
+
+@pytest.mark.parametrize("start", [0.0, 5.0, -20.0])
+def test_far_off_start_converges(data, start):
+    X, y = data
+    w = balancedWeights(y)
+    cold, _, converged = fitLogistic(X, y, w)
+    assert converged
+
+    beta, _, converged = fitLogistic(X, y, w, coef_init=np.full(5, start))
+    assert converged
+    np.testing.assert_allclose(beta, cold, atol=1e-6)
+
+    beta, _, converged = fitLogisticChunks(chunked(X, y), coef_init=np.full(5, start))
+    assert converged
+    np.testing.assert_allclose(beta, cold, atol=1e-6)
+
+def test_loglik_increases(data):
+    X, y = data
+    history = []
+    fitLogisticChunks(chunked(X, y), coef_init=np.full(5, 5.0), callback=history.append)
+
+    loglik = [h["loglik"] for h in history]
+    assert all(b >= a - 1e-9*abs(a) for a, b in zip(loglik, loglik[1:]))
+
+def test_no_data():
+    with pytest.raises(ValueError, match="no data"):
+        fitLogisticChunks(lambda: iter([]))
+    with pytest.raises(ValueError, match="at least one row"):
+        fitLogistic(np.empty((0, 3)), np.empty(0))
+
+def cleanFit(path):
+    X, y, _ = model_prep(cleanData(path, boxcox=True, as_of=AS_OF), fm.spec, fm.ycol, standardize=False)
+    beta, _, _ = fitLogistic(X, y, balancedWeights(y))
+
+    return X, beta
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_retrain_matches_cold_fit(raw, tmp_path, streamed):
+    old, new = str(tmp_path / "old.csv"), str(tmp_path / "new.csv")
+    raw.iloc[:400].to_csv(old, index=False)
+    raw.to_csv(new, index=False)
+
+    _, previous = cleanFit(old)
+    lr, diagnostics = fm.retrain(previous, filepath=new, streamed=streamed, chunksize=128, check=True, as_of=AS_OF)
+    assert diagnostics["converged"] and diagnostics["within_tol"]
+
+    # Warm start against a cold fit from zero on the new data
+    X, cold = cleanFit(new)
+    np.testing.assert_allclose(lr.predict_proba(X)[:, 1], predictLogistic(X, cold), atol=1e-4)
@@ -0,0 +1,54 @@
+import copy
+import numpy as np
+import pandas as pd
+import pytest
+
+# Custom Python Files
+import finalmodel as fm
+from dataprep.dataPrep import cleanData
+from dataprep.featureSpec import FeatureSpec
+from dataprep.modelPrep import model_prep
+from dataprep.reference import columnwise_model_prep
+
+CASES = {
+    "numeric": dict(xcols=["MRR", "sessions", "callsPerQuarter"]),
+    "categorical": dict(xcols=["MRR", "industry", "callcycle", "usecompetitors", "origsource", "competingProducts"]),
+    "finalmodel": dict(xcols=fm.xcols, higherTerms=True, termDict=fm.termDict, interactionList=fm.interactionList),
+    "terms": dict(xcols=["industry", "admins", "employees"], higherTerms=True, termDict={"admins": 3, "employees": 2},
+                  interactionList=[["admins", "employees"], ["MRR", "sessions"]]),
+    "no_interactions": dict(xcols=["industry", "MRR"], interactionTerms=False, interactionList=[["MRR", "sessions"]]),
+}
+
+@pytest.fixture(scope="module")
+def clean(raw, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("export") / "export.csv")
+    raw.to_csv(path, index=False)
+
+    return cleanData(path, boxcox=True, as_of="2020-07-01")
+
+@pytest.mark.parametrize("standardize", [False, True])
+@pytest.mark.parametrize("case", list(CASES))
+def test_matches_columnwise(clean, case, standardize):
+    kwargs = copy.deepcopy(CASES[case])
+    df, xcols = clean.copy(), list(kwargs.pop("xcols"))
+
+    old = columnwise_model_prep(clean.copy(), list(xcols), "churn", standardize=standardize, **copy.deepcopy(kwargs))
+    new = model_prep(df, xcols, "churn", standardize=standardize, **kwargs)
+
+    # Column names & order, response, matrix (and the standardization vectors)
+    assert list(new[-1]) == list(old[-1])
+    np.testing.assert_array_equal(new[1], old[1])
+    for a, b in zip(new[:-1], old[:-1]):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-12)
+
+    # The caller's dataframe & column list are left alone
+    pd.testing.assert_frame_equal(df, clean)
+    assert xcols == CASES[case]["xcols"]
+
+def test_spec_matches_columnwise(clean):
+    old = columnwise_model_prep(clean.copy(), list(fm.xcols), "churn", standardize=False, higherTerms=True,
+                                termDict=fm.termDict, interactionList=copy.deepcopy(fm.interactionList))
+    X, y, names = model_prep(clean, fm.spec, "churn", standardize=False)
+
+    assert list(names) == list(old[2])
+    np.testing.assert_allclose(X, old[0], rtol=1e-12)
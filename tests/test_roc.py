@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+
+# Custom Python Files
+from dataprep.modelPrep import plotROCCurve, plotROCCurve_smote
+from dataprep.reference import loop_plotROCCurve
+
+class Axis:
+    """ Records the plot calls instead of drawing """
+    def __init__(self):
+        self.calls = []
+
+    def plot(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.RandomState(3)
+    X = rng.normal(size=(600, 5))
+    y = (X @ [1, -0.5, 0.2, 0, 0.8] + rng.normal(size=600) > 1.2).astype(int)
+
+    return X, y
+
+@pytest.mark.parametrize("smote", [False, True], ids=["plain", "smote"])
+@pytest.mark.parametrize("clf_class, kwargs", [(LogisticRegression, {"max_iter": 1000}),
+                                               (GaussianNB, {})])
+@pytest.mark.parametrize("random_state", [0, 1234])
+def test_matches_fold_loop(data, smote, clf_class, kwargs, random_state):
+    X, y = data
+    old_axis, new_axis = Axis(), Axis()
+
+    aucs = loop_plotROCCurve(clf_class, X, y, old_axis, "b", random_state, smote=smote, **kwargs)
+    plot = plotROCCurve_smote if smote else plotROCCurve
+    results = plot(clf_class, X, y, new_axis, "b", random_state, **kwargs)
+
+    # Same folds & fold AUCs, same plotted curve and label
+    np.testing.assert_allclose(results.foldAUC(clf_class.__name__), aucs, rtol=1e-12)
+    (old_args, old_kwargs), = old_axis.calls
+    (new_args, new_kwargs), = new_axis.calls
+    np.testing.assert_allclose(new_args[1], old_args[1], rtol=1e-12)
+    assert new_kwargs == old_kwargs
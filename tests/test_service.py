@@ -0,0 +1,95 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+
+# Custom Python Files
+from dataprep.service import LocalClient, MicroBatcher, ScoringService
+
+def records(raw, n=5):
+    return json.loads(raw.head(n).to_json(orient="records"))
+
+def test_score_matches_model(raw, model):
+    recs = records(raw)
+
+    async def main():
+        service = ScoringService(model)
+        p = await LocalClient(service).score(recs)
+        await service.stop()
+        return p
+
+    expected = model.predict_proba(raw.head(5))
+    np.testing.assert_allclose(asyncio.run(main()), expected)
+
+def test_new_event_loop_restarts_batcher(raw, model):
+    # Notebook style: one asyncio.run per request, the first loop is closed in between
+    service = ScoringService(model, max_wait=0.001)
+    client = LocalClient(service)
+    recs = records(raw)
+
+    first = asyncio.run(asyncio.wait_for(client.score(recs), 10))
+    second = asyncio.run(asyncio.wait_for(client.score(recs), 10))
+
+    assert first == second
+    assert service.stats.requests == 2
+
+def test_stop_fails_queued_requests(raw, model):
+    async def main():
+        batcher = MicroBatcher(model)
+        batcher.start()
+        batcher.task.cancel()
+
+        # Requests queued behind a batching task that is not consuming them
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(3)]
+        for future in futures:
+            batcher.queue.put_nowait((records(raw, 1), future))
+
+        await batcher.stop()
+        return futures
+
+    for future in asyncio.run(main()):
+        with pytest.raises(RuntimeError, match="stopped"):
+            future.result()
+
+async def request(port, head, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    response = await reader.read()
+    writer.close()
+
+    return status, json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+@pytest.mark.parametrize("header, status", [("", 411), ("Content-Length: abc\r\n", 400), ("Content-Length: -1\r\n", 400)])
+def test_bad_content_length(model, header, status):
+    async def main():
+        service = ScoringService(model)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.wait_for(request(port, "POST /score HTTP/1.1\r\n%s\r\n" % header), 10)
+        finally:
+            await service.stop()
+
+    code, payload = asyncio.run(main())
+    assert code == status
+    assert "Content-Length" in payload["error"]
+
+def test_http_score(raw, model):
+    body = json.dumps(records(raw)).encode()
+
+    async def main():
+        service = ScoringService(model)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        head = "POST /score HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(body)
+        try:
+            return await asyncio.wait_for(request(port, head, body), 10)
+        finally:
+            await service.stop()
+
+    code, payload = asyncio.run(main())
+    assert code == 200
+    np.testing.assert_allclose(payload["churn_probability"], model.predict_proba(raw.head(5)))
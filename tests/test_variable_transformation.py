@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# Custom Python Files
+from dataprep.dataPrep import filterAndRename, missingData_imputation, variable_transformation
+from dataprep.modelPrep import model_prep
+from dataprep.reference import rowwise_variable_transformation
+from dataprep.syntheticData import syntheticExport
+
+TODAY = pd.Timestamp("2020-07-01 09:30")
+
+@pytest.fixture(scope="module")
+def imputed():
+    """ Raw synthetic export after filterAndRename & missingData_imputation """
+    df = syntheticExport(3000, seed=1)
+    df = filterAndRename(df)
+
+    return missingData_imputation(df)
+
+def both(df, boxcox):
+    old = rowwise_variable_transformation(df.copy(), boxcox, TODAY)
+    new = variable_transformation(df.copy(), boxcox, as_of=TODAY)
+
+    return old, new
+
+@pytest.mark.parametrize("boxcox", [False, True])
+def test_same_output(imputed, boxcox):
+    old, new = both(imputed, boxcox)
+
+    # Values, dtypes and column order
+    pd.testing.assert_frame_equal(new, old)
+
+@pytest.mark.parametrize("boxcox", [False, True])
+def test_non_yes_no_values(imputed, boxcox):
+    df = imputed.copy()
+    df.loc[df.index[::7], "FF"] = "Unsure"
+    df.loc[df.index[::11], "strategic"] = "N/A"
+    df.loc[df.index[::13], "publiclytraded"] = "unknown"
+
+    old, new = both(df, boxcox)
+    pd.testing.assert_frame_equal(new, old)
+
+def test_empty_competitor_strings(imputed):
+    df = imputed.copy()
+    df.loc[df.index[::5], "usecompetitors"] = ""
+    df.loc[df.index[2::10], "usecompetitors"] = "Procore;"
+
+    old, new = both(df, False)
+    pd.testing.assert_frame_equal(new, old)
+    assert (new.loc[df.index[::5], "competingProducts"] == 1).all()
+
+def test_unknown_call_cycle_raises(imputed):
+    df = imputed.copy()
+    df.loc[df.index[0], "callcycle"] = "Weekly"
+
+    with pytest.raises(ValueError, match="Weekly"):
+        variable_transformation(df, False, as_of=TODAY)
+
+@pytest.mark.parametrize("boxcox", [False, True])
+def test_model_prep_all(imputed, boxcox):
+    old, new = both(imputed, boxcox)
+
+    X_old, y_old, mean_old, std_old, names_old = model_prep(old, "ALL", "churn")
+    X_new, y_new, mean_new, std_new, names_new = model_prep(new, "ALL", "churn")
+
+    assert list(names_new) == list(names_old)
+    np.testing.assert_array_equal(y_new, y_old)
+    np.testing.assert_array_equal(X_new, X_old)